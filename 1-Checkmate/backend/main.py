@@ -1,10 +1,12 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
 import json
+import uuid
 from google import genai
 from google.genai import types
 
@@ -19,8 +21,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+# A span per request, joined to the caller's trace (traceparent); spans go to
+# traces.jsonl by default and latency histograms to /metrics
+from common.tracing import TracingMiddleware, metrics_response
+app.add_middleware(TracingMiddleware, service="checkmate-backend")
+
 # Initialize Gemini Client
 # In a real scenario, API_KEY should be in env vars.
 # User will need to run with GOOGLE_API_KEY set or via gcloud auth.
@@ -56,34 +64,48 @@ class ParseResponse(BaseModel):
 def read_root():
     return {"message": "Checkmate API is running"}
 
-from tenacity import retry, stop_after_attempt, wait_exponential
-
-# ...
-
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def generate_with_retry(prompt):
-    return client.models.generate_content(
-        model="gemini-2.5-flash", 
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=0
-            ) 
-        )
+from common.gateway import ModelGateway
+from common.streaming import JsonArrayStream, ndjson_event, sse_event
+from common.extraction_cache import ExtractionCache
+
+# Every model call goes through the gateway (rate limits, retries, hedging, metrics)
+gateway = ModelGateway(client)
+
+PARSE_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    thinking_config=types.ThinkingConfig(
+        thinking_budget=0
     )
+)
 
-@app.post("/api/parse-tasks", response_model=ParseResponse)
-def parse_tasks(request: ParseRequest):
-    if not client:
-        raise HTTPException(status_code=500, detail="GenAI client not initialized")
-    
-    prompt = f"""
+# Bump when the extraction prompt changes so cached results are not reused
+PARSE_PROMPT_VERSION = "v1"
+
+extraction_cache = ExtractionCache(
+    PARSE_PROMPT_VERSION,
+    ttl=float(os.environ.get("TASK_CACHE_TTL_SECONDS", str(24 * 3600))),
+    max_items=int(os.environ.get("TASK_CACHE_MAX_ITEMS", "5000")),
+)
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    return {"task_extraction": extraction_cache.snapshot()}
+
+@app.get("/api/model/stats")
+def model_stats():
+    return gateway.snapshot()
+
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
+def build_parse_prompt(text: str) -> str:
+    return f"""
     You are a task extraction assistant. 
     Analyze the following text and extract actionable tasks.
     Return a list of tasks in JSON format.
     
-    Text: "{request.text}"
+    Text: "{text}"
     
     Output Schema within a JSON block:
     [
@@ -94,24 +116,44 @@ def parse_tasks(request: ParseRequest):
         }}
     ]
     """
+
+def task_from_item(item: dict) -> Task:
+    return Task(
+        id=str(uuid.uuid4()),
+        title=item.get("title", "Untitled Task"),
+        completed=False,
+        due_date=item.get("due_date"),
+        tags=item.get("tags", [])
+    )
+
+def fallback_task(text: str) -> Task:
+    return Task(
+        id=str(uuid.uuid4()),
+        title=text,
+        completed=False,
+        tags=["manual"]
+    )
+
+@app.post("/api/parse-tasks", response_model=ParseResponse)
+async def parse_tasks(request: ParseRequest):
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+    
+    cached = extraction_cache.get(request.text)
+    if cached is not None:
+        return ParseResponse(tasks=[task_from_item(item) for item in cached])
+
+    prompt = build_parse_prompt(request.text)
     
     try:
-        # Call with retry
-        response = generate_with_retry(prompt)
+        # Retried and hedged by the gateway
+        response = await gateway.generate(prompt, config=PARSE_CONFIG, operation="parse_tasks", hedge=True)
         
         parsed_data = json.loads(response.text)
         
         # Add IDs and defaults
-        tasks = []
-        import uuid
-        for item in parsed_data:
-            tasks.append(Task(
-                id=str(uuid.uuid4()),
-                title=item.get("title", "Untitled Task"),
-                completed=False,
-                due_date=item.get("due_date"),
-                tags=item.get("tags", [])
-            ))
+        tasks = [task_from_item(item) for item in parsed_data]
+        extraction_cache.set(request.text, parsed_data)
             
         return ParseResponse(tasks=tasks)
         
@@ -119,6 +161,59 @@ def parse_tasks(request: ParseRequest):
         print(f"Error parsing tasks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/parse-tasks/stream")
+async def parse_tasks_stream(request: ParseRequest, accept: Optional[str] = Header(None)):
+    """Streams each extracted task as soon as the model has finished it.
+
+    NDJSON (one task per line) by default; Server-Sent Events ("task"
+    events, then "done") when the client sends Accept: text/event-stream.
+    Failures are reported in-band as an "error" event / {"error": ...} line.
+    """
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+
+    use_sse = bool(accept and "text/event-stream" in accept)
+    encode = sse_event if use_sse else ndjson_event
+
+    async def events():
+        cached = extraction_cache.get(request.text)
+        if cached is not None:
+            for item in cached:
+                yield encode(task_from_item(item).dict())
+            if use_sse:
+                yield sse_event({"count": len(cached), "cached": True}, event="done")
+            return
+
+        parser = JsonArrayStream()
+        items = []
+        count = 0
+        try:
+            stream = gateway.generate_stream(
+                build_parse_prompt(request.text),
+                config=PARSE_CONFIG,
+                operation="parse_tasks_stream"
+            )
+            async for chunk in stream:
+                for item in parser.feed(chunk.text or ""):
+                    count += 1
+                    items.append(item)
+                    yield encode(task_from_item(item).dict())
+            if items:
+                extraction_cache.set(request.text, items)
+        except Exception as e:
+            print(f"Error streaming tasks: {e}")
+            yield encode({"error": str(e)}, event="error")
+            return
+        if count == 0:
+            # Nothing extracted: hand back the input as a single task
+            count = 1
+            yield encode(fallback_task(request.text).dict())
+        if use_sse:
+            yield sse_event({"count": count}, event="done")
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
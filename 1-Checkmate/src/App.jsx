@@ -10,7 +10,7 @@ import { AuthProvider, useAuth } from './context/AuthContext';
 import LoginPage from './pages/LoginPage';
 
 function CheckmateApp() {
-  const { user, logout } = useAuth();
+  const { user, logout, authHeaders } = useAuth();
   const navigate = useNavigate();
   const [tasks, setTasks] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
@@ -31,8 +31,13 @@ function CheckmateApp() {
   const fetchTasks = async () => {
     try {
       const response = await fetch(`${API_URL}/api/tasks`, {
-        headers: { 'X-User-Id': user.uid }
+        headers: authHeaders()
       });
+      if (response.status === 401) {
+        // Session expired or revoked: sign in again
+        logout();
+        return;
+      }
       if (response.ok) {
         const data = await response.json();
         setTasks(data);
@@ -45,10 +50,11 @@ function CheckmateApp() {
   const addTask = async (text) => {
     setIsLoading(true);
     try {
-      // Use Shared Backend for AI Parsing (Stateless)
-      const response = await fetch(`${API_URL}/api/parse-tasks`, {
+      // Use Shared Backend for AI Parsing. Signed-in users get the tasks
+      // persisted server-side in the same request (one batched write).
+      const response = await fetch(`${API_URL}/api/parse-tasks${user ? '?persist=true' : ''}`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({ text })
       });
 
@@ -57,22 +63,7 @@ function CheckmateApp() {
       const newTasks = data.tasks;
 
       if (user) {
-        // Persist to Backend
-        // Note: API might support bulk create? 
-        // For now, loop create or assume single for simplicity? 
-        // Our API endpoint creates one by one currently.
-        const createdTasks = await Promise.all(newTasks.map(async (t) => {
-          const res = await fetch(`${API_URL}/api/tasks`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-              'X-User-Id': user.uid
-            },
-            body: JSON.stringify(t)
-          });
-          return res.json();
-        }));
-        setTasks(prev => [...createdTasks, ...prev]);
+        setTasks(prev => [...newTasks, ...prev]);
       } else {
         // Guest: Local State
         const guestTasks = newTasks.map(t => ({ ...t, id: Date.now() + Math.random().toString() }));
@@ -103,7 +94,7 @@ function CheckmateApp() {
       setTasks(prev => prev.map(t => t.id === id ? updatedTask : t)); // Optimistic
       await fetch(`${API_URL}/api/tasks/${id}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json', 'X-User-Id': user.uid },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify(updatedTask)
       });
     } else {
@@ -116,7 +107,7 @@ function CheckmateApp() {
       setTasks(prev => prev.filter(t => t.id !== id)); // Optimistic
       await fetch(`${API_URL}/api/tasks/${id}`, {
         method: 'DELETE',
-        headers: { 'X-User-Id': user.uid }
+        headers: authHeaders()
       });
     } else {
       setTasks(prev => prev.filter(t => t.id !== id));
@@ -0,0 +1,206 @@
+"""Two-tier cache for scraped pages and Gemini link analyses.
+
+Entries live in an in-memory LRU and in a SQLite file shared by every
+worker on the box. Both tiers expire entries after a TTL; the disk tier is
+also trimmed by total size, oldest access first.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from fastapi.concurrency import run_in_threadpool
+
+CACHE_PATH = os.environ.get("STASH_CACHE_PATH", "stash_cache.db")
+
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+
+def normalize_cache_url(url: str) -> str:
+    """Canonical form of a URL for cache keys.
+
+    Lowercases scheme and host, drops default ports, fragments and tracking
+    parameters, and sorts the remaining query string.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path[:-1]
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TieredCache:
+    def __init__(self, name: str, ttl: float, max_items: int = 1024,
+                 max_disk_bytes: int = 64 * 1024 * 1024, path: Optional[str] = CACHE_PATH):
+        self.name = name
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # Guards the memory tier and counters only; held briefly on the event loop
+        self._lock = threading.Lock()
+        # Guards the SQLite connection, held in the threadpool during disk I/O
+        self._disk_lock = threading.Lock()
+        self._conn = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        self._fill_seconds = 0.0
+        self._fills = 0
+        self._writes_since_trim = 0
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS cache_{name} ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS cache_{name}_accessed ON cache_{name} (accessed_at)"
+                )
+            except Exception as e:
+                print(f"Warning: {name} disk cache disabled: {e}")
+                self._conn = None
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Memory hits are answered inline; the disk tier is read in the
+        threadpool so a slow disk never stalls the event loop."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if self._conn is not None:
+            value = await run_in_threadpool(self._disk_get, key, now)
+            if value is not None:
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.stats["sets"] += 1
+        if self._conn is not None:
+            await run_in_threadpool(self._disk_set, key, value, expires_at, now)
+
+    def _disk_get(self, key: str, now: float) -> Optional[Any]:
+        with self._disk_lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM cache_{self.name} WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or row[1] <= now:
+                return None
+            self._conn.execute(
+                f"UPDATE cache_{self.name} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        value = json.loads(row[0])
+        with self._lock:
+            self._remember(key, value, row[1])
+            self.stats["disk_hits"] += 1
+        return value
+
+    def _disk_set(self, key: str, value: Any, expires_at: float, now: float):
+        encoded = json.dumps(value)
+        evicted = 0
+        with self._disk_lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO cache_{self.name} (key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), expires_at, now),
+            )
+            # Summing sizes is a table scan, so only trim every few writes
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 32:
+                self._writes_since_trim = 0
+                evicted = self._trim_disk(now)
+        if evicted:
+            with self._lock:
+                self.stats["evictions"] += evicted
+
+    def record_fill(self, seconds: float):
+        """Records how long a miss took to compute, to estimate time saved by hits."""
+        with self._lock:
+            self._fill_seconds += seconds
+            self._fills += 1
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self, now) -> int:
+        """Runs under ``_disk_lock``; returns the number of rows evicted."""
+        table = f"cache_{self.name}"
+        self._conn.execute(f"DELETE FROM {table} WHERE expires_at <= ?", (now,))
+        total, count = self._conn.execute(f"SELECT COALESCE(SUM(size), 0), COUNT(*) FROM {table}").fetchone()
+        if total <= self.max_disk_bytes:
+            return 0
+        # Least recently used first, as many rows as the excess takes at the average row size
+        excess = total - self.max_disk_bytes
+        evict = -(-excess * count // total)
+        return self._conn.execute(
+            f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY accessed_at LIMIT ?)", (evict,)
+        ).rowcount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            lookups = hits + self.stats["misses"]
+            avg_fill = self._fill_seconds / self._fills if self._fills else 0.0
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "avg_miss_seconds": round(avg_fill, 3),
+                "estimated_saved_seconds": round(hits * avg_fill, 3),
+            }
+
+
+# normalized URL -> {"text", "hash"}
+page_cache = TieredCache(
+    "pages",
+    ttl=float(os.environ.get("STASH_PAGE_CACHE_TTL", str(6 * 3600))),
+    max_items=int(os.environ.get("STASH_PAGE_CACHE_ITEMS", "256")),
+    max_disk_bytes=int(os.environ.get("STASH_PAGE_CACHE_BYTES", str(256 * 1024 * 1024))),
+)
+
+# normalized URL + content hash -> Gemini {"title", "summary", "tags"}
+analysis_cache = TieredCache(
+    "analyses",
+    ttl=float(os.environ.get("STASH_ANALYSIS_CACHE_TTL", str(7 * 24 * 3600))),
+    max_items=int(os.environ.get("STASH_ANALYSIS_CACHE_ITEMS", "4096")),
+    max_disk_bytes=int(os.environ.get("STASH_ANALYSIS_CACHE_BYTES", str(64 * 1024 * 1024))),
+)
+
+
+def analysis_key(url: str, text_hash: str, prompt_version: str) -> str:
+    return f"{prompt_version}:{normalize_cache_url(url)}#{text_hash}"
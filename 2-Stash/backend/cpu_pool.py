@@ -0,0 +1,41 @@
+"""Process pool for CPU-bound work (bcrypt, large HTML parses).
+
+Anything that would hold the GIL for milliseconds runs here instead of on
+the event loop or the request threadpool. The pool is created on first use
+in each server process, so every gunicorn worker gets its own after the
+fork. Its size is CPU_POOL_WORKERS (the gunicorn config divides the cores
+between workers); BCRYPT_WORKERS is still honoured.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+POOL_WORKERS = int(os.environ.get(
+    "CPU_POOL_WORKERS", os.environ.get("BCRYPT_WORKERS", str(os.cpu_count() or 1))
+))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn rather than fork: the parent holds gRPC/Firestore threads
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_cpu_bound(fn: Callable[..., Any], *args) -> Any:
+    """Runs ``fn(*args)`` in the pool. ``fn`` and its arguments must be
+    picklable, i.e. module-level functions and plain data."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), fn, *args)
@@ -0,0 +1,52 @@
+"""Production serving for the Shared Backend: gunicorn with uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Each worker is a separate process that imports main.py itself (no
+preload), so the GenAI client, the Firestore/SQLite store, the scraper's
+connection pool and the CPU pool are created per worker after the fork;
+none of them are fork-safe once their threads are running. State the
+workers must agree on goes through shared_state and the on-disk caches.
+
+Environment:
+    WEB_CONCURRENCY  workers (default: one per core)
+    PORT             TCP port (default 8001)
+    STASH_UDS_PATH   also listen on this Unix socket
+"""
+import multiprocessing
+import os
+import secrets
+
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+
+bind = [f"0.0.0.0:{os.environ.get('PORT', '8001')}"]
+# gunicorn owns the socket here; the embedded per-process listener in
+# main.py would have every worker fight over the same path
+uds_path = os.environ.pop("STASH_UDS_PATH", None)
+if uds_path:
+    bind.append(f"unix:{uds_path}")
+
+keepalive = 5
+timeout = 120
+# Long enough for the write-behind buffer and job queue to drain
+graceful_timeout = 30
+
+# Workers share one box: split the per-process budgets between them unless
+# they were set explicitly. Per-worker in-memory caches are kept coherent
+# through stash_state.db.
+_defaults = {
+    "STASH_SHARED_STATE": "true",
+    "CPU_POOL_WORKERS": str(max(1, multiprocessing.cpu_count() // workers)),
+    "GENAI_RPM": str(max(1.0, float(os.environ.get("GENAI_RPM", "300")) / workers)),
+    "GENAI_MAX_CONCURRENCY": str(max(1, int(os.environ.get("GENAI_MAX_CONCURRENCY", "16")) // workers)),
+    "SCRAPE_MAX_INFLIGHT": str(max(4, int(os.environ.get("SCRAPE_MAX_INFLIGHT", "64")) // workers)),
+}
+for _name, _value in _defaults.items():
+    os.environ.setdefault(_name, _value)
+
+# Every worker must sign and verify sessions with the same key
+if not os.environ.get("SESSION_SECRET"):
+    print("Warning: SESSION_SECRET not set, generating one for this server run.")
+    os.environ["SESSION_SECRET"] = secrets.token_urlsafe(32)
@@ -0,0 +1,86 @@
+"""In-process background job queue.
+
+A bounded asyncio queue drained by a fixed pool of worker tasks. Submitting
+never blocks: when the queue is full the caller is told so and can shed the
+request, which is how backpressure reaches the client. Each job runs in a
+"job" span inside the trace of the request that submitted it.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from common import tracing
+
+
+class JobQueue:
+    def __init__(self, name: str, handler: Callable[..., Awaitable], workers: int = 4, maxsize: int = 500):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, *args) -> bool:
+        """Enqueues a job; returns False when the queue is full."""
+        if self._queue is None:
+            raise RuntimeError(f"{self.name} queue not started")
+        try:
+            self._queue.put_nowait((time.perf_counter(), tracing.current_span(), args))
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            enqueued_at, parent, args = await self._queue.get()
+            started = time.perf_counter()
+            self._wait_seconds += started - enqueued_at
+            self.in_flight += 1
+            try:
+                with tracing.span(f"job.{self.name}", stage="job", parent=parent,
+                                  wait_ms=round((started - enqueued_at) * 1000, 1)):
+                    await self.handler(*args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error in {self.name} job: {e}")
+            finally:
+                self.in_flight -= 1
+                self._run_seconds += time.perf_counter() - started
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        done = self.processed + self.failed
+        return {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.maxsize,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self._wait_seconds / done, 3) if done else 0.0,
+            "avg_run_seconds": round(self._run_seconds / done, 3) if done else 0.0,
+        }
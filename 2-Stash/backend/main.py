@@ -1,8 +1,10 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import os
 import json
 import datetime
@@ -20,8 +22,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Trace-Id"],
 )
 
+# A span per request, joined to the caller's trace (traceparent); spans go to
+# traces.jsonl by default and latency histograms to /metrics
+from common.tracing import TracingMiddleware, current_span, metrics_response
+app.add_middleware(TracingMiddleware, service="shared-backend")
+
 # Initialize Client
 client = None
 try:
@@ -29,80 +37,125 @@ try:
 except Exception as e:
     print(f"Warning: GenAI client init failed: {e}")
 
-# Initialize Firestore
-db = None
-try:
-    from google.cloud import firestore
-    # Use specific database
-    db = firestore.Client(database="vibe-coding-challenge")
-except Exception as e:
-    print(f"Warning: Firestore init failed: {e}")
+# Every model call goes through the gateway (rate limits, retries, hedging, metrics)
+from common.gateway import ModelGateway
+gateway = ModelGateway(client)
+
+# Initialize storage (Firestore, or the embedded SQLite store)
+from storage import create_store, EmailTaken, PreconditionFailed
+store = create_store()
+
+from passwords import hash_password_async, verify_password_async
+from cpu_pool import shutdown_pool
+from common.sessions import issue_token, verify_token, decode_token, revoke, bearer_token, TTLCache
 
-import bcrypt
+# Requests authenticate with Authorization: Bearer <token>. Set to true to
+# also trust a bare X-User-Id header (local development and load tests only).
+ALLOW_USER_ID_HEADER = os.environ.get("ALLOW_USER_ID_HEADER", "false").lower() == "true"
 
 class UserAuth(BaseModel):
     email: str
     password: str
 
-def verify_password(plain_password, hashed_password):
-    # Ensure bytes
-    if isinstance(hashed_password, str):
-        hashed_password = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
+@app.on_event("shutdown")
+def shutdown_cpu_pool():
+    shutdown_pool()
 
-def get_password_hash(password):
-    # Return string for storage
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# Optional Unix socket listener next to the TCP port, for co-located callers
+# such as the Assistant Backend (skips the loopback TCP stack)
+from common.listeners import start_listener, stop_listener
+STASH_UDS_PATH = os.environ.get("STASH_UDS_PATH")
+_socket_listener = None
+
+@app.on_event("startup")
+async def start_socket_listener():
+    global _socket_listener
+    if STASH_UDS_PATH:
+        try:
+            # The TCP server already ran this app's startup hooks
+            _socket_listener = await start_listener(app, uds=STASH_UDS_PATH, lifespan="off")
+        except RuntimeError as e:
+            print(f"Warning: Could not listen on {STASH_UDS_PATH}: {e}")
+
+@app.on_event("shutdown")
+async def stop_socket_listener():
+    if _socket_listener is not None:
+        await stop_listener(_socket_listener)
+        # A stale socket file would make callers pick a dead transport
+        if os.path.exists(STASH_UDS_PATH):
+            os.remove(STASH_UDS_PATH)
 
 @app.post("/api/auth/signup")
-def signup(user: UserAuth):
+async def signup(user: UserAuth):
     try:
-        if not db:
-            raise HTTPException(status_code=500, detail="Database not available")
-            
         # Check if user exists
-        users_ref = db.collection("users")
-        query = users_ref.where("email", "==", user.email).stream()
-        if any(query):
+        if await run_in_threadpool(store.get_user_by_email, user.email):
              raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create user
-        user_data = {
-            "email": user.email,
-            "hashed_password": get_password_hash(user.password),
-            "created_at": datetime.datetime.now().isoformat()
-        }
-        update_time, doc_ref = users_ref.add(user_data)
+        hashed_password = await hash_password_async(user.password)
+        created_at = datetime.datetime.now().isoformat()
+        try:
+            uid = await run_in_threadpool(store.create_user, user.email, hashed_password, created_at)
+        except EmailTaken:
+            raise HTTPException(status_code=400, detail="Email already registered")
         
-        return {"uid": doc_ref.id, "email": user.email}
+        return {"uid": uid, "email": user.email, "token": issue_token(uid, user.email)}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/auth/login")
-def login(user: UserAuth):
+async def login(user: UserAuth):
     try:
-        if not db:
-            raise HTTPException(status_code=500, detail="Database not available")
-            
-        users_ref = db.collection("users")
-        query = users_ref.where("email", "==", user.email).stream()
-        
-        user_doc = next(query, None)
-        if not user_doc:
+        entry = await run_in_threadpool(store.get_user_by_email, user.email)
+        if not entry:
             raise HTTPException(status_code=400, detail="Invalid email or password")
             
-        user_data = user_doc.to_dict()
-        if not verify_password(user.password, user_data["hashed_password"]):
+        if not await verify_password_async(user.password, entry["hashed_password"]):
             raise HTTPException(status_code=400, detail="Invalid email or password")
             
-        return {"uid": user_doc.id, "email": user.email}
+        return {"uid": entry["uid"], "email": user.email, "token": issue_token(entry["uid"], user.email)}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def load_user_meta(uid: str) -> dict:
+    meta = store.get_user_meta(uid)
+    if meta is None:
+        # Deleted user: no token issued for it is valid any more
+        return {"tokens_valid_after": float("inf")}
+    return meta
+
+async def current_user_id(
+    authorization: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id")
+) -> Optional[str]:
+    """Resolves the caller's uid from a session token, verified locally.
+    Falls back to X-User-Id while ALLOW_USER_ID_HEADER is on."""
+    token = bearer_token(authorization)
+    if token:
+        claims = await verify_token(token, lambda uid: run_in_threadpool(load_user_meta, uid))
+        if claims is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired session")
+        return claims["sub"]
+    if ALLOW_USER_ID_HEADER:
+        return x_user_id
+    return None
+
+@app.post("/api/auth/logout")
+async def logout(authorization: Optional[str] = Header(None)):
+    """Revokes every session of the caller (tokens issued before now)."""
+    claims = decode_token(bearer_token(authorization) or "")
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+    now = datetime.datetime.now().timestamp()
+    revoke(claims, now)
+    await run_in_threadpool(store.update_user, claims["sub"], {"tokens_valid_after": now})
+    return {"success": True}
+
 class CreateLinkRequest(BaseModel):
     url: str
 
@@ -113,94 +166,101 @@ class LinkResponse(BaseModel):
     summary: str
     tags: List[str]
     created_at: str
+    # Enrichment status: "pending" while a background job scrapes/summarizes, then "ready" or "failed"
+    status: str = "ready"
 
 @app.get("/")
 def read_root():
     return {"message": "Stash API is running"}
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import time
+import uuid
+from collections import Counter
+from scraper import scrape_page, normalize_url, close_client
+from jobs import JobQueue
+from writebehind import WriteBehindBuffer
+from common.streaming import JsonArrayStream, ndjson_event, sse_event
+from common.extraction_cache import ExtractionCache
+from pagination import MAX_PAGE_SIZE, parse_fields
+from importer import (
+    MAX_BOOKMARKS_BYTES, MAX_IMPORT_URLS, build_batch_prompt, dedupe_items, pack_batches,
+    parse_batch_response, parse_bookmarks_html
+)
+from cache import page_cache, analysis_cache, analysis_key, content_hash, normalize_cache_url
+from search import SearchIndex
+from refresh import RefreshScheduler
+from shared_state import create_shared_state
+
+# Write generations and import progress shared with the other gunicorn
+# workers (in-process only when running a single worker)
+shared_state = create_shared_state()
 
-def scrape_url(url: str):
-    try:
-        if not url.startswith('http'):
-            url = 'https://' + url
-            
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Remove scripts and styles
-        for script in soup(["script", "style"]):
-            script.extract()
-            
-        # Get text
-        text = soup.get_text()
-        
-        # Clean lines
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        # Truncate if too long (Gemini Flash has large context but good to be safe/efficient)
-        return text[:50000] # Limit to ~50k chars for safety
-    except Exception as e:
-        print(f"Scraping failed: {e}")
+# Per-user inverted index; every write path below keeps it current
+search_index = SearchIndex(store.list_items, shared=shared_state)
+
+# shared_state and search_index calls write the shared SQLite file and take
+# locks that threadpool searches hold, so async code runs them in the threadpool
+async def state_version(user_id: str, kind: str) -> Optional[int]:
+    if not shared_state.enabled:
         return None
+    return await run_in_threadpool(shared_state.version, user_id, kind)
+
+from vectors import VectorIndex, EMBEDDING_DIM
+vector_index = VectorIndex()
+
+@app.on_event("shutdown")
+async def shutdown_scraper():
+    await close_client()
 
-from fastapi import Header
+LINK_LIST_FIELDS = {"url", "title", "summary", "tags", "created_at", "status"}
+
+def paginated_response(items: List[dict], next_cursor: Optional[str], model, projected: bool):
+    """Page payload with the next cursor in X-Next-Cursor. Projected pages
+    skip the response model since they only carry the selected fields."""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    content = items if projected else [model(**item).dict() for item in items]
+    return JSONResponse(content=content, headers=headers)
 
 @app.get("/api/links", response_model=List[LinkResponse])
-def get_links(x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def get_links(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    x_user_id: Optional[str] = Depends(current_user_id)
+):
+    """Lists links newest first. Pass ?limit=N to page through them (the next
+    cursor comes back in X-Next-Cursor) and ?fields=title,tags,created_at to
+    fetch only those fields."""
+    if limit is not None or fields:
+        if not x_user_id:
+            return []
+        projection = parse_fields(fields, LINK_LIST_FIELDS)
+        items, next_cursor = await run_in_threadpool(
+            store.list_page, x_user_id, "links", limit or MAX_PAGE_SIZE, cursor, projection
+        )
+        return paginated_response(items, next_cursor, LinkResponse, projection is not None)
+
     try:
         if not x_user_id:
             return []
             
-        links = []
-        if db:
-            # Query subcollection: users/{uid}/links
-            docs = db.collection("users").document(x_user_id).collection("links").stream()
-            for doc in docs:
-                data = doc.to_dict()
-                data["id"] = doc.id
-                links.append(data)
-            
-            links.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+        links = await run_in_threadpool(store.list_items, x_user_id, "links")
+        links.sort(key=lambda x: x.get("created_at", ""), reverse=True)
             
         return [LinkResponse(**l) for l in links]
     except Exception as e:
         print(f"Error fetching links: {e}")
         return []
 
-@app.post("/api/links", response_model=LinkResponse)
-def create_link(request: CreateLinkRequest, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
-    if not client:
-        raise HTTPException(status_code=500, detail="GenAI client not initialized")
-    if not x_user_id:
-        raise HTTPException(status_code=400, detail="User ID required")
+LINK_PROMPT_VERSION = "v1"
+# Import batches only see the start of each page (BATCH_DOC_CHARS), so their
+# analyses are cached apart from full single-link ones
+BATCH_PROMPT_VERSION = f"{LINK_PROMPT_VERSION}-batch"
 
-    # 1. Scrape Content
-    # We need to capture the normalized URL if scrape_url modifies it
-    if not request.url.startswith('http'):
-        final_url = 'https://' + request.url
-    else:
-        final_url = request.url
-
-    scraped_content = scrape_url(final_url)
-    
-    if not scraped_content:
-        # Fallback if scraping fails: tell Gemini to try its best or just fail?
-        # User asked for scraping function, so we rely on it.
-        # But we can pass the URL as a fallback reference in the prompt.
-        scraped_content = f"Failed to scrape content from {request.url}. Please infer from URL if possible."
-
-    # 2. Analyze with Gemini (Text Mode)
-    prompt = f"""
-    Analyze the following text content from the URL: {request.url}
+def build_link_prompt(url: str, scraped_content: str) -> str:
+    return f"""
+    Analyze the following text content from the URL: {url}
     
     [BEGIN CONTENT]
     {scraped_content}
@@ -217,63 +277,259 @@ def create_link(request: CreateLinkRequest, x_user_id: Optional[str] = Header(No
         "tags": ["tag1", "tag2"]
     }}
     """
+
+def clean_json_text(text: str) -> str:
+    # Clean JSON text (remove markdown if present)
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+async def get_page(final_url: str) -> Optional[dict]:
+    """Returns {"text", "hash", "metadata", "etag", "last_modified"} for a
+    URL, scraping only on a cache miss."""
+    page_key = normalize_cache_url(final_url)
+    page = await page_cache.get(page_key)
+    if page is not None:
+        return page
+
+    started = time.perf_counter()
+    scraped = await scrape_page(final_url)
+    if not scraped:
+        return None
+    page = {**scraped, "hash": content_hash(scraped["text"])}
+    await page_cache.set(page_key, page)
+    page_cache.record_fill(time.perf_counter() - started)
+    return page
+
+def page_title(page: Optional[dict]) -> Optional[str]:
+    # Pages cached before metadata extraction have none
+    return ((page or {}).get("metadata") or {}).get("title")
+
+async def analyze_page(final_url: str, page: Optional[dict]) -> dict:
+    """Summarizes a scraped page (None if scraping failed), reusing cached analyses."""
+    cache_key = None
+    if page:
+        cache_key = analysis_key(final_url, page["hash"], LINK_PROMPT_VERSION)
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        scraped_content = page["text"]
+    else:
+        # Fallback if scraping fails: pass the URL as a reference in the prompt.
+        scraped_content = f"Failed to scrape content from {final_url}. Please infer from URL if possible."
+
+    # 2. Analyze with Gemini (Text Mode)
+    started = time.perf_counter()
+    # No Tools needed for Text Analysis
+    response = await gateway.generate(
+        build_link_prompt(final_url, scraped_content),
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json"
+        ),
+        operation="link_analysis"
+    )
+
+    if not response.text and (span := current_span()) is not None:
+        # Record why the model answered with no text (safety block, token limit...)
+        span.set("finish_reason", str(response.candidates[0].finish_reason) if response.candidates else "no_candidates")
+
+    text = clean_json_text(response.text or "")
     
     try:
-        # No Tools needed for Text Analysis
-        response = client.models.generate_content(
-            model="gemini-2.5-flash", 
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        print("Warning: Failed to parse JSON, using raw text as summary")
+        return {
+            "title": page_title(page) or "Analysis Result",
+            "summary": text,
+            "tags": ["review"]
+        }
+
+    if isinstance(data, dict) and not data.get("title") and page_title(page):
+        data["title"] = page_title(page)
+
+    if cache_key:
+        await analysis_cache.set(cache_key, data)
+        analysis_cache.record_fill(time.perf_counter() - started)
+    return data
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    return {
+        "pages": page_cache.snapshot(),
+        "analyses": analysis_cache.snapshot(),
+        "task_extraction": extraction_cache.snapshot()
+    }
+
+@app.get("/api/model/stats")
+def model_stats():
+    return gateway.snapshot()
+
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
+def link_fields(data: dict) -> dict:
+    return {
+        "title": data.get("title", "Untitled"),
+        "summary": data.get("summary", "No summary available"),
+        "tags": data.get("tags", []),
+    }
+
+def without_user_edits(link: dict, updates: dict) -> dict:
+    """Drops the fields the user set through PUT /api/links/{id} (listed in
+    the link's ``user_edited``): enrichment and refresh never replace them."""
+    edited = set(link.get("user_edited") or [])
+    return {k: v for k, v in updates.items() if k not in edited}
+
+# ==========================================
+# EMBEDDINGS
+# ==========================================
+
+EMBED_BATCH_SIZE = 100
+# Links embedded per request when backfilling links saved before embeddings existed
+EMBED_BACKFILL_LIMIT = int(os.environ.get("STASH_EMBED_BACKFILL_LIMIT", "1000"))
+_backfilled_users = set()
+_embedding_tasks = set()
+
+def link_embedding_text(link: dict) -> str:
+    tags = ", ".join(link.get("tags") or [])
+    return f"{link.get('title', '')}\n{link.get('summary', '')}\nTags: {tags}\n{link.get('url', '')}"
+
+async def embed_texts(texts: List[str], task_type: str) -> List[List[float]]:
+    config = types.EmbedContentConfig(task_type=task_type, output_dimensionality=EMBEDDING_DIM)
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors += await gateway.embed(texts[start:start + EMBED_BATCH_SIZE], config=config, operation="link_embedding")
+    return vectors
+
+async def embed_links(user_id: str, links: List[dict], raise_errors: bool = False):
+    """Embeds each link's title/summary/tags/url and stores the vectors."""
+    if not links:
+        return
+    try:
+        vectors = await embed_texts([link_embedding_text(link) for link in links], "RETRIEVAL_DOCUMENT")
+        await run_in_threadpool(
+            vector_index.upsert, user_id, {link["id"]: vector for link, vector in zip(links, vectors)}
         )
-        
-        # DEBUG: Print raw response
-        print(f"DEBUG: Response Text: {response.text}")
-        if not response.text:
-             print(f"DEBUG: Candidates: {response.candidates}")
-        
-        # Clean JSON text (remove markdown if present)
-        text = response.text
-        if text.startswith("```json"):
-            text = text[7:]
-        if text.startswith("```"):
-            text = text[3:]
-        if text.endswith("```"):
-            text = text[:-3]
-        text = text.strip()
-        
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
-            print("Warning: Failed to parse JSON, using raw text as summary")
-            data = {
-                "title": "Analysis Result",
-                "summary": text,
-                "tags": ["review"]
-            }
+    except Exception as e:
+        print(f"Error embedding links: {e}")
+        if raise_errors:
+            raise
+
+def schedule_embedding(user_id: str, links: List[dict]):
+    """Embeds off the request path; a failure only costs the link its related results."""
+    task = asyncio.create_task(embed_links(user_id, links))
+    _embedding_tasks.add(task)
+    task.add_done_callback(_embedding_tasks.discard)
+
+async def backfill_embeddings(user_id: str):
+    """Once per process and user, embeds links that have no vector yet."""
+    if user_id in _backfilled_users:
+        return
+    links = await run_in_threadpool(search_index.documents, user_id, "links")
+    embedded = await run_in_threadpool(vector_index.ids, user_id)
+    missing = [link for link_id, link in links.items() if link_id not in embedded]
+    await embed_links(user_id, missing[:EMBED_BACKFILL_LIMIT])
+    if len(missing) <= EMBED_BACKFILL_LIMIT:
+        _backfilled_users.add(user_id)
+
+# A pending link whose job was lost (the process stopped with it queued) is
+# picked up by the refresh scheduler once this long has passed
+ENRICH_RECOVERY_DELAY = float(os.environ.get("STASH_ENRICH_RECOVERY_SECONDS", "1800"))
+
+async def enrichment_updates(link_id: str, final_url: str) -> dict:
+    """The fields that complete a pending link, or mark it failed."""
+    try:
+        page = await get_page(final_url)
+        data = await analyze_page(final_url, page)
+        return {**link_fields(data), "status": "ready", "refresh": refresh_state(page, time.time())}
+    except Exception as e:
+        print(f"Error enriching link {link_id}: {e}")
+        # The next scheduled check re-summarizes it if the page can be scraped then
+        return {"status": "failed", "summary": f"Enrichment failed: {e}",
+                "refresh": refresh_state(None, time.time(), failures=1)}
+
+async def enrich_link(user_id: str, link_id: str, final_url: str):
+    """Background job: scrape and summarize a pending link, then patch its document."""
+    updates = await enrichment_updates(link_id, final_url)
+    # Read after the analysis, so edits made while it ran are kept
+    link = await run_in_threadpool(store.get_item, user_id, "links", link_id)
+    if link is None:
+        return
+    updates = without_user_edits(link, updates)
+    await run_in_threadpool(store.update_item, user_id, "links", link_id, updates)
+    await run_in_threadpool(search_index.update, user_id, "links", link_id, updates)
+    if updates["status"] == "ready":
+        await embed_links(user_id, [{"id": link_id, "url": final_url, **updates}])
+
+enrichment_queue = JobQueue(
+    "link-enrichment",
+    enrich_link,
+    workers=int(os.environ.get("STASH_ENRICH_WORKERS", "8")),
+    maxsize=int(os.environ.get("STASH_ENRICH_QUEUE_SIZE", "500")),
+)
+
+@app.on_event("startup")
+async def start_enrichment_queue():
+    enrichment_queue.start()
+
+@app.on_event("shutdown")
+async def stop_enrichment_queue():
+    await enrichment_queue.stop()
+
+@app.get("/api/jobs/stats")
+def job_stats():
+    return enrichment_queue.stats()
+
+@app.post("/api/links", response_model=LinkResponse)
+async def create_link(request: CreateLinkRequest, background: bool = False, x_user_id: Optional[str] = Depends(current_user_id)):
+    """Saves a link. With ?background=true the link is stored as "pending" and
+    a 202 is returned immediately; a worker fills in title/summary/tags later."""
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+
+    # We need to capture the normalized URL if scrape_url modifies it
+    final_url = normalize_url(request.url)
+
+    if background:
+        if enrichment_queue.depth >= enrichment_queue.maxsize:
+            raise HTTPException(status_code=503, detail="Enrichment queue full, retry later", headers={"Retry-After": "5"})
+        return await create_pending_link(final_url, x_user_id)
+
+    return await save_link(x_user_id, final_url)
+
+async def save_link(user_id: str, url: str) -> LinkResponse:
+    """Scrapes, summarizes and stores a link. Also called in-process by the
+    Assistant's save_link tool when it hosts this app."""
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+    final_url = normalize_url(url)
+    try:
+        page = await get_page(final_url)
+        data = await analyze_page(final_url, page)
         
         # Prepare Data
         timestamp = datetime.datetime.now().isoformat()
         link_data = {
             "url": final_url,
-            "title": data.get("title", "Untitled"),
-            "summary": data.get("summary", "No summary available"),
-            "tags": data.get("tags", []),
+            **link_fields(data),
             "created_at": timestamp,
-            "user_id": x_user_id
+            "user_id": user_id,
+            "status": "ready",
+            "refresh": refresh_state(page, time.time())
         }
         
-        # Save to Firestore
-        link_id = "temp_id"
-        if db:
-            # Save to users/{uid}/links
-            update_time, link_ref = db.collection("users").document(x_user_id).collection("links").add(link_data)
-            link_id = link_ref.id
-            link_data["id"] = link_id
-        else:
-            link_data["id"] = "memory_" + str(timestamp)
-            print("Warning: Firestore not active, data not saved persistently.")
+        # Save to users/{uid}/links
+        link_data["id"] = await run_in_threadpool(store.add_item, user_id, "links", link_data)
+        await run_in_threadpool(search_index.add, user_id, "links", link_data)
+        schedule_embedding(user_id, [link_data])
 
         return LinkResponse(**link_data)
         
@@ -281,39 +537,476 @@ def create_link(request: CreateLinkRequest, x_user_id: Optional[str] = Header(No
         print(f"Error processing link: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def create_pending_link(final_url: str, x_user_id: str):
+    timestamp = datetime.datetime.now().isoformat()
+    link_data = {
+        "url": final_url,
+        "title": final_url,
+        "summary": "",
+        "tags": [],
+        "created_at": timestamp,
+        "user_id": x_user_id,
+        "status": "pending",
+        # Jobs only live in memory; if this one is lost the refresh scheduler enriches the link
+        "refresh": {"next_at": time.time() + ENRICH_RECOVERY_DELAY}
+    }
+    link_data["id"] = await run_in_threadpool(store.add_item, x_user_id, "links", link_data)
+    await run_in_threadpool(search_index.add, x_user_id, "links", link_data)
+
+    if not enrichment_queue.submit(x_user_id, link_data["id"], final_url):
+        # Queue filled up while we were writing. The client is told to retry,
+        # so drop the link rather than leave a duplicate behind.
+        await run_in_threadpool(store.delete_item, x_user_id, "links", link_data["id"])
+        await run_in_threadpool(search_index.remove, x_user_id, "links", link_data["id"])
+        raise HTTPException(status_code=503, detail="Enrichment queue full, retry later", headers={"Retry-After": "5"})
+
+    return JSONResponse(status_code=202, content=LinkResponse(**link_data).dict())
+
+# ==========================================
+# BULK IMPORT
+# ==========================================
+
+class ImportLinksRequest(BaseModel):
+    urls: List[str]
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("STASH_IMPORT_CHUNK_SIZE", "100"))
+IMPORT_MODEL_CONCURRENCY = int(os.environ.get("STASH_IMPORT_MODEL_CONCURRENCY", "8"))
+MAX_TRACKED_IMPORTS = 100
+
+# import_id -> progress dict; only the most recent imports are kept
+imports = {}
+_import_tasks = set()
+
+async def analyze_batch(batch: List[dict], model_slots: asyncio.Semaphore) -> List[Optional[dict]]:
+    """One Gemini call for several documents; results are cached per document."""
+    async with model_slots:
+        response = await gateway.generate(
+            build_batch_prompt(batch),
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json"
+            ),
+            operation="link_batch_analysis"
+        )
+    try:
+        results = parse_batch_response(clean_json_text(response.text or ""), len(batch))
+    except json.JSONDecodeError:
+        print("Warning: Failed to parse batch JSON, falling back to single analysis")
+        results = [None] * len(batch)
+    for doc, data in zip(batch, results):
+        if data and doc["cache_key"]:
+            await analysis_cache.set(doc["cache_key"], data)
+    return results
+
+async def analyze_import_chunk(items: List[dict]) -> Tuple[List[dict], List[Optional[dict]]]:
+    """Analyses for ``items`` and the pages they were made from."""
+    # Fetch concurrently; the scraper enforces the global and per-host limits
+    pages = await asyncio.gather(*(get_page(item["url"]) for item in items))
+
+    results = [None] * len(items)
+    docs = []
+    for i, (item, page) in enumerate(zip(items, pages)):
+        if page:
+            # A full analysis from an earlier single save is better still
+            results[i] = await analysis_cache.get(analysis_key(item["url"], page["hash"], LINK_PROMPT_VERSION))
+            cache_key = analysis_key(item["url"], page["hash"], BATCH_PROMPT_VERSION)
+            if results[i] is None:
+                results[i] = await analysis_cache.get(cache_key)
+            if results[i] is None:
+                docs.append({"position": i, "url": item["url"], "text": page["text"], "cache_key": cache_key})
+        else:
+            docs.append({
+                "position": i,
+                "url": item["url"],
+                "text": f"Failed to scrape content from {item['url']}. Please infer from URL if possible.",
+                "cache_key": None
+            })
+
+    model_slots = asyncio.Semaphore(IMPORT_MODEL_CONCURRENCY)
+    batches = pack_batches(docs)
+    batch_results = await asyncio.gather(
+        *(analyze_batch(batch, model_slots) for batch in batches), return_exceptions=True
+    )
+    for batch, batch_result in zip(batches, batch_results):
+        if isinstance(batch_result, Exception):
+            print(f"Error analyzing import batch: {batch_result}")
+            continue
+        for doc, data in zip(batch, batch_result):
+            results[doc["position"]] = data
+
+    # Documents the batch call dropped get a single-document call each,
+    # concurrently within the same model budget
+    async def analyze_single(i: int) -> dict:
+        try:
+            async with model_slots:
+                return await analyze_page(items[i]["url"], pages[i])
+        except Exception as e:
+            print(f"Error analyzing {items[i]['url']}: {e}")
+            return {"title": items[i].get("title") or page_title(pages[i]) or items[i]["url"], "tags": ["review"]}
+
+    missing = [i for i, data in enumerate(results) if data is None]
+    for i, data in zip(missing, await asyncio.gather(*(analyze_single(i) for i in missing))):
+        results[i] = data
+
+    for i, item in enumerate(items):
+        if item.get("title") and "title" not in results[i]:
+            # Copy so a cached analysis is never mutated
+            results[i] = {**results[i], "title": item["title"]}
+    return results, pages
+
+async def run_import(import_id: str, user_id: str, items: List[dict]):
+    state = imports[import_id]
+    try:
+        for start in range(0, len(items), IMPORT_CHUNK_SIZE):
+            chunk = items[start:start + IMPORT_CHUNK_SIZE]
+            results, pages = await analyze_import_chunk(chunk)
+            timestamp = datetime.datetime.now().isoformat()
+            now = time.time()
+            links = [{
+                "url": item["url"],
+                **link_fields(data),
+                "created_at": timestamp,
+                "user_id": user_id,
+                "status": "ready",
+                "refresh": refresh_state(page, now)
+            } for item, data, page in zip(chunk, results, pages)]
+            # Batched writes (Firestore commits up to 500 per batch)
+            ids = await run_in_threadpool(store.add_items, user_id, "links", links)
+            saved = [{**link, "id": link_id} for link, link_id in zip(links, ids)]
+            for link in saved:
+                await run_in_threadpool(search_index.add, user_id, "links", link)
+            await embed_links(user_id, saved)
+            state["done"] += len(chunk)
+            await run_in_threadpool(shared_state.put, "imports", import_id, state)
+        state["status"] = "completed"
+    except Exception as e:
+        print(f"Error importing links: {e}")
+        state["status"] = "failed"
+        state["error"] = str(e)
+    state["finished_at"] = datetime.datetime.now().isoformat()
+    await run_in_threadpool(shared_state.put, "imports", import_id, state)
+
+async def start_import(user_id: str, items: List[dict]):
+    items = dedupe_items(items)
+    if not items:
+        raise HTTPException(status_code=400, detail="No URLs to import")
+    if len(items) > MAX_IMPORT_URLS:
+        raise HTTPException(status_code=400, detail=f"Too many URLs (max {MAX_IMPORT_URLS})")
+
+    import_id = str(uuid.uuid4())
+    imports[import_id] = {
+        "id": import_id,
+        "user_id": user_id,
+        "status": "running",
+        "total": len(items),
+        "done": 0,
+        "started_at": datetime.datetime.now().isoformat()
+    }
+    while len(imports) > MAX_TRACKED_IMPORTS:
+        imports.pop(next(iter(imports)))
+    # So the other workers can answer progress polls
+    await run_in_threadpool(shared_state.put, "imports", import_id, imports[import_id])
+
+    task = asyncio.create_task(run_import(import_id, user_id, items))
+    _import_tasks.add(task)
+    task.add_done_callback(_import_tasks.discard)
+    return JSONResponse(status_code=202, content=imports[import_id])
+
+@app.post("/api/links/import")
+async def import_links(request: ImportLinksRequest, x_user_id: Optional[str] = Depends(current_user_id)):
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    items = [{"url": normalize_url(url.strip())} for url in request.urls if url.strip()]
+    return await start_import(x_user_id, items)
+
+@app.post("/api/links/import/bookmarks")
+async def import_bookmarks(file: UploadFile = File(...), x_user_id: Optional[str] = Depends(current_user_id)):
+    """Imports a Netscape bookmarks HTML export (what browsers produce)."""
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    body = await file.read(MAX_BOOKMARKS_BYTES + 1)
+    if len(body) > MAX_BOOKMARKS_BYTES:
+        raise HTTPException(status_code=413, detail=f"Bookmarks file too large (max {MAX_BOOKMARKS_BYTES} bytes)")
+    html = body.decode("utf-8", errors="replace")
+    return await start_import(x_user_id, parse_bookmarks_html(html))
+
+@app.get("/api/links/import/{import_id}")
+def get_import(import_id: str, x_user_id: Optional[str] = Depends(current_user_id)):
+    state = imports.get(import_id) or shared_state.get("imports", import_id)
+    if not state or state["user_id"] != x_user_id:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return state
+
 @app.delete("/api/links/{link_id}")
-def delete_link(link_id: str, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def delete_link(link_id: str, x_user_id: Optional[str] = Depends(current_user_id)):
     try:
-        if db:
-            ref = db.collection("users").document(x_user_id).collection("links").document(link_id)
-            ref.delete()
+        await run_in_threadpool(store.delete_item, x_user_id, "links", link_id)
+        await run_in_threadpool(search_index.remove, x_user_id, "links", link_id)
+        await run_in_threadpool(vector_index.remove, x_user_id, link_id)
         return {"success": True, "id": link_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/links/{link_id}/related")
+async def related_links(link_id: str, limit: int = 10, x_user_id: Optional[str] = Depends(current_user_id)):
+    """The caller's links closest to this one by embedding similarity."""
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        if await run_in_threadpool(vector_index.get, x_user_id, link_id) is None:
+            link = await run_in_threadpool(store.get_item, x_user_id, "links", link_id)
+            if link is None:
+                raise HTTPException(status_code=404, detail="Link not found")
+            await embed_links(x_user_id, [{**link, "id": link_id}], raise_errors=True)
+        await backfill_embeddings(x_user_id)
+
+        matches = await run_in_threadpool(vector_index.related, x_user_id, link_id, limit)
+        links = await run_in_threadpool(search_index.documents, x_user_id, "links", [m[0] for m in matches])
+        return [{**links[match_id], "score": round(score, 4)} for match_id, score in matches if match_id in links]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error finding related links: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 class UpdateLinkRequest(BaseModel):
     title: Optional[str] = None
     summary: Optional[str] = None
     tags: Optional[List[str]] = None
 
 @app.put("/api/links/{link_id}")
-def update_link(link_id: str, request: UpdateLinkRequest, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def update_link(link_id: str, request: UpdateLinkRequest, x_user_id: Optional[str] = Depends(current_user_id)):
     try:
-        if db:
-            ref = db.collection("users").document(x_user_id).collection("links").document(link_id)
-            doc = ref.get()
-            if not doc.exists:
-                raise HTTPException(status_code=404, detail="Link not found")
-            
-            updates = {k: v for k, v in request.dict().items() if v is not None}
-            if updates:
-                ref.update(updates)
-                
-            return {**doc.to_dict(), **updates, "id": link_id}
-            
-        return {"id": link_id, "message": "In-memory update simulated"}
+        existing = await run_in_threadpool(store.get_item, x_user_id, "links", link_id)
+        if existing is None:
+            raise HTTPException(status_code=404, detail="Link not found")
+        
+        updates = {k: v for k, v in request.dict().items() if v is not None}
+        if updates:
+            # Later refreshes keep what the user wrote
+            edited = sorted(set(existing.get("user_edited") or []) | set(updates))
+            await run_in_threadpool(store.update_item, x_user_id, "links", link_id, {**updates, "user_edited": edited})
+            await run_in_threadpool(search_index.update, x_user_id, "links", link_id, updates)
+            # Title/summary/tags feed the embedding, so refresh it
+            schedule_embedding(x_user_id, [{**existing, **updates, "id": link_id}])
+            updates["user_edited"] = edited
+
+        return {**existing, **updates, "id": link_id}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==========================================
+# FRESHNESS REFRESH
+# ==========================================
+
+# Saved links are revalidated with conditional GETs (ETag/Last-Modified) on
+# a schedule; Gemini only runs again when the extracted text changed. With
+# refresh disabled no further checks are scheduled, but the scheduler still
+# runs to finish pending links whose enrichment job was lost.
+REFRESH_ENABLED = os.environ.get("STASH_REFRESH_ENABLED", "true").lower() == "true"
+REFRESH_INTERVAL = float(os.environ.get("STASH_REFRESH_INTERVAL_HOURS", str(7 * 24))) * 3600
+# Failed checks back off exponentially, up to this many intervals
+REFRESH_MAX_BACKOFF = 8
+
+def refresh_state(page: Optional[dict], now: float, failures: int = 0) -> dict:
+    """A link's ``refresh`` field: the validators and content hash of its last
+    successful fetch (``page``, None if it failed) and when to check again."""
+    page = page or {}
+    return {
+        "etag": page.get("etag"),
+        "last_modified": page.get("last_modified"),
+        "hash": page.get("hash"),
+        "checked_at": now,
+        "next_at": now + REFRESH_INTERVAL * min(2 ** failures, REFRESH_MAX_BACKOFF) if REFRESH_ENABLED else None,
+        "failures": failures,
+    }
+
+async def revalidate_link(link: dict) -> str:
+    """Re-fetches a saved link conditionally and re-summarizes it only if its
+    text changed, leaving the fields the user edited alone. Returns the
+    outcome: "not_modified", "unchanged", "updated", "failed", "enriched"
+    or "deleted"."""
+    user_id, link_id, url = link["user_id"], link["id"], link["url"]
+    if link.get("status") == "pending":
+        # Its enrichment job was lost: do that job instead
+        updates = without_user_edits(link, await enrichment_updates(link_id, url))
+        try:
+            await run_in_threadpool(store.update_item, user_id, "links", link_id, updates)
+        except KeyError:
+            return "deleted"
+        await run_in_threadpool(search_index.update, user_id, "links", link_id, updates)
+        if updates["status"] != "ready":
+            return "failed"
+        schedule_embedding(user_id, [{**link, **updates}])
+        return "enriched"
+
+    state = link.get("refresh") or {}
+    now = time.time()
+    scraped = await scrape_page(url, etag=state.get("etag"), last_modified=state.get("last_modified"))
+    updates = {}
+    if scraped is None:
+        outcome = "failed"
+        refresh = refresh_state(state, now, failures=state.get("failures", 0) + 1)
+        if "hash" not in state:
+            # Still no baseline
+            del refresh["hash"]
+    elif scraped.get("not_modified"):
+        outcome = "not_modified"
+        refresh = refresh_state(state, now)
+    else:
+        page = {**scraped, "hash": content_hash(scraped["text"])}
+        await page_cache.set(normalize_cache_url(url), page)
+        refresh = refresh_state(page, now)
+        # Links saved before refresh existed have no hash yet: this fetch is
+        # their baseline. A None hash means the page could not be scraped then.
+        if "hash" not in state or page["hash"] == state["hash"]:
+            outcome = "unchanged"
+        else:
+            outcome = "updated"
+            updates = without_user_edits(link, {**link_fields(await analyze_page(url, page)), "status": "ready"})
+    try:
+        await run_in_threadpool(store.update_item, user_id, "links", link_id, {**updates, "refresh": refresh})
+    except KeyError:
+        return "deleted"
+    if updates:
+        await run_in_threadpool(search_index.update, user_id, "links", link_id, updates)
+        schedule_embedding(user_id, [{**link, **updates}])
+    return outcome
+
+def claim_links(links: List[dict], until: float):
+    store.batch_update([
+        ((link["user_id"], "links", link["id"]), {"refresh": {**(link.get("refresh") or {}), "next_at": until}})
+        for link in links
+    ])
+
+refresh_scheduler = RefreshScheduler(
+    store.list_due_links,
+    claim_links,
+    revalidate_link,
+    rate=float(os.environ.get("STASH_REFRESH_RATE", "1")),
+    per_host_interval=float(os.environ.get("STASH_REFRESH_HOST_INTERVAL_SECONDS", "10")),
+    concurrency=int(os.environ.get("STASH_REFRESH_CONCURRENCY", "4")),
+    batch_size=int(os.environ.get("STASH_REFRESH_BATCH_SIZE", "100")),
+    poll_interval=float(os.environ.get("STASH_REFRESH_POLL_SECONDS", "60")),
+    # One scheduler per box even with several workers
+    lock_path=os.environ.get("STASH_REFRESH_LOCK", "stash_refresh.lock"),
+)
+
+@app.on_event("startup")
+async def start_refresh_scheduler():
+    # Started even with refresh disabled: it also recovers lost enrichment jobs
+    refresh_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_refresh_scheduler():
+    await refresh_scheduler.stop()
+
+@app.get("/api/refresh/stats")
+def refresh_stats():
+    return refresh_scheduler.stats()
+
+@app.post("/api/links/refresh")
+async def schedule_refresh(x_user_id: Optional[str] = Depends(current_user_id)):
+    """Schedules a check now for each of the caller's links that has never
+    been checked (links saved before scheduled refresh existed)."""
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    links = await run_in_threadpool(store.list_items, x_user_id, "links")
+    now = time.time()
+    ops = [((x_user_id, "links", link["id"]), {"refresh": {"next_at": now}}) for link in links if not link.get("refresh")]
+    await run_in_threadpool(store.batch_update, ops)
+    return {"scheduled": len(ops)}
+
+@app.post("/api/links/{link_id}/refresh")
+async def refresh_link(link_id: str, x_user_id: Optional[str] = Depends(current_user_id)):
+    """Checks one link now instead of waiting for its turn."""
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    link = await run_in_threadpool(store.get_item, x_user_id, "links", link_id)
+    if link is None:
+        raise HTTPException(status_code=404, detail="Link not found")
+    try:
+        outcome = await revalidate_link({**link, "user_id": x_user_id})
     except Exception as e:
+        print(f"Error refreshing link {link_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    if outcome == "deleted":
+        raise HTTPException(status_code=404, detail="Link not found")
+    link = await run_in_threadpool(store.get_item, x_user_id, "links", link_id)
+    return {"outcome": outcome, "link": LinkResponse(**link).dict()}
+
+# ==========================================
+# SEARCH
+# ==========================================
+
+@app.get("/api/search")
+async def search(
+    q: str = "",
+    tags: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 20,
+    mode: str = "keyword",
+    x_user_id: Optional[str] = Depends(current_user_id)
+):
+    """Ranked (BM25) search over the caller's links and tasks.
+
+    ``tags`` is a comma-separated filter (all must match), ``kind`` limits
+    results to "links" or "tasks". Tag facet counts cover every match.
+    With ``mode=semantic`` links are ranked by embedding similarity to ``q``.
+    """
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    if kind not in (None, "links", "tasks"):
+        raise HTTPException(status_code=400, detail="kind must be 'links' or 'tasks'")
+    if mode not in ("keyword", "semantic"):
+        raise HTTPException(status_code=400, detail="mode must be 'keyword' or 'semantic'")
+    tag_filter = [tag for tag in (tags or "").split(",") if tag.strip()]
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        if mode == "semantic":
+            return await semantic_search(x_user_id, q, tag_filter, limit)
+        return await run_in_threadpool(search_index.search, x_user_id, q, kind, tag_filter, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def semantic_search(user_id: str, query: str, tags: List[str], limit: int) -> dict:
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="q is required for semantic search")
+    started = time.perf_counter()
+    await backfill_embeddings(user_id)
+    vector = (await embed_texts([query], "RETRIEVAL_QUERY"))[0]
+    # Over-fetch when filtering by tag so the page can still fill up
+    matches = await run_in_threadpool(vector_index.search, user_id, vector, limit * 5 if tags else limit)
+    links = await run_in_threadpool(search_index.documents, user_id, "links", [m[0] for m in matches])
+    wanted = {tag.strip().lower() for tag in tags}
+    results = []
+    for link_id, score in matches:
+        link = links.get(link_id)
+        if link is None or not wanted <= {str(t).strip().lower() for t in link.get("tags") or []}:
+            continue
+        results.append({**link, "kind": "links", "score": round(score, 4)})
+        if len(results) == limit:
+            break
+    facets = Counter(str(tag).strip().lower() for link in results for tag in link.get("tags") or [])
+    return {
+        "total": len(results),
+        "results": results,
+        "facets": {"tags": [{"tag": tag, "count": n} for tag, n in facets.most_common()]},
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+@app.get("/api/search/stats")
+def search_stats():
+    return search_index.stats()
 
 # ==========================================
 # CHECKMATE (TASK) ENDPOINTS
@@ -325,6 +1018,8 @@ class Task(BaseModel):
     completed: bool = False
     due_date: Optional[str] = None
     tags: List[str] = []
+    # Version of the stored task; also sent as its ETag
+    updated_at: Optional[str] = None
 
 class UpdateTaskRequest(BaseModel):
     title: Optional[str] = None
@@ -332,20 +1027,81 @@ class UpdateTaskRequest(BaseModel):
     due_date: Optional[str] = None
     tags: Optional[List[str]] = None
 
+TASK_LIST_FIELDS = {"title", "completed", "due_date", "tags", "created_at", "updated_at"}
+
+# Recently seen task documents ("{uid}/{task_id}" -> (generation, dict)), so
+# a toggle can answer with the merged task without reading it back first.
+# An entry is only used while the user's task generation is unchanged, i.e.
+# no other worker has written their tasks since.
+task_cache = TTLCache(ttl=float(os.environ.get("TASK_CACHE_TTL", "120")), max_items=20000)
+
+# Coalesces task updates that land within the window into batched writes
+task_writes = WriteBehindBuffer(
+    store.batch_update,
+    window=float(os.environ.get("TASK_WRITE_WINDOW_MS", "25")) / 1000,
+)
+
+def cache_tasks(user_id: str, tasks: List[dict], version: Optional[int]):
+    for task in tasks:
+        task_cache.set(f"{user_id}/{task['id']}", (version, task))
+
+async def cached_task(user_id: str, task_id: str) -> Optional[tuple]:
+    """(generation, task) if a current copy is cached."""
+    entry = task_cache.get(f"{user_id}/{task_id}")
+    if entry is not None and shared_state.enabled and entry[0] != await state_version(user_id, "tasks"):
+        return None
+    return entry
+
+def task_response(task: dict) -> JSONResponse:
+    """The task with its version as ETag, for If-Match on the next update."""
+    headers = {"ETag": f'"{task["updated_at"]}"'} if task.get("updated_at") else None
+    return JSONResponse(content=Task(**task).dict(), headers=headers)
+
+def if_match_versions(if_match: Optional[str]) -> Optional[List[str]]:
+    """Versions listed in an If-Match header; None when absent or "*"."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    # Weak tags never match (If-Match uses strong comparison)
+    return [tag.strip()[1:-1] for tag in if_match.split(",") if tag.strip().startswith('"')]
+
+@app.on_event("shutdown")
+async def flush_task_writes():
+    await task_writes.close()
+
+@app.get("/api/writes/stats")
+def write_stats():
+    return task_writes.stats()
+
 @app.get("/api/tasks", response_model=List[Task])
-def get_tasks(x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def get_tasks(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    x_user_id: Optional[str] = Depends(current_user_id)
+):
+    """Lists tasks. With ?limit=N (and/or ?fields=...) tasks are paged newest
+    first with the next cursor in X-Next-Cursor."""
+    if limit is not None or fields:
+        if not x_user_id:
+            return []
+        projection = parse_fields(fields, TASK_LIST_FIELDS)
+        # Generation first: tasks read after it are at least that new
+        version = await state_version(x_user_id, "tasks")
+        items, next_cursor = await run_in_threadpool(
+            store.list_page, x_user_id, "tasks", limit or MAX_PAGE_SIZE, cursor, projection
+        )
+        if projection is None:
+            cache_tasks(x_user_id, items, version)
+        return paginated_response(items, next_cursor, Task, projection is not None)
+
     try:
         if not x_user_id:
             return []
         
-        tasks = []
-        if db:
-            docs = db.collection("users").document(x_user_id).collection("tasks").stream()
-            for doc in docs:
-                data = doc.to_dict()
-                data["id"] = doc.id
-                tasks.append(data)
-            # Sort by created_at ideally, but for now simple append
+        version = await state_version(x_user_id, "tasks")
+        tasks = await run_in_threadpool(store.list_items, x_user_id, "tasks")
+        cache_tasks(x_user_id, tasks, version)
+        # Sort by created_at ideally, but for now simple append
         
         return [Task(**t) for t in tasks]
     except Exception as e:
@@ -353,54 +1109,112 @@ def get_tasks(x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
         return []
 
 @app.post("/api/tasks", response_model=Task)
-def create_task(task: Task, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def create_task(task: Task, x_user_id: Optional[str] = Depends(current_user_id)):
+    if not x_user_id:
+         raise HTTPException(status_code=400, detail="User ID required")
+    return await run_in_threadpool(add_task, x_user_id, task)
+
+def add_task(user_id: str, task: Task) -> Task:
+    """Stores a new task. Also called in-process by the Assistant's
+    create_task tool when it hosts this app."""
     try:
-        if not x_user_id:
-             raise HTTPException(status_code=400, detail="User ID required")
-             
         task_data = task.dict(exclude={"id"})
         task_data["created_at"] = datetime.datetime.now().isoformat()
-        task_data["user_id"] = x_user_id
+        task_data["user_id"] = user_id
         
-        if db:
-            update_time, ref = db.collection("users").document(x_user_id).collection("tasks").add(task_data)
-            task.id = ref.id
-        else:
-            task.id = "mem_" + str(datetime.datetime.now().timestamp())
+        task_data = {k: v for k, v in task_data.items() if k != "updated_at"}
+        task.id = store.add_item(user_id, "tasks", task_data)
+        version = search_index.add(user_id, "tasks", {**task_data, "id": task.id})
+        cache_tasks(user_id, [{**task_data, "id": task.id}], version)
             
         return task
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/tasks/{task_id}", response_model=Task)
+async def get_task(task_id: str, x_user_id: Optional[str] = Depends(current_user_id)):
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    version = await state_version(x_user_id, "tasks")
+    task = await run_in_threadpool(store.get_item, x_user_id, "tasks", task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    cache_tasks(x_user_id, [task], version)
+    return task_response(task)
+
 @app.put("/api/tasks/{task_id}", response_model=Task)
-def update_task(task_id: str, request: UpdateTaskRequest, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def update_task(
+    task_id: str,
+    request: UpdateTaskRequest,
+    if_match: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Depends(current_user_id)
+):
+    """Partial update, answered with the full task and its new ETag.
+
+    With ``If-Match: "<updated_at>"`` the write itself is conditional (412 if
+    the task changed since) and skips the write-behind buffer. Otherwise
+    updates are coalesced through the buffer. The task is read (after the
+    write) only when it isn't cached."""
     try:
-        if db:
-            ref = db.collection("users").document(x_user_id).collection("tasks").document(task_id)
-            doc = ref.get()
-            if not doc.exists:
-                 raise HTTPException(status_code=404, detail="Task not found")
-            
-            updates = {k: v for k, v in request.dict().items() if v is not None}
-            if updates:
-                ref.update(updates)
-            
-            # Merge existing with updates
-            existing = doc.to_dict()
-            existing.update(updates)
-            existing["id"] = task_id
-            return Task(**existing)
-            
-        return Task(id=task_id, title="Mock Update", completed=request.completed or False)
+        cache_key = f"{x_user_id}/{task_id}"
+        seen, existing = await cached_task(x_user_id, task_id) or (None, None)
+        expected = if_match_versions(if_match)
+        updates = {k: v for k, v in request.dict().items() if v is not None}
+
+        if (expected is not None and len(expected) != 1) or not updates:
+            # Nothing to write, or several acceptable versions: compare with
+            # the stored task
+            if existing is None:
+                seen = await state_version(x_user_id, "tasks")
+                existing = await run_in_threadpool(store.get_item, x_user_id, "tasks", task_id)
+                if existing is None:
+                    raise HTTPException(status_code=404, detail="Task not found")
+            if expected is not None and existing.get("updated_at") not in expected:
+                raise HTTPException(status_code=412, detail="Task was modified")
+            if not updates:
+                return task_response(existing)
+            expected = [existing["updated_at"]]
+
+        try:
+            if expected is not None:
+                updated_at = await run_in_threadpool(
+                    store.update_item, x_user_id, "tasks", task_id, updates, expected[0]
+                )
+            else:
+                updated_at = await task_writes.update((x_user_id, "tasks", task_id), updates)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Task not found")
+        except PreconditionFailed:
+            task_cache.delete(cache_key)
+            raise HTTPException(status_code=412, detail="Task was modified")
+        version = await run_in_threadpool(search_index.update, x_user_id, "tasks", task_id, updates)
+
+        if existing is None:
+            # Nothing cached: read the result back
+            task = await run_in_threadpool(store.get_item, x_user_id, "tasks", task_id)
+            if task is None:
+                raise HTTPException(status_code=404, detail="Task not found")
+            cache_tasks(x_user_id, [task], version)
+            return task_response(task)
+
+        merged = {**existing, **updates, "id": task_id, "updated_at": updated_at}
+        if shared_state.follows(seen, version):
+            task_cache.set(cache_key, (version, merged))
+        else:
+            # Another worker wrote in between; don't cache a merge that may be stale
+            task_cache.delete(cache_key)
+        return task_response(merged)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/tasks/{task_id}")
-def delete_task(task_id: str, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def delete_task(task_id: str, x_user_id: Optional[str] = Depends(current_user_id)):
     try:
-        if db:
-            ref = db.collection("users").document(x_user_id).collection("tasks").document(task_id)
-            ref.delete()
+        await run_in_threadpool(store.delete_item, x_user_id, "tasks", task_id)
+        task_cache.delete(f"{x_user_id}/{task_id}")
+        await run_in_threadpool(search_index.remove, x_user_id, "tasks", task_id)
         return {"success": True, "id": task_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -408,17 +1222,22 @@ def delete_task(task_id: str, x_user_id: Optional[str] = Header(None, alias="X-U
 class ParseRequest(BaseModel):
     text: str
 
-@app.post("/api/parse-tasks")
-def parse_tasks(request: ParseRequest):
-    if not client:
-        raise HTTPException(status_code=500, detail="GenAI client not initialized")
-        
-    prompt = f"""
+# Bump when the extraction prompt changes so cached results are not reused
+PARSE_PROMPT_VERSION = "v1"
+
+extraction_cache = ExtractionCache(
+    PARSE_PROMPT_VERSION,
+    ttl=float(os.environ.get("TASK_CACHE_TTL_SECONDS", str(24 * 3600))),
+    max_items=int(os.environ.get("TASK_CACHE_MAX_ITEMS", "5000")),
+)
+
+def build_parse_prompt(text: str) -> str:
+    return f"""
     You are a task extraction assistant. 
     Analyze the following text and extract actionable tasks.
     Return a list of tasks in PURE JSON format (no markdown).
     
-    Text: "{request.text}"
+    Text: "{text}"
     
     Output Schema:
     [
@@ -429,47 +1248,152 @@ def parse_tasks(request: ParseRequest):
         }}
     ]
     """
+
+def task_from_item(item: dict) -> dict:
+    # Add IDs
+    return {
+        "id": str(uuid.uuid4()),
+        "title": item.get("title", "Untitled Task"),
+        "completed": False,
+        "due_date": item.get("due_date"),
+        "tags": item.get("tags", [])
+    }
+
+def fallback_task(text: str) -> dict:
+    return {
+        "id": "fallback_" + str(datetime.datetime.now().timestamp()),
+        "title": text,
+        "completed": False,
+        "tags": ["manual"]
+    }
+
+async def extract_tasks(text: str) -> List[dict]:
+    cached = extraction_cache.get(text)
+    if cached is not None:
+        return [task_from_item(item) for item in cached]
+
+    prompt = build_parse_prompt(text)
     
     try:
         # Generate with Gemini
-        response = client.models.generate_content(
-            model="gemini-2.5-flash", 
-            contents=prompt,
+        # Short, latency-sensitive call: hedge it if it stalls past the usual p95
+        response = await gateway.generate(
+            prompt,
             config=types.GenerateContentConfig(
                 response_mime_type="application/json"
-            )
+            ),
+            operation="parse_tasks",
+            hedge=True
         )
         
-        text = response.text
+        raw = response.text
         # Cleanup potential markdown
-        if text.startswith("```json"): text = text[7:]
-        if text.endswith("```"): text = text[:-3]
-        
-        parsed_data = json.loads(text.strip())
+        if raw.startswith("```json"): raw = raw[7:]
+        if raw.endswith("```"): raw = raw[:-3]
         
-        # Add IDs
-        import uuid
-        tasks = []
-        for item in parsed_data:
-            tasks.append({
-                "id": str(uuid.uuid4()),
-                "title": item.get("title", "Untitled Task"),
-                "completed": False,
-                "due_date": item.get("due_date"),
-                "tags": item.get("tags", [])
-            })
-            
-        return {"tasks": tasks}
+        parsed_data = json.loads(raw.strip())
+        tasks = [task_from_item(item) for item in parsed_data]
+        extraction_cache.set(text, parsed_data)
+        return tasks
         
     except Exception as e:
         print(f"Error parsing tasks: {e}")
         # Fallback
-        return {"tasks": [{
-            "id": "fallback_" + str(datetime.datetime.now().timestamp()),
-            "title": request.text,
-            "completed": False,
-            "tags": ["manual"]
-        }]}
+        return [fallback_task(text)]
+
+def persist_tasks(user_id: str, tasks: List[dict]) -> List[dict]:
+    """Saves extracted tasks in one batched write and returns them with their stored IDs."""
+    created_at = datetime.datetime.now().isoformat()
+    rows = [{
+        **{k: v for k, v in task.items() if k != "id"},
+        "due_date": task.get("due_date"),
+        "created_at": created_at,
+        "user_id": user_id
+    } for task in tasks]
+    ids = store.add_items(user_id, "tasks", rows)
+    saved = [{**row, "id": task_id} for row, task_id in zip(rows, ids)]
+    version = shared_state.version(user_id, "tasks")
+    for task in saved:
+        version = search_index.add(user_id, "tasks", task)
+    cache_tasks(user_id, saved, version)
+    return [Task(**task).dict() for task in saved]
+
+@app.post("/api/parse-tasks")
+async def parse_tasks(request: ParseRequest, persist: bool = False, x_user_id: Optional[str] = Depends(current_user_id)):
+    """Extracts tasks from free text. With ?persist=true the tasks are also
+    saved for the caller in a single batched write and returned with their
+    stored IDs, replacing one POST /api/tasks per task."""
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+    if persist and not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+        
+    tasks = await extract_tasks(request.text)
+    if persist:
+        try:
+            tasks = await run_in_threadpool(persist_tasks, x_user_id, tasks)
+        except Exception as e:
+            print(f"Error saving parsed tasks: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"tasks": tasks}
+
+@app.post("/api/parse-tasks/stream")
+async def parse_tasks_stream(request: ParseRequest, accept: Optional[str] = Header(None)):
+    """Streams each extracted task as soon as the model has finished it.
+
+    NDJSON (one task per line) by default; Server-Sent Events ("task"
+    events, then "done") when the client sends Accept: text/event-stream.
+    Failures are reported in-band as an "error" event / {"error": ...} line,
+    with no "done" after the tasks sent so far.
+    """
+    if not client:
+        raise HTTPException(status_code=500, detail="GenAI client not initialized")
+
+    use_sse = bool(accept and "text/event-stream" in accept)
+    encode = sse_event if use_sse else ndjson_event
+
+    async def events():
+        cached = extraction_cache.get(request.text)
+        if cached is not None:
+            for item in cached:
+                yield encode(task_from_item(item))
+            if use_sse:
+                yield sse_event({"count": len(cached), "cached": True}, event="done")
+            return
+
+        parser = JsonArrayStream()
+        items = []
+        count = 0
+        try:
+            stream = gateway.generate_stream(
+                build_parse_prompt(request.text),
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    # No thinking phase, so the first task starts streaming right away
+                    thinking_config=types.ThinkingConfig(thinking_budget=0)
+                ),
+                operation="parse_tasks_stream"
+            )
+            async for chunk in stream:
+                for item in parser.feed(chunk.text or ""):
+                    count += 1
+                    items.append(item)
+                    yield encode(task_from_item(item))
+            if items:
+                extraction_cache.set(request.text, items)
+        except Exception as e:
+            print(f"Error streaming tasks: {e}")
+            yield encode({"error": str(e)}, event="error")
+            return
+        if count == 0:
+            # Nothing extracted: same fallback as the non-streaming endpoint
+            count = 1
+            yield encode(fallback_task(request.text))
+        if use_sse:
+            yield sse_event({"count": count}, event="done")
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
 
 if __name__ == "__main__":
     import uvicorn
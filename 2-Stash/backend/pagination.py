@@ -0,0 +1,43 @@
+"""Cursor pagination helpers for task and link listings.
+
+Pages are ordered newest first by ``created_at`` with the document id as a
+tie-breaker, so a store only reads ``limit + 1`` documents per page. The
+cursor handed to clients is an opaque base64 token of the last row's
+``(created_at, id)``.
+"""
+import base64
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: str, doc_id: str) -> str:
+    raw = json.dumps([created_at, doc_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return created_at, doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], allowed: set) -> Optional[List[str]]:
+    """Turns ``?fields=title,tags`` into a Firestore projection list."""
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # created_at is always needed to build the next cursor
+    if "created_at" not in selected:
+        selected.append("created_at")
+    return selected
+
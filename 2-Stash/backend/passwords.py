@@ -0,0 +1,33 @@
+"""bcrypt hashing off the request workers.
+
+bcrypt is deliberately slow, so hashing and checking run in the shared CPU
+process pool (cpu_pool) instead of on the event loop or the request
+threadpool. The cost factor is configurable with BCRYPT_ROUNDS.
+"""
+import os
+
+import bcrypt
+
+from cpu_pool import run_cpu_bound, shutdown_pool
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+
+def verify_password(plain_password, hashed_password):
+    # Ensure bytes
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode('utf-8')
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
+
+
+def get_password_hash(password, rounds=BCRYPT_ROUNDS):
+    # Return string for storage
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+async def verify_password_async(plain_password: str, hashed_password) -> bool:
+    return await run_cpu_bound(verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_cpu_bound(get_password_hash, password, BCRYPT_ROUNDS)
@@ -0,0 +1,150 @@
+"""Scheduled freshness checks for saved links.
+
+One loop per box (whichever process holds ``lock_path``, so gunicorn
+workers don't duplicate the work) pulls links whose check is due, leases
+them so nothing else picks them up meanwhile, and revalidates them at most
+``rate`` fetches per second overall and one per ``per_host_interval``
+seconds per host. Hosts take turns, so a site with thousands of saved links
+cannot starve the others. What a check does is up to the ``refresh``
+callback; it returns an outcome name that ``stats()`` counts.
+"""
+import asyncio
+import fcntl
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fastapi.concurrency import run_in_threadpool
+
+from common import tracing
+
+
+class RefreshScheduler:
+    def __init__(self, load_due: Callable[[float, int], List[dict]],
+                 claim: Callable[[List[dict], float], None],
+                 refresh: Callable[[dict], Awaitable[str]],
+                 rate: float = 1.0, per_host_interval: float = 10.0, concurrency: int = 4,
+                 batch_size: int = 100, poll_interval: float = 60.0, lease: float = 3600.0,
+                 lock_path: Optional[str] = None):
+        """``load_due(now, limit)`` returns links due by ``now``;
+        ``claim(links, until)`` pushes their next check to ``until``. Both
+        run in the threadpool."""
+        self.load_due = load_due
+        self.claim = claim
+        self.refresh = refresh
+        self.rate = rate
+        self.per_host_interval = per_host_interval
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        self.outcomes = Counter()
+        self.batches = 0
+        self.last_batch_at: Optional[float] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _lead(self) -> bool:
+        """True if this process runs the checks, taking the lock if it's free."""
+        if self.lock_path is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        # Held until this process exits; then another one takes over
+        self._lock_file = lock_file
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                if self._lead() and await self._run_batch():
+                    # A full batch: more links may be due already
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in link refresh: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def plan(self, links: List[dict], start: float) -> List[Tuple[float, dict]]:
+        """(start time, link) for each link, in start order. Hosts take turns;
+        a start waits for the global rate and for the host's last start."""
+        by_host: "OrderedDict[str, List[dict]]" = OrderedDict()
+        for link in links:
+            by_host.setdefault(urlsplit(link.get("url") or "").hostname or "", []).append(link)
+        host_next = {}
+        next_start = start
+        planned = []
+        for turn in range(max(len(queue) for queue in by_host.values())):
+            for host, queue in by_host.items():
+                if turn >= len(queue):
+                    continue
+                at = max(next_start, host_next.get(host, start))
+                next_start = at + 1 / self.rate
+                host_next[host] = at + self.per_host_interval
+                planned.append((at, queue[turn]))
+        planned.sort(key=lambda entry: entry[0])
+        return planned
+
+    async def _run_batch(self) -> bool:
+        now = time.time()
+        due = await run_in_threadpool(self.load_due, now, self.batch_size)
+        if not due:
+            return False
+        await run_in_threadpool(self.claim, due, now + self.lease)
+        self.batches += 1
+        self.last_batch_at = now
+
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        for at, link in self.plan(due, time.monotonic()):
+            delay = at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            tasks.append(asyncio.create_task(self._refresh_one(link, slots)))
+        await asyncio.gather(*tasks)
+        return len(due) >= self.batch_size
+
+    async def _refresh_one(self, link: dict, slots: asyncio.Semaphore):
+        try:
+            with tracing.span("refresh.link", stage="refresh",
+                              host=urlsplit(link.get("url") or "").hostname or "") as refresh_span:
+                outcome = await self.refresh(link)
+                refresh_span.set("outcome", outcome)
+            self.outcomes[outcome] += 1
+        except Exception as e:
+            self.outcomes["error"] += 1
+            print(f"Error refreshing link {link.get('id')}: {e}")
+        finally:
+            slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "leader": self._lock_file is not None or (self.lock_path is None and self._task is not None),
+            "batches": self.batches,
+            "last_batch_at": self.last_batch_at,
+            "checked": sum(self.outcomes.values()),
+            "outcomes": dict(self.outcomes),
+            "rate_per_second": self.rate,
+            "per_host_interval_seconds": self.per_host_interval,
+        }
@@ -0,0 +1,444 @@
+"""Async scraping engine used by Stash link ingestion.
+
+One pooled keep-alive HTTP client is shared by every request. In-flight
+fetches are capped globally and per host, so a stalled origin can only tie
+up its own slots. Bodies are streamed through an incremental HTML parser
+that drops navigation and other boilerplate, picks out the main content and
+reads the title/OpenGraph metadata; the download stops as soon as the text
+budget is filled. The first
+SCRAPE_INLINE_PARSE_CHARS of a page are parsed on the event loop; the rest
+of a large page is parsed in the CPU process pool in batches, so one huge
+document cannot stall every other request on the worker.
+"""
+import asyncio
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from common import tracing
+from cpu_pool import run_cpu_bound
+
+MAX_TEXT_CHARS = 50000  # Limit to ~50k chars for the Gemini prompt
+MAX_BODY_BYTES = int(os.environ.get("SCRAPE_MAX_BODY_BYTES", str(5 * 1024 * 1024)))
+MAX_INFLIGHT = int(os.environ.get("SCRAPE_MAX_INFLIGHT", "64"))
+MAX_PER_HOST = int(os.environ.get("SCRAPE_MAX_PER_HOST", "4"))
+FETCH_DEADLINE = float(os.environ.get("SCRAPE_DEADLINE_SECONDS", "15"))
+INLINE_PARSE_CHARS = int(os.environ.get("SCRAPE_INLINE_PARSE_CHARS", str(256 * 1024)))
+POOL_PARSE_BATCH_CHARS = int(os.environ.get("SCRAPE_POOL_PARSE_BATCH_CHARS", str(512 * 1024)))
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
+
+_client: Optional[httpx.AsyncClient] = None
+_global_slots: Optional[asyncio.Semaphore] = None
+# host -> [semaphore, number of coroutines using it]
+_host_slots: Dict[str, list] = {}
+
+
+def normalize_url(url: str) -> str:
+    if not url.startswith('http'):
+        url = 'https://' + url
+    return url
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared pooled client, creating it on first use."""
+    global _client, _global_slots
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=MAX_INFLIGHT,
+                max_keepalive_connections=MAX_INFLIGHT,
+                keepalive_expiry=30.0,
+            ),
+            follow_redirects=True,
+        )
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(MAX_INFLIGHT)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class _HostSlot:
+    """Per-host concurrency limit; entries are dropped once nobody uses them."""
+
+    def __init__(self, host: str):
+        self.host = host
+
+    async def __aenter__(self):
+        entry = _host_slots.get(self.host)
+        if entry is None:
+            entry = [asyncio.Semaphore(MAX_PER_HOST), 0]
+            _host_slots[self.host] = entry
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_ref(entry)
+            raise
+        self._entry = entry
+        return self
+
+    async def __aexit__(self, *exc):
+        self._entry[0].release()
+        self._release_ref(self._entry)
+
+    def _release_ref(self, entry):
+        entry[1] -= 1
+        if entry[1] == 0 and _host_slots.get(self.host) is entry:
+            del _host_slots[self.host]
+
+
+# Never part of the text
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "select", "button"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+    "source", "track", "wbr",
+}
+# Start and end of these split text into separate blocks (output lines)
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "br", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}
+# Elements whose paragraphs are scored as main-content candidates
+CONTAINER_TAGS = {"article", "main", "section", "div", "td", "body", "blockquote"}
+BOILERPLATE_TAGS = {"nav", "aside", "form"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog", "menu"}
+NEGATIVE_HINT = re.compile(
+    r"\b(nav|navbar|menu|footer|sidebar|comments?|share|sharing|social|promo|ads?|advert\w*|"
+    r"cookies?|banner|breadcrumbs?|related|subscribe|newsletter|popup|modal|widget|masthead)\b",
+    re.IGNORECASE,
+)
+POSITIVE_HINT = re.compile(r"\b(article|content|entry|post|story|main|body|text|blog)\b", re.IGNORECASE)
+# Blocks whose text is mostly link text are menus and link lists
+MAX_LINK_DENSITY = 0.5
+# Paragraphs shorter than this don't count towards a container's score
+MIN_SCORED_CHARS = 25
+# Below this much text the best container is not trusted; keep everything
+MIN_MAIN_CHARS = 250
+
+# <meta> name/property -> metadata field, best source first
+META_FIELDS = {
+    "og:title": "title", "twitter:title": "title",
+    "og:description": "description", "description": "description", "twitter:description": "description",
+    "og:site_name": "site_name",
+    "og:image": "image", "twitter:image": "image",
+    "og:type": "type",
+    "article:published_time": "published_time",
+    "author": "author", "article:author": "author",
+}
+META_PRIORITY = {key: rank for rank, key in enumerate(META_FIELDS)}
+
+
+class TextExtractor(HTMLParser):
+    """Incremental HTML-to-text converter with main-content detection.
+
+    Text is collected per block (paragraph, heading, list item, ...). Blocks
+    in navigation, headers/footers outside the article, asides, forms and
+    elements whose class/id look like menus, ads or comments are dropped
+    while parsing, as are link-dense blocks. Each remaining paragraph scores
+    its container and, at half weight, the container's parent, in the
+    manner of Readability; ``text()`` returns the best container (plus
+    similarly scored siblings) when it holds enough text, else every kept
+    block. ``<title>``, OpenGraph/Twitter/description meta tags, the
+    canonical link and the page language end up in ``metadata``.
+
+    It can be fed chunk by chunk, and reports when the character budget is
+    full so the download can stop.
+    """
+
+    def __init__(self, budget: int = MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.budget = budget
+        self.size = 0
+        # Open elements: (tag, skip, boilerplate, main, container id)
+        self._stack: List[tuple] = []
+        self._skip_depth = 0
+        self._boilerplate_depth = 0
+        self._main_depth = 0
+        self._link_depth = 0
+        self._containers: List[int] = []
+        self._parents: Dict[int, Optional[int]] = {}
+        self._scores: Dict[int, float] = {}
+        # (text, enclosing container ids)
+        self._blocks: List[tuple] = []
+        self._block: List[str] = []
+        self._block_link_chars = 0
+        self._title: Optional[List[str]] = None
+        self._page_title: Optional[str] = None
+        # field -> (source rank, value)
+        self._meta: Dict[str, tuple] = {}
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.budget
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush_block()
+        if tag in ("meta", "link", "html"):
+            self._read_head_tag(tag, attrs)
+            return
+        if tag == "title":
+            # Not an <svg> icon's <title>
+            if self._page_title is None and not self._skip_depth:
+                self._title = []
+            return
+        if tag in VOID_TAGS:
+            return
+
+        attrs = dict(attrs)
+        hints = f"{attrs.get('class') or ''} {attrs.get('id') or ''}"
+        role = (attrs.get("role") or "").lower()
+        skip = tag in SKIP_TAGS or "hidden" in attrs or attrs.get("aria-hidden") == "true"
+        main = (
+            tag in ("article", "main") or role == "main" or attrs.get("itemprop") == "articleBody"
+        )
+        boilerplate = not main and (
+            tag in BOILERPLATE_TAGS
+            or (tag in ("header", "footer") and not self._main_depth)
+            or role in BOILERPLATE_ROLES
+            or (NEGATIVE_HINT.search(hints) is not None and POSITIVE_HINT.search(hints) is None)
+        )
+        container = None
+        if tag in CONTAINER_TAGS:
+            container = len(self._parents)
+            self._parents[container] = self._containers[-1] if self._containers else None
+            score = 0.0
+            if main:
+                score += 30
+            if POSITIVE_HINT.search(hints):
+                score += 25
+            self._scores[container] = score
+            self._containers.append(container)
+        if tag == "a":
+            self._link_depth += 1
+        self._skip_depth += skip
+        self._boilerplate_depth += boilerplate
+        self._main_depth += main
+        self._stack.append((tag, skip, boilerplate, main, container))
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            if self._title is not None:
+                self._page_title = " ".join("".join(self._title).split())
+                self._title = None
+            return
+        if tag in BLOCK_TAGS:
+            self._flush_block()
+        if tag in VOID_TAGS:
+            return
+        # Unclosed children (<p>, <li>, ...) are closed along with their parent
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self._stack[position][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > position:
+            closed, skip, boilerplate, main, container = self._stack.pop()
+            if closed == "a":
+                self._link_depth -= 1
+            self._skip_depth -= skip
+            self._boilerplate_depth -= boilerplate
+            self._main_depth -= main
+            if container is not None:
+                self._containers.pop()
+
+    def handle_data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+            return
+        if self._skip_depth or self._boilerplate_depth or self.full:
+            return
+        self._block.append(data)
+        if self._link_depth:
+            self._block_link_chars += len(data.strip())
+
+    def _read_head_tag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "html":
+            if attrs.get("lang"):
+                self._set_meta("lang", "lang", attrs["lang"])
+        elif tag == "link":
+            if "canonical" in (attrs.get("rel") or "").lower().split() and attrs.get("href"):
+                self._set_meta("canonical_url", "canonical", attrs["href"])
+        else:
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            field = META_FIELDS.get(key)
+            if field and attrs.get("content"):
+                self._set_meta(field, key, attrs["content"])
+
+    def _set_meta(self, field: str, source: str, value: str):
+        value = " ".join(value.split())
+        rank = META_PRIORITY.get(source, 0)
+        current = self._meta.get(field)
+        if value and (current is None or rank < current[0]):
+            self._meta[field] = (rank, value)
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        found = {field: value for field, (_, value) in self._meta.items()}
+        if "title" not in found and self._page_title:
+            found["title"] = self._page_title
+        return found
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        text = " ".join("".join(self._block).split())
+        link_chars = self._block_link_chars
+        self._block = []
+        self._block_link_chars = 0
+        if not text or link_chars > len(text) * MAX_LINK_DENSITY:
+            return
+        path = tuple(self._containers)
+        self._blocks.append((text, path))
+        self.size += len(text) + 1
+        if len(text) >= MIN_SCORED_CHARS and path:
+            score = 1 + text.count(",") + min(len(text) // 100, 3)
+            self._scores[path[-1]] += score
+            if len(path) > 1:
+                self._scores[path[-2]] += score / 2
+
+    def _main_containers(self) -> set:
+        if not self._scores:
+            return set()
+        best = max(self._scores, key=self._scores.get)
+        if self._scores[best] <= 0:
+            return set()
+        parent = self._parents[best]
+        threshold = max(10.0, self._scores[best] * 0.2)
+        # Articles split over sibling wrappers: take siblings that score close
+        return {best} | {
+            container for container, score in self._scores.items()
+            if parent is not None and self._parents[container] == parent and score >= threshold
+        }
+
+    def text(self) -> str:
+        self._flush_block()
+        main = self._main_containers()
+        blocks = [text for text, path in self._blocks if main.intersection(path)]
+        if sum(len(text) for text in blocks) < MIN_MAIN_CHARS:
+            blocks = [text for text, _ in self._blocks]
+        return '\n'.join(blocks)[:self.budget]
+
+
+def _feed(extractor: TextExtractor, html: str) -> TextExtractor:
+    """Runs in the CPU pool: the extractor travels there and back pickled."""
+    extractor.feed(html)
+    return extractor
+
+
+async def _download_page(url: str, validators: Dict[str, str]) -> dict:
+    async with get_client().stream("GET", url, headers=validators) as response:
+        if response.status_code == 304:
+            return {"not_modified": True}
+        response.raise_for_status()
+        extractor = TextExtractor()
+        # Decode ourselves rather than use aiter_text() so the body limit
+        # counts raw bytes, not decoded characters
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        received = 0
+        decoded = 0
+        batch: List[str] = []
+        batch_chars = 0
+        async for data in response.aiter_bytes():
+            received += len(data)
+            chunk = decoder.decode(data)
+            decoded += len(chunk)
+            if decoded <= INLINE_PARSE_CHARS:
+                extractor.feed(chunk)
+            else:
+                batch.append(chunk)
+                batch_chars += len(chunk)
+                if batch_chars >= POOL_PARSE_BATCH_CHARS:
+                    extractor = await run_cpu_bound(_feed, extractor, "".join(batch))
+                    batch, batch_chars = [], 0
+            if extractor.full or received >= MAX_BODY_BYTES:
+                break
+        else:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                batch.append(tail)
+        if batch and not extractor.full:
+            extractor = await run_cpu_bound(_feed, extractor, "".join(batch))
+        extractor.close()
+        return {
+            "text": extractor.text(),
+            "metadata": extractor.metadata,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        }
+
+
+async def _fetch_page(url: str, validators: Dict[str, str]) -> dict:
+    get_client()  # make sure the pool and global semaphore exist
+    host = urlsplit(url).hostname or ""
+    # Wait for the host slot first so requests queued behind a slow origin
+    # do not hold global slots that other hosts could use. The deadline only
+    # starts once both slots are held, so queueing is not counted as a timeout.
+    async with _HostSlot(host):
+        async with _global_slots:
+            return await asyncio.wait_for(_download_page(url, validators), timeout=FETCH_DEADLINE)
+
+
+def page_text(body: str, metadata: Dict[str, str]) -> str:
+    """The text handed to Gemini: the page's own title and description
+    first, then the main content."""
+    header = [
+        f"{label}: {metadata[field]}"
+        for field, label in (("title", "Title"), ("site_name", "Site"), ("description", "Description"))
+        if metadata.get(field)
+    ]
+    if not header:
+        return body
+    # Script-rendered pages often have no body text, but still a title and description
+    if not body:
+        return "\n".join(header)
+    return ("\n".join(header) + "\n\n" + body)[:MAX_TEXT_CHARS]
+
+
+async def scrape_page(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[dict]:
+    """{"text", "metadata", "etag", "last_modified"} for a URL, or None if
+    it couldn't be fetched. ``text`` already includes the metadata header
+    (see ``page_text``).
+
+    With ``etag``/``last_modified`` from an earlier fetch the request is
+    conditional, and an unchanged page comes back as {"not_modified": True}.
+    """
+    url = normalize_url(url)
+    validators = {}
+    if etag:
+        validators["If-None-Match"] = etag
+    if last_modified:
+        validators["If-Modified-Since"] = last_modified
+    with tracing.span("scrape", stage="scrape", host=urlsplit(url).hostname or "",
+                      conditional=bool(validators)) as scrape_span:
+        try:
+            page = await _fetch_page(url, validators)
+            if page.get("not_modified"):
+                scrape_span.set("not_modified", True)
+                return page
+            text = page_text(page["text"], page["metadata"])
+            scrape_span.set("chars", len(text))
+            if not text:
+                return None
+            return {**page, "text": text}
+        except Exception as e:
+            print(f"Scraping failed: {e!r}")
+            # Failures are swallowed here, so mark the span by hand
+            scrape_span.error = repr(e)
+            return None
@@ -0,0 +1,324 @@
+"""In-memory full-text and tag search over a user's links and tasks.
+
+Each user gets an inverted index (term -> {doc: weighted term frequency})
+built from the store on their first search and then kept current by the
+write paths calling ``add``/``update``/``remove``. Queries are ranked with
+BM25 over the weighted fields and return tag-facet counts for everything
+that matched. Only the most recently searched users stay indexed.
+
+When several workers share the store, each write also bumps the user's
+generation in ``shared_state``; an index that missed another worker's
+write is rebuilt on its next search.
+"""
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+K1 = 1.2
+B = 0.75
+MAX_INDEXED_USERS = int(os.environ.get("SEARCH_MAX_USERS", "1000"))
+MAX_FACETS = 20
+# Browsing a filter that matches fewer documents than this sorts the matches directly
+BROWSE_SCAN_THRESHOLD = 2000
+
+# Searchable fields per kind and how much a term in each counts
+FIELD_WEIGHTS = {
+    "links": {"title": 3, "tags": 2, "summary": 1, "url": 1},
+    "tasks": {"title": 3, "tags": 2},
+}
+# Fields kept with each entry so results render without a store read
+STORED_FIELDS = {
+    "links": ("url", "title", "summary", "tags", "created_at", "status"),
+    "tasks": ("title", "completed", "due_date", "tags", "created_at"),
+}
+
+_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+DocKey = Tuple[str, str]  # (kind, item_id)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _field_text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return "" if value is None else str(value)
+
+
+def _tag_key(tag) -> str:
+    return str(tag).strip().lower()
+
+
+class UserIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Documents are numbered internally; ints hash and intersect far faster than (kind, id) tuples
+        self.numbers: Dict[DocKey, int] = {}
+        self.keys: Dict[int, DocKey] = {}
+        self._next_number = 0
+        self.docs: Dict[int, dict] = {}
+        self.lengths: Dict[int, int] = {}
+        self.terms: Dict[int, Counter] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.tag_docs: Dict[str, set] = {}
+        self.kind_docs: Dict[str, set] = {kind: set() for kind in FIELD_WEIGHTS}
+        # kind -> shared generation this index reflects (None when not shared)
+        self.versions: Optional[Dict[str, int]] = None
+        self.created: Dict[int, str] = {}
+        # (created_at, number) ascending, for newest-first browsing
+        self.recency: List[Tuple[str, int]] = []
+        self.total_length = 0
+
+    def add(self, kind: str, item_id: str, fields: dict):
+        key = (kind, item_id)
+        number = self.numbers.get(key)
+        if number is None:
+            number = self.numbers[key] = self._next_number
+            self.keys[number] = key
+            self._next_number += 1
+        stored = {**self.docs.get(number, {}), **{k: v for k, v in fields.items() if k in STORED_FIELDS[kind]}}
+        self._unindex(number)
+
+        counts = Counter()
+        for field, weight in FIELD_WEIGHTS[kind].items():
+            for term in tokenize(_field_text(stored.get(field))):
+                counts[term] += weight
+        self.docs[number] = stored
+        self.kind_docs[kind].add(number)
+        self.created[number] = stored.get("created_at") or ""
+        bisect.insort(self.recency, (self.created[number], number))
+        self.terms[number] = counts
+        self.lengths[number] = sum(counts.values())
+        self.total_length += self.lengths[number]
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[number] = tf
+        for tag in stored.get("tags") or []:
+            self.tag_docs.setdefault(_tag_key(tag), set()).add(number)
+
+    def update(self, kind: str, item_id: str, fields: dict):
+        # Partial updates only apply to documents we already hold
+        if (kind, item_id) in self.numbers:
+            self.add(kind, item_id, fields)
+
+    def remove(self, kind: str, item_id: str):
+        number = self.numbers.pop((kind, item_id), None)
+        if number is not None:
+            self._unindex(number)
+            del self.keys[number]
+
+    def _unindex(self, number: int):
+        stored = self.docs.pop(number, None)
+        if stored is None:
+            return
+        for term in self.terms.pop(number):
+            posting = self.postings[term]
+            del posting[number]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(number)
+        self.kind_docs[self.keys[number][0]].discard(number)
+        del self.recency[bisect.bisect_left(self.recency, (self.created.pop(number), number))]
+        for tag in stored.get("tags") or []:
+            numbers = self.tag_docs.get(_tag_key(tag))
+            if numbers is not None:
+                numbers.discard(number)
+                if not numbers:
+                    del self.tag_docs[_tag_key(tag)]
+
+    def search(self, query: str, kind: Optional[str] = None, tags: Iterable[str] = (), limit: int = 20) -> dict:
+        # Filters narrow to a set of allowed documents (None means all of them)
+        allowed = self.kind_docs[kind] if kind else None
+        for tag in tags:
+            numbers = self.tag_docs.get(_tag_key(tag), set())
+            allowed = numbers if allowed is None else allowed & numbers
+
+        created = self.created
+        terms = list(dict.fromkeys(tokenize(query)))
+        if terms:
+            scores: Dict[int, float] = {}
+            count = len(self.docs)
+            avg_length = self.total_length / count if count else 1.0
+            lengths = self.lengths
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for number, tf in posting.items():
+                    if allowed is not None and number not in allowed:
+                        continue
+                    norm = K1 * (1 - B + B * lengths[number] / avg_length)
+                    scores[number] = scores.get(number, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+            top = heapq.nlargest(limit, scores, key=lambda number: (scores[number], created[number]))
+            matched = set(scores)
+        else:
+            # Browsing by tag/kind without a query: newest first
+            scores = {}
+            matched = allowed
+            if matched is not None and len(matched) <= BROWSE_SCAN_THRESHOLD:
+                top = heapq.nlargest(limit, matched, key=created.__getitem__)
+            else:
+                # Large match sets: walk the recency list until the page is full
+                top = []
+                for _, number in reversed(self.recency):
+                    if matched is None or number in matched:
+                        top.append(number)
+                        if len(top) == limit:
+                            break
+
+        total = len(self.docs) if matched is None else len(matched)
+        facets = Counter()
+        if matched is None:
+            facets.update({tag: len(numbers) for tag, numbers in self.tag_docs.items()})
+        elif len(self.tag_docs) < total:
+            # Few distinct tags relative to matches: set intersections beat a pass over the matches
+            for tag, numbers in self.tag_docs.items():
+                n = len(numbers & matched)
+                if n:
+                    facets[tag] = n
+        else:
+            for number in matched:
+                for tag in self.docs[number].get("tags") or []:
+                    facets[_tag_key(tag)] += 1
+
+        return {
+            "total": total,
+            "results": [
+                {
+                    **self.docs[number],
+                    "id": self.keys[number][1],
+                    "kind": self.keys[number][0],
+                    "score": round(scores.get(number, 0.0), 4),
+                }
+                for number in top
+            ],
+            "facets": {"tags": [{"tag": tag, "count": n} for tag, n in facets.most_common(MAX_FACETS)]},
+        }
+
+
+class SearchIndex:
+    def __init__(self, loader: Callable[[str, str], List[dict]], max_users: int = MAX_INDEXED_USERS,
+                 shared=None):
+        """``loader(user_id, kind)`` returns every stored item of that kind;
+        it is called from the threadpool when a user is first searched.
+        ``shared`` is the workers' SharedState, if any."""
+        self.loader = loader
+        self.max_users = max_users
+        self.shared = shared
+        self._users: "OrderedDict[str, UserIndex]" = OrderedDict()
+        # user_id -> changes that arrived while that user's index was being built
+        self._pending: Dict[str, list] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _current_versions(self, user_id: str) -> Optional[Dict[str, int]]:
+        if self.shared is None:
+            return None
+        return self.shared.versions(user_id, FIELD_WEIGHTS)
+
+    def _index_for(self, user_id: str) -> UserIndex:
+        versions = self._current_versions(user_id)
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and index.versions == versions:
+                self._users.move_to_end(user_id)
+                return index
+            build_lock = self._build_locks.setdefault(user_id, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                index = self._users.get(user_id)
+                if index is not None and index.versions == versions:
+                    return index
+                self._pending[user_id] = []
+            index = UserIndex()
+            # Read before loading, so the index is at least this new
+            index.versions = self._current_versions(user_id)
+            try:
+                for kind in FIELD_WEIGHTS:
+                    for item in self.loader(user_id, kind):
+                        index.add(kind, item["id"], item)
+            except Exception:
+                with self._lock:
+                    self._pending.pop(user_id, None)
+                raise
+            with self._lock:
+                # Replay writes that raced the build; add/update/remove are idempotent
+                for kind, version, op in self._pending.pop(user_id):
+                    self._advance(index, kind, version, op)
+                self._users[user_id] = index
+                self._build_locks.pop(user_id, None)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            return index
+
+    def _advance(self, index: UserIndex, kind: str, version: Optional[int], op: Callable[[UserIndex], None]):
+        op(index)
+        if index.versions is not None:
+            if self.shared.follows(index.versions[kind], version):
+                index.versions[kind] = version
+            # Otherwise another worker wrote in between: leave the version
+            # behind so the next search rebuilds
+
+    def _apply(self, user_id: str, kind: str, op: Callable[[UserIndex], None]) -> Optional[int]:
+        version = self.shared.bump(user_id, kind) if self.shared is not None else None
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is not None:
+                pending.append((kind, version, op))
+                return version
+            index = self._users.get(user_id)
+        # Users that aren't indexed yet pick the change up from the store on build
+        if index is not None:
+            with index.lock:
+                self._advance(index, kind, version, op)
+        return version
+
+    def add(self, user_id: str, kind: str, item: dict) -> Optional[int]:
+        """Indexes a stored item. This and ``update``/``remove`` return the
+        user's new shared generation for ``kind`` (None when not shared)."""
+        return self._apply(user_id, kind, lambda index: index.add(kind, item["id"], item))
+
+    def update(self, user_id: str, kind: str, item_id: str, updates: dict) -> Optional[int]:
+        return self._apply(user_id, kind, lambda index: index.update(kind, item_id, updates))
+
+    def remove(self, user_id: str, kind: str, item_id: str) -> Optional[int]:
+        return self._apply(user_id, kind, lambda index: index.remove(kind, item_id))
+
+    def search(self, user_id: str, query: str, kind: Optional[str] = None,
+               tags: Iterable[str] = (), limit: int = 20) -> dict:
+        index = self._index_for(user_id)
+        started = time.perf_counter()
+        with index.lock:
+            result = index.search(query, kind=kind, tags=tags, limit=limit)
+        result["took_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def documents(self, user_id: str, kind: str, item_ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """Indexed fields for ``item_ids`` (or every item of ``kind``), keyed by ID."""
+        index = self._index_for(user_id)
+        with index.lock:
+            if item_ids is None:
+                item_ids = [key[1] for key in index.numbers if key[0] == kind]
+            found = {}
+            for item_id in item_ids:
+                number = index.numbers.get((kind, item_id))
+                if number is not None:
+                    found[item_id] = {**index.docs[number], "id": item_id}
+            return found
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "indexed_users": len(self._users),
+                "documents": sum(len(index.docs) for index in self._users.values()),
+                "terms": sum(len(index.postings) for index in self._users.values()),
+            }
@@ -0,0 +1,127 @@
+"""State shared by the gunicorn workers on one box.
+
+Each worker keeps its own search index, task cache and import progress in
+memory. When several workers serve the same users (STASH_SHARED_STATE=true,
+which gunicorn.conf.py sets) those views are kept coherent through a small
+SQLite file:
+
+* a generation counter per (user, kind), bumped after every write, which
+  tells a worker that what it holds for that user may be stale;
+* a table of JSON records any worker may be asked about, such as the
+  progress of an import running on another worker.
+
+With a single process nothing is shared: versions are None (always
+current) and records only live in the owning process.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+SHARED_STATE = os.environ.get("STASH_SHARED_STATE", "false").lower() == "true"
+STATE_PATH = os.environ.get("STASH_STATE_PATH", "stash_state.db")
+RECORD_TTL = float(os.environ.get("STASH_STATE_RECORD_TTL", str(24 * 3600)))
+
+
+class SharedState:
+    def __init__(self, path: Optional[str]):
+        self._conn = None
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "user_id TEXT NOT NULL, kind TEXT NOT NULL, version INTEGER NOT NULL, "
+                "PRIMARY KEY (user_id, kind))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def version(self, user_id: str, kind: str) -> Optional[int]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM generations WHERE user_id = ? AND kind = ?", (user_id, kind)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def versions(self, user_id: str, kinds: Iterable[str]) -> Optional[Dict[str, int]]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, version FROM generations WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        found = dict(rows)
+        return {kind: found.get(kind, 0) for kind in kinds}
+
+    def bump(self, user_id: str, kind: str) -> Optional[int]:
+        """Marks a write to ``kind`` for ``user_id``; returns the new version."""
+        if self._conn is None:
+            return None
+        with self._lock:
+            # One write transaction, so no other worker's bump lands in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO generations (user_id, kind, version) VALUES (?, ?, 1) "
+                    "ON CONFLICT (user_id, kind) DO UPDATE SET version = version + 1",
+                    (user_id, kind),
+                )
+                version = self._conn.execute(
+                    "SELECT version FROM generations WHERE user_id = ? AND kind = ?", (user_id, kind)
+                ).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return version
+
+    @staticmethod
+    def follows(before: Optional[int], after: Optional[int]) -> bool:
+        """True when the write that produced ``after`` was the only one since
+        ``before`` was read, i.e. a view taken at ``before`` plus that write
+        is current."""
+        if before is None or after is None:
+            return before is None and after is None
+        return after == before + 1
+
+    def put(self, namespace: str, key: str, value: dict):
+        if self._conn is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO records (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now),
+            )
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= 32:
+                self._puts_since_trim = 0
+                self._conn.execute("DELETE FROM records WHERE updated_at < ?", (now - RECORD_TTL,))
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def create_shared_state() -> SharedState:
+    return SharedState(STATE_PATH if SHARED_STATE else None)
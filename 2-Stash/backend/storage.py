@@ -0,0 +1,533 @@
+"""Storage layer for users, tasks and links.
+
+Endpoints talk to a ``Store``; two implementations sit behind it:
+
+* ``FirestoreStore`` - the hosted database (users/{uid}/links|tasks).
+* ``SqliteStore`` - an embedded SQLite file in WAL mode, for local and edge
+  deployments and network-free load tests.
+
+``create_store()`` picks one from STORAGE_BACKEND ("firestore" or
+"sqlite"). It fails at startup if the selected backend cannot be
+initialized rather than silently persisting somewhere else. The store it
+returns times every call as a "store" tracing span.
+
+Every item read carries its version in "updated_at" (Firestore's document
+update time, a column in SQLite). ``update_item`` can be made conditional on
+it, which is how task updates honor If-Match.
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from common import tracing
+from pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
+
+KINDS = ("links", "tasks")
+# Maintained by the store, never written as part of an item
+VERSION_FIELD = "updated_at"
+
+
+class EmailTaken(Exception):
+    pass
+
+
+class PreconditionFailed(Exception):
+    """A conditional update found a different version than expected."""
+
+
+def item_body(data: dict) -> dict:
+    return {k: v for k, v in data.items() if k != VERSION_FIELD}
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class Store(ABC):
+    """Repository interface shared by every backend.
+
+    Items are plain dicts; reads return them with "id" and "updated_at"
+    keys. ``kind`` is "links" or "tasks".
+    """
+
+    name = "base"
+
+    # Users
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        """Returns {"uid", "email", "hashed_password"} or None."""
+
+    @abstractmethod
+    def create_user(self, email: str, hashed_password: str, created_at: str) -> str:
+        """Creates a user and returns its uid; raises EmailTaken."""
+
+    @abstractmethod
+    def get_user_meta(self, uid: str) -> Optional[dict]:
+        """Returns session metadata ({"tokens_valid_after"}) or None if the user is gone."""
+
+    @abstractmethod
+    def update_user(self, uid: str, updates: dict):
+        ...
+
+    # Items
+    @abstractmethod
+    def list_items(self, user_id: str, kind: str) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def list_page(self, user_id: str, kind: str, limit: int, cursor: Optional[str] = None,
+                  fields: Optional[List[str]] = None) -> Tuple[List[dict], Optional[str]]:
+        """One page newest first (by created_at, then id) and the next cursor."""
+
+    @abstractmethod
+    def get_item(self, user_id: str, kind: str, item_id: str) -> Optional[dict]:
+        ...
+
+    def add_item(self, user_id: str, kind: str, data: dict) -> str:
+        return self.add_items(user_id, kind, [data])[0]
+
+    @abstractmethod
+    def add_items(self, user_id: str, kind: str, items: List[dict]) -> List[str]:
+        """Adds several items in as few commits as the backend allows."""
+
+    @abstractmethod
+    def update_item(self, user_id: str, kind: str, item_id: str, updates: dict,
+                    if_updated_at: Optional[str] = None) -> str:
+        """Partial update that returns the item's new version. Raises KeyError
+        if the item does not exist and, with ``if_updated_at``,
+        PreconditionFailed unless that is still its version."""
+
+    def batch_update(self, ops: List[Tuple[Tuple[str, str, str], dict]]
+                     ) -> Tuple[Dict[tuple, str], Dict[tuple, Exception]]:
+        """Applies [((user_id, kind, item_id), updates)] with as few commits as
+        possible. Returns the new version of each written key, and the keys
+        that failed mapped to their error."""
+        versions, failures = {}, {}
+        for key, updates in ops:
+            try:
+                versions[key] = self.update_item(*key, updates)
+            except Exception as e:
+                failures[key] = e
+        return versions, failures
+
+    @abstractmethod
+    def delete_item(self, user_id: str, kind: str, item_id: str):
+        ...
+
+    @abstractmethod
+    def list_due_links(self, before: float, limit: int) -> List[dict]:
+        """Links of every user whose ``refresh.next_at`` is at or before
+        ``before``, soonest first, each with "id" and "user_id"."""
+
+
+class FirestoreStore(Store):
+    name = "firestore"
+
+    # Fall back to scanning users by email for accounts created before the
+    # users_by_email index existed. Turn off once the index is backfilled.
+    LEGACY_EMAIL_LOOKUP = os.environ.get("LEGACY_EMAIL_LOOKUP", "true").lower() == "true"
+
+    def __init__(self, database: str = "vibe-coding-challenge"):
+        from google.cloud import firestore
+        from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+        from google.api_core.exceptions import Conflict, FailedPrecondition, NotFound
+        self._firestore = firestore
+        self._timestamp = DatetimeWithNanoseconds.from_rfc3339
+        self._conflict = Conflict
+        self._failed_precondition = FailedPrecondition
+        self._not_found = NotFound
+        # Use specific database
+        self.db = firestore.Client(database=database)
+
+    def _items_ref(self, user_id: str, kind: str):
+        return self.db.collection("users").document(user_id).collection(kind)
+
+    @staticmethod
+    def _item(doc) -> dict:
+        data = doc.to_dict()
+        data["id"] = doc.id
+        data[VERSION_FIELD] = doc.update_time.rfc3339()
+        return data
+
+    def get_user_by_email(self, email):
+        """Point read of users_by_email/{normalized_email}."""
+        index_ref = self.db.collection("users_by_email").document(normalize_email(email))
+        doc = index_ref.get()
+        if doc.exists:
+            return doc.to_dict()
+        if not self.LEGACY_EMAIL_LOOKUP:
+            return None
+
+        user_doc = next(self.db.collection("users").where("email", "==", email).limit(1).stream(), None)
+        if not user_doc:
+            return None
+        user_data = user_doc.to_dict()
+        entry = {"uid": user_doc.id, "email": user_data["email"], "hashed_password": user_data["hashed_password"]}
+        # Backfill so the next login is a point read
+        index_ref.set(entry)
+        return entry
+
+    def create_user(self, email, hashed_password, created_at):
+        """Creates the user and its email index entry in one batch. The index
+        doc is written with create(), so a concurrent signup for the same
+        email fails the whole batch."""
+        user_ref = self.db.collection("users").document()
+        index_ref = self.db.collection("users_by_email").document(normalize_email(email))
+        batch = self.db.batch()
+        batch.set(user_ref, {"email": email, "hashed_password": hashed_password, "created_at": created_at})
+        batch.create(index_ref, {"uid": user_ref.id, "email": email, "hashed_password": hashed_password})
+        try:
+            batch.commit()
+        except self._conflict:
+            raise EmailTaken(email)
+        return user_ref.id
+
+    def get_user_meta(self, uid):
+        doc = self.db.collection("users").document(uid).get(field_paths=["tokens_valid_after"])
+        if not doc.exists:
+            return None
+        return {"tokens_valid_after": (doc.to_dict() or {}).get("tokens_valid_after", 0)}
+
+    def update_user(self, uid, updates):
+        self.db.collection("users").document(uid).update(updates)
+
+    def list_items(self, user_id, kind):
+        return [self._item(doc) for doc in self._items_ref(user_id, kind).stream()]
+
+    def list_page(self, user_id, kind, limit, cursor=None, fields=None):
+        """Documents without ``created_at`` cannot appear in an ordered query
+        and are skipped here."""
+        items_ref = self._items_ref(user_id, kind)
+        descending = self._firestore.Query.DESCENDING
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = items_ref.order_by("created_at", direction=descending).order_by("__name__", direction=descending)
+        if fields:
+            query = query.select(fields)
+        if cursor:
+            created_at, doc_id = decode_cursor(cursor)
+            query = query.start_after({"created_at": created_at, "__name__": items_ref.document(doc_id)})
+
+        # Read one extra document to know whether another page exists
+        docs = list(query.limit(limit + 1).stream())
+        items = [self._item(doc) for doc in docs[:limit]]
+        next_cursor = None
+        if len(docs) > limit:
+            next_cursor = encode_cursor(items[-1]["created_at"], items[-1]["id"])
+        return items, next_cursor
+
+    def get_item(self, user_id, kind, item_id):
+        doc = self._items_ref(user_id, kind).document(item_id).get()
+        return self._item(doc) if doc.exists else None
+
+    def add_items(self, user_id, kind, items):
+        """Batched writes, max 500 ops per commit."""
+        items_ref = self._items_ref(user_id, kind)
+        ids = []
+        for start in range(0, len(items), 500):
+            batch = self.db.batch()
+            for data in items[start:start + 500]:
+                ref = items_ref.document()
+                batch.set(ref, item_body(data))
+                ids.append(ref.id)
+            batch.commit()
+        return ids
+
+    def update_item(self, user_id, kind, item_id, updates, if_updated_at=None):
+        """The precondition is checked by Firestore itself
+        (``last_update_time``), so there is no read first."""
+        option = None
+        if if_updated_at is not None:
+            try:
+                option = self.db.write_option(last_update_time=self._timestamp(if_updated_at))
+            except ValueError:
+                raise PreconditionFailed(item_id)
+        try:
+            result = self._items_ref(user_id, kind).document(item_id).update(item_body(updates), option=option)
+        except self._not_found:
+            raise KeyError(item_id)
+        except self._failed_precondition:
+            raise PreconditionFailed(item_id)
+        return result.update_time.rfc3339()
+
+    def batch_update(self, ops):
+        """One WriteBatch per 500 updates. A batch fails as a whole if any
+        document is missing, so a failed batch is retried op by op to find
+        the bad ones."""
+        versions, failures = {}, {}
+        for start in range(0, len(ops), 500):
+            chunk = ops[start:start + 500]
+            batch = self.db.batch()
+            for (user_id, kind, item_id), updates in chunk:
+                batch.update(self._items_ref(user_id, kind).document(item_id), item_body(updates))
+            try:
+                results = batch.commit()
+            except Exception:
+                chunk_versions, chunk_failures = super().batch_update(chunk)
+                versions.update(chunk_versions)
+                failures.update(chunk_failures)
+                continue
+            for (key, _), result in zip(chunk, results):
+                versions[key] = result.update_time.rfc3339()
+        return versions, failures
+
+    def delete_item(self, user_id, kind, item_id):
+        self._items_ref(user_id, kind).document(item_id).delete()
+
+    def list_due_links(self, before, limit):
+        """Collection group query over every users/{uid}/links; it needs a
+        collection-group index on refresh.next_at."""
+        query = (
+            self.db.collection_group("links")
+            .where("refresh.next_at", "<=", before)
+            .order_by("refresh.next_at")
+            .limit(limit)
+        )
+        links = []
+        for doc in query.stream():
+            data = self._item(doc)
+            data.setdefault("user_id", doc.reference.parent.parent.id)
+            links.append(data)
+        return links
+
+
+class SqliteStore(Store):
+    """Embedded store: one table per kind, the document body as JSON, and
+    indexes on (user_id, created_at, id) and on the normalized email. Each
+    write stamps the row's ``updated_at`` version."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                uid TEXT PRIMARY KEY,
+                email TEXT NOT NULL,
+                email_key TEXT NOT NULL UNIQUE,
+                hashed_password TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                tokens_valid_after REAL NOT NULL DEFAULT 0
+            );
+        """)
+        for kind in KINDS:
+            conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS {kind} (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL DEFAULT '',
+                    updated_at TEXT NOT NULL DEFAULT '',
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS {kind}_user_created ON {kind} (user_id, created_at DESC, id DESC);
+            """)
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({kind})")}
+            if "updated_at" not in columns:
+                # Tables created before items were versioned
+                conn.execute(f"ALTER TABLE {kind} ADD COLUMN updated_at TEXT NOT NULL DEFAULT ''")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS links_refresh_due ON links (json_extract(data, '$.refresh.next_at'))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _table(kind: str) -> str:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind: {kind}")
+        return kind
+
+    @staticmethod
+    def _row_to_item(row, fields=None) -> dict:
+        """``row`` starts with (id, data, updated_at)."""
+        data = json.loads(row[1])
+        if fields:
+            data = {k: data[k] for k in fields if k in data}
+        data["id"] = row[0]
+        data[VERSION_FIELD] = row[2]
+        return data
+
+    @staticmethod
+    def _new_version() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def _update_row(self, conn, user_id, kind, item_id, updates, if_updated_at=None) -> str:
+        """Runs inside the caller's write transaction."""
+        table = self._table(kind)
+        row = conn.execute(
+            f"SELECT data, updated_at FROM {table} WHERE id = ? AND user_id = ?", (item_id, user_id)
+        ).fetchone()
+        if row is None:
+            raise KeyError(item_id)
+        if if_updated_at is not None and row[1] != if_updated_at:
+            raise PreconditionFailed(item_id)
+        data = {**json.loads(row[0]), **item_body(updates)}
+        version = self._new_version()
+        conn.execute(
+            f"UPDATE {table} SET data = ?, created_at = ?, updated_at = ? WHERE id = ? AND updated_at = ?",
+            (json.dumps(data), data.get("created_at") or "", version, item_id, row[1]),
+        )
+        return version
+
+    def get_user_by_email(self, email):
+        row = self._conn().execute(
+            "SELECT uid, email, hashed_password FROM users WHERE email_key = ?", (normalize_email(email),)
+        ).fetchone()
+        if not row:
+            return None
+        return {"uid": row[0], "email": row[1], "hashed_password": row[2]}
+
+    def create_user(self, email, hashed_password, created_at):
+        uid = uuid.uuid4().hex
+        try:
+            self._conn().execute(
+                "INSERT INTO users (uid, email, email_key, hashed_password, created_at) VALUES (?, ?, ?, ?, ?)",
+                (uid, email, normalize_email(email), hashed_password, created_at),
+            )
+        except sqlite3.IntegrityError:
+            raise EmailTaken(email)
+        return uid
+
+    def get_user_meta(self, uid):
+        row = self._conn().execute("SELECT tokens_valid_after FROM users WHERE uid = ?", (uid,)).fetchone()
+        if not row:
+            return None
+        return {"tokens_valid_after": row[0]}
+
+    def update_user(self, uid, updates):
+        if "tokens_valid_after" in updates:
+            self._conn().execute(
+                "UPDATE users SET tokens_valid_after = ? WHERE uid = ?", (updates["tokens_valid_after"], uid)
+            )
+
+    def list_items(self, user_id, kind):
+        rows = self._conn().execute(
+            f"SELECT id, data, updated_at FROM {self._table(kind)} WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def list_page(self, user_id, kind, limit, cursor=None, fields=None):
+        table = self._table(kind)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        sql = f"SELECT id, data, updated_at, created_at FROM {table} WHERE user_id = ?"
+        params: list = [user_id]
+        if cursor:
+            created_at, doc_id = decode_cursor(cursor)
+            sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params += [created_at, created_at, doc_id]
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        items = [self._row_to_item(row, fields) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last[3], last[0])
+        return items, next_cursor
+
+    def get_item(self, user_id, kind, item_id):
+        row = self._conn().execute(
+            f"SELECT id, data, updated_at FROM {self._table(kind)} WHERE id = ? AND user_id = ?", (item_id, user_id)
+        ).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def add_items(self, user_id, kind, items):
+        table = self._table(kind)
+        ids = [uuid.uuid4().hex for _ in items]
+        version = self._new_version()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                f"INSERT INTO {table} (id, user_id, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (item_id, user_id, data.get("created_at") or "", version, json.dumps(item_body(data)))
+                    for item_id, data in zip(ids, items)
+                ],
+            )
+        return ids
+
+    def update_item(self, user_id, kind, item_id, updates, if_updated_at=None):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return self._update_row(conn, user_id, kind, item_id, updates, if_updated_at)
+
+    def batch_update(self, ops):
+        """All updates in one transaction; missing items are reported, not fatal."""
+        versions, failures = {}, {}
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for key, updates in ops:
+                try:
+                    versions[key] = self._update_row(conn, *key, updates)
+                except KeyError as e:
+                    failures[key] = e
+        return versions, failures
+
+    def delete_item(self, user_id, kind, item_id):
+        self._conn().execute(f"DELETE FROM {self._table(kind)} WHERE id = ? AND user_id = ?", (item_id, user_id))
+
+    def list_due_links(self, before, limit):
+        rows = self._conn().execute(
+            "SELECT id, data, updated_at, user_id FROM links WHERE json_extract(data, '$.refresh.next_at') <= ? "
+            "ORDER BY json_extract(data, '$.refresh.next_at') LIMIT ?",
+            (before, limit),
+        ).fetchall()
+        links = []
+        for row in rows:
+            link = self._row_to_item(row)
+            link.setdefault("user_id", row[3])
+            links.append(link)
+        return links
+
+
+class TracedStore:
+    """Wraps a Store so each public method call runs in a "store" span."""
+
+    def __init__(self, store: Store):
+        self._store = store
+        self.name = store.name
+
+    def __getattr__(self, attr):
+        method = getattr(self._store, attr)
+        if attr.startswith("_") or not callable(method):
+            return method
+        span_name = f"store.{attr}"
+
+        def call(*args, **kwargs):
+            with tracing.span(span_name, stage="store", backend=self.name):
+                return method(*args, **kwargs)
+
+        # Cached on the instance, so __getattr__ only runs once per method
+        setattr(self, attr, call)
+        return call
+
+
+def create_store() -> Store:
+    backend = os.environ.get("STORAGE_BACKEND", "firestore").lower()
+    if backend == "firestore":
+        try:
+            return TracedStore(FirestoreStore())
+        except Exception as e:
+            raise RuntimeError(
+                f"Firestore init failed ({e}); set STORAGE_BACKEND=sqlite to use the embedded store"
+            ) from e
+    if backend != "sqlite":
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected 'firestore' or 'sqlite'")
+    return TracedStore(SqliteStore(os.environ.get("STASH_DB_PATH", "stash.db")))
@@ -0,0 +1,208 @@
+"""Per-user vector index for link embeddings.
+
+Each user's vectors are rows of a float32 matrix memory-mapped from
+``{STASH_VECTOR_DIR}/{user}.f32``, with the row -> link ID map kept next to
+it in ``{user}.ids.json``. Vectors are L2-normalized on insert, so cosine
+similarity against every link is a single matrix-vector product and top-k
+is an ``argpartition``. Deleted rows are zeroed and reused.
+
+Several server processes may open the same user: every operation holds an
+advisory lock on ``{user}.lock`` (exclusive for writes) and reloads the
+ID map first if another process replaced it.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+VECTOR_DIR = os.environ.get("STASH_VECTOR_DIR", "stash_vectors")
+EMBEDDING_DIM = int(os.environ.get("STASH_EMBEDDING_DIM", "256"))
+MAX_OPEN_USERS = int(os.environ.get("STASH_VECTOR_OPEN_USERS", "256"))
+INITIAL_ROWS = 256
+
+
+def normalize(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class UserVectors:
+    def __init__(self, prefix: str, dim: int):
+        self.path = prefix + ".f32"
+        self.ids_path = prefix + ".ids.json"
+        self.dim = dim
+        self.lock = threading.Lock()
+        self._lock_file = open(prefix + ".lock", "a+")
+        self.matrix: Optional[np.memmap] = None
+        # Row -> link ID; None marks a free row
+        self.ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.free: List[int] = []
+        # Identity of the ID map file this state was read from
+        self._stamp = None
+        self._loaded = False
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.ids_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        self.matrix = None
+        self.ids = []
+        if os.path.exists(self.ids_path) and os.path.exists(self.path):
+            with open(self.ids_path) as f:
+                meta = json.load(f)
+            # Vectors from a different embedding size can't be compared; start over
+            if meta.get("dim") == self.dim:
+                self.ids = meta["ids"]
+                capacity = os.path.getsize(self.path) // (self.dim * 4)
+                if capacity >= len(self.ids) and capacity:
+                    self.matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+                else:
+                    self.ids = []
+        self.rows = {link_id: row for row, link_id in enumerate(self.ids) if link_id is not None}
+        self.free = [row for row, link_id in enumerate(self.ids) if link_id is None]
+
+    @contextlib.contextmanager
+    def locked(self, exclusive: bool):
+        """Holds the thread lock and the cross-process file lock, with the
+        in-memory state brought up to date with the files."""
+        with self.lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                stamp = self._file_stamp()
+                if not self._loaded or stamp != self._stamp:
+                    self._load()
+                    self._stamp = stamp
+                    self._loaded = True
+                yield self
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _ensure_capacity(self, needed: int):
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(INITIAL_ROWS, capacity * 2, needed)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        # Grow the file (new space reads as zeros) and map it again
+        with open(self.path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+
+    def _save(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+        tmp_path = self.ids_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "ids": self.ids}, f)
+        os.replace(tmp_path, self.ids_path)
+        self._stamp = self._file_stamp()
+
+    def upsert(self, vectors: Dict[str, Sequence[float]]):
+        for link_id, vector in vectors.items():
+            row = self.rows.get(link_id)
+            if row is None:
+                if self.free:
+                    row = self.free.pop()
+                else:
+                    row = len(self.ids)
+                    self.ids.append(None)
+                    self._ensure_capacity(len(self.ids))
+                self.ids[row] = link_id
+                self.rows[link_id] = row
+            self.matrix[row] = normalize(vector)
+        self._save()
+
+    def remove(self, link_id: str):
+        row = self.rows.pop(link_id, None)
+        if row is None:
+            return
+        self.ids[row] = None
+        self.matrix[row] = 0
+        self.free.append(row)
+        self._save()
+
+    def get(self, link_id: str) -> Optional[np.ndarray]:
+        row = self.rows.get(link_id)
+        return None if row is None else np.array(self.matrix[row])
+
+    def top_k(self, query: np.ndarray, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        if not self.rows:
+            return []
+        scores = self.matrix[:len(self.ids)] @ query
+        skipped = self.free + [self.rows[link_id] for link_id in exclude if link_id in self.rows]
+        if skipped:
+            scores[skipped] = -np.inf
+        k = min(k, len(self.ids) - len(skipped))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+
+class VectorIndex:
+    def __init__(self, directory: str = VECTOR_DIR, dim: int = EMBEDDING_DIM, max_open: int = MAX_OPEN_USERS):
+        self.directory = directory
+        self.dim = dim
+        self.max_open = max_open
+        self._users: "OrderedDict[str, UserVectors]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _user(self, user_id: str) -> UserVectors:
+        with self._lock:
+            vectors = self._users.get(user_id)
+            if vectors is None:
+                name = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+                vectors = UserVectors(os.path.join(self.directory, name), self.dim)
+                self._users[user_id] = vectors
+                # Closing a memmap is just dropping it; the file stays on disk
+                while len(self._users) > self.max_open:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            return vectors
+
+    def upsert(self, user_id: str, vectors: Dict[str, Sequence[float]]):
+        if not vectors:
+            return
+        with self._user(user_id).locked(exclusive=True) as user:
+            user.upsert(vectors)
+
+    def remove(self, user_id: str, link_id: str):
+        with self._user(user_id).locked(exclusive=True) as user:
+            user.remove(link_id)
+
+    def get(self, user_id: str, link_id: str) -> Optional[np.ndarray]:
+        with self._user(user_id).locked(exclusive=False) as user:
+            return user.get(link_id)
+
+    def ids(self, user_id: str) -> Set[str]:
+        with self._user(user_id).locked(exclusive=False) as user:
+            return set(user.rows)
+
+    def related(self, user_id: str, link_id: str, k: int) -> List[Tuple[str, float]]:
+        """Links most similar to ``link_id`` (excluding itself), best first."""
+        with self._user(user_id).locked(exclusive=False) as user:
+            vector = user.get(link_id)
+            if vector is None:
+                return []
+            return user.top_k(vector, k, exclude=[link_id])
+
+    def search(self, user_id: str, vector: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        with self._user(user_id).locked(exclusive=False) as user:
+            return user.top_k(normalize(vector), k)
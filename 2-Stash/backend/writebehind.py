@@ -0,0 +1,121 @@
+"""Write-behind buffer that coalesces document updates.
+
+Updates to the same document that arrive within a short window are merged
+into one write, and everything pending is flushed together as a batched
+write. Callers await their update, so a request only returns once its
+change has been committed (or failed), and get the document's new version.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+# (user_id, kind, item_id)
+Key = Tuple[str, str, str]
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_fn: Callable[[List[Tuple[Key, dict]]], Tuple[Dict[Key, str], Dict[Key, Exception]]],
+                 window: float = 0.025, max_batch: int = 500):
+        """``flush_fn`` writes [(key, updates)] and returns the new version of
+        each written key, and the failed keys mapped to their exception. It
+        runs in the threadpool."""
+        self.flush_fn = flush_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: "OrderedDict[Key, list]" = OrderedDict()
+        self._timer = None
+        self._flushes = set()
+        # One batch in flight at a time, so batches commit in the order they
+        # were collected (asyncio.Lock wakes waiters first in, first out)
+        self._flush_lock = asyncio.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.flush_count = 0
+        self.failed = 0
+        self._flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    async def update(self, key: Key, updates: dict) -> Optional[str]:
+        """Queues ``updates`` for ``key``, waits until they are committed and
+        returns the document's new version."""
+        future = asyncio.get_running_loop().create_future()
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = [dict(updates), [future]]
+        else:
+            entry[0].update(updates)
+            entry[1].append(future)
+        self.submitted += 1
+
+        if len(self._pending) >= self.max_batch:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        pending, self._pending = self._pending, OrderedDict()
+        if not pending:
+            return
+        ops = [(key, entry[0]) for key, entry in pending.items()]
+        async with self._flush_lock:
+            started = time.perf_counter()
+            try:
+                versions, failures = await run_in_threadpool(self.flush_fn, ops)
+            except Exception as e:
+                versions, failures = {}, {key: e for key, _ in ops}
+            elapsed = time.perf_counter() - started
+
+        self.flush_count += 1
+        self.written += len(ops) - len(failures)
+        self.failed += len(failures)
+        self._flush_seconds += elapsed
+        self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+
+        for key, (_, futures) in pending.items():
+            error = failures.get(key)
+            for future in futures:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(versions.get(key))
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        writes = self.written + self.failed
+        return {
+            "pending_docs": len(self._pending),
+            "submitted_updates": self.submitted,
+            "written_docs": self.written,
+            "failed_docs": self.failed,
+            "flushes": self.flush_count,
+            "coalescing_ratio": round(self.submitted / writes, 3) if writes else 0.0,
+            "avg_flush_ms": round(self._flush_seconds / self.flush_count * 1000, 2) if self.flush_count else 0.0,
+            "max_flush_ms": round(self._max_flush_seconds * 1000, 2),
+            "window_ms": self.window * 1000,
+        }
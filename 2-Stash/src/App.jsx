@@ -22,7 +22,7 @@ const ProtectedRoute = ({ children }) => {
 };
 
 function AppContent() {
-  const { user, logout } = useAuth();
+  const { user, logout, authHeaders } = useAuth();
   const [links, setLinks] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
 
@@ -41,8 +41,13 @@ function AppContent() {
     if (!user) return;
     try {
       const response = await fetch(`${API_URL}/api/links`, {
-        headers: { 'X-User-Id': user.uid }
+        headers: authHeaders()
       });
+      if (response.status === 401) {
+        // Session expired or revoked: sign in again
+        logout();
+        return;
+      }
       if (response.ok) {
         const data = await response.json();
         setLinks(data);
@@ -59,10 +64,7 @@ function AppContent() {
       // 1. Create Link (Backend handles AI parsing)
       const response = await fetch(`${API_URL}/api/links`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': user.uid
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({ url })
       });
 
@@ -82,7 +84,7 @@ function AppContent() {
     try {
       await fetch(`${API_URL}/api/links/${id}`, {
         method: 'DELETE',
-        headers: { 'X-User-Id': user.uid }
+        headers: authHeaders()
       });
     } catch (error) {
       console.error("Failed to delete link", error);
@@ -98,7 +100,7 @@ function AppContent() {
       try {
         await fetch(`${API_URL}/api/links/${id}`, {
           method: 'PUT',
-          headers: { 'Content-Type': 'application/json', 'X-User-Id': user.uid },
+          headers: authHeaders({ 'Content-Type': 'application/json' }),
           body: JSON.stringify(updatedLink)
         });
       } catch (error) {
@@ -114,10 +116,7 @@ function AppContent() {
     try {
       await fetch(`http://localhost:8001/api/links/${id}`, {
         method: 'PUT',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': user.uid
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           title: updatedData.title,
           summary: updatedData.summary,
@@ -12,7 +12,13 @@ export const AuthProvider = ({ children }) => {
     const storedUser = localStorage.getItem('stash_user');
     if (storedUser) {
       try {
-        setUser(JSON.parse(storedUser));
+        const parsed = JSON.parse(storedUser);
+        // Sessions stored before token auth have no token: sign in again
+        if (parsed.token) {
+          setUser(parsed);
+        } else {
+          localStorage.removeItem('stash_user');
+        }
       } catch (e) {
         console.error("Failed to parse stored user", e);
         localStorage.removeItem('stash_user');
@@ -35,7 +41,7 @@ export const AuthProvider = ({ children }) => {
         throw new Error(errorData.detail || 'Login failed');
       }
       const data = await response.json();
-      const user = { email, uid: data.uid };
+      const user = { email, uid: data.uid, token: data.token };
       setUser(user);
       localStorage.setItem('stash_user', JSON.stringify(user));
       return user; // Return the user data on successful login
@@ -61,7 +67,7 @@ export const AuthProvider = ({ children }) => {
       // The backend should return user data on signup, or we can call login
       // For now, assuming signup returns user data similar to login
       const userData = await response.json(); // Assuming signup also returns user data
-      const user = { email, uid: userData.uid }; // Adjust based on actual signup response
+      const user = { email, uid: userData.uid, token: userData.token };
       setUser(user);
       localStorage.setItem('stash_user', JSON.stringify(user));
       return user;
@@ -76,8 +82,13 @@ export const AuthProvider = ({ children }) => {
     localStorage.removeItem('stash_user');
   };
 
+  // API calls authenticate with the session token from login/signup
+  const authHeaders = (headers = {}) => (
+    user?.token ? { ...headers, Authorization: `Bearer ${user.token}` } : headers
+  );
+
   return (
-    <AuthContext.Provider value={{ user, login, signup, logout, loading }}>
+    <AuthContext.Provider value={{ user, login, signup, logout, loading, authHeaders }}>
       {children}
     </AuthContext.Provider>
   );
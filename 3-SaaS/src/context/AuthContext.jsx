@@ -12,7 +12,13 @@ export const AuthProvider = ({ children }) => {
     const storedUser = localStorage.getItem('stash_user');
     if (storedUser) {
       try {
-        setUser(JSON.parse(storedUser));
+        const parsed = JSON.parse(storedUser);
+        // Sessions stored before token auth have no token: sign in again
+        if (parsed.token) {
+          setUser(parsed);
+        } else {
+          localStorage.removeItem('stash_user');
+        }
       } catch (e) {
         console.error("Failed to parse stored user", e);
         localStorage.removeItem('stash_user');
@@ -74,8 +80,13 @@ export const AuthProvider = ({ children }) => {
     localStorage.removeItem('stash_user');
   };
 
+  // API calls authenticate with the session token from login/signup
+  const authHeaders = (headers = {}) => (
+    user?.token ? { ...headers, Authorization: `Bearer ${user.token}` } : headers
+  );
+
   return (
-    <AuthContext.Provider value={{ user, login, signup, logout, loading }}>
+    <AuthContext.Provider value={{ user, login, signup, logout, loading, authHeaders }}>
       {children}
     </AuthContext.Provider>
   );
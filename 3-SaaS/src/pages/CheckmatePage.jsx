@@ -33,7 +33,7 @@ const checkmateTheme = createTheme({
 });
 
 export default function CheckmatePage() {
-  const { user } = useAuth();
+  const { user, logout, authHeaders } = useAuth();
   const navigate = useNavigate();
   const [tasks, setTasks] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
@@ -47,8 +47,13 @@ export default function CheckmatePage() {
   const fetchTasks = async () => {
     try {
       const response = await fetch(`${API_URL}/api/tasks`, {
-        headers: { 'X-User-Id': user.uid }
+        headers: authHeaders()
       });
+      if (response.status === 401) {
+        // Session expired or revoked: sign in again
+        logout();
+        return;
+      }
       if (response.ok) {
         const data = await response.json();
         setTasks(data);
@@ -61,29 +66,16 @@ export default function CheckmatePage() {
   const addTask = async (text) => {
     setIsLoading(true);
     try {
-      // AI Parse
-      const response = await fetch(`${API_URL}/api/parse-tasks`, {
+      // AI Parse + Persist in one request (tasks are saved in a single batch)
+      const response = await fetch(`${API_URL}/api/parse-tasks?persist=true`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({ text })
       });
 
       if (!response.ok) throw new Error('Failed to parse task');
       const data = await response.json();
-
-      // Persist
-      const createdTasks = await Promise.all(data.tasks.map(async (t) => {
-        const res = await fetch(`${API_URL}/api/tasks`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'X-User-Id': user.uid
-          },
-          body: JSON.stringify(t)
-        });
-        return res.json();
-      }));
-      setTasks(prev => [...createdTasks, ...prev]);
+      setTasks(prev => [...data.tasks, ...prev]);
 
     } catch (error) {
       console.error("Error adding task:", error);
@@ -96,7 +88,7 @@ export default function CheckmatePage() {
     setTasks(prev => prev.map(t => t.id === id ? updatedTask : t)); // Optimistic
     await fetch(`${API_URL}/api/tasks/${id}`, {
       method: 'PUT',
-      headers: { 'Content-Type': 'application/json', 'X-User-Id': user.uid },
+      headers: authHeaders({ 'Content-Type': 'application/json' }),
       body: JSON.stringify(updatedTask)
     });
   };
@@ -105,7 +97,7 @@ export default function CheckmatePage() {
     setTasks(prev => prev.filter(t => t.id !== id)); // Optimistic
     await fetch(`${API_URL}/api/tasks/${id}`, {
       method: 'DELETE',
-      headers: { 'X-User-Id': user.uid }
+      headers: authHeaders()
     });
   };
 
@@ -7,7 +7,7 @@ import LinkList from '../components/stash/LinkList';
 import { useAuth } from '../context/AuthContext';
 
 export default function StashPage() {
-  const { user } = useAuth();
+  const { user, logout, authHeaders } = useAuth();
   const navigate = useNavigate();
   const [links, setLinks] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
@@ -21,8 +21,13 @@ export default function StashPage() {
   const fetchLinks = async () => {
     try {
       const response = await fetch(`${API_URL}/api/links`, {
-        headers: { 'X-User-Id': user.uid }
+        headers: authHeaders()
       });
+      if (response.status === 401) {
+        // Session expired or revoked: sign in again
+        logout();
+        return;
+      }
       if (response.ok) {
         const data = await response.json();
         setLinks(data);
@@ -38,10 +43,7 @@ export default function StashPage() {
       // 1. Create Link (Backend handles AI parsing)
       const response = await fetch(`${API_URL}/api/links`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': user.uid
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({ url })
       });
 
@@ -59,7 +61,7 @@ export default function StashPage() {
     setLinks(prev => prev.filter(l => l.id !== id)); // Optimistic
     await fetch(`${API_URL}/api/links/${id}`, {
       method: 'DELETE',
-      headers: { 'X-User-Id': user.uid }
+      headers: authHeaders()
     });
   };
 
@@ -70,7 +72,7 @@ export default function StashPage() {
       setLinks(prev => prev.map(l => l.id === id ? updatedLink : l));
       await fetch(`${API_URL}/api/links/${id}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json', 'X-User-Id': user.uid },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify(updatedLink)
       });
     }
@@ -81,10 +83,7 @@ export default function StashPage() {
     try {
       await fetch(`${API_URL}/api/links/${id}`, {
         method: 'PUT',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': user.uid
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           title: updatedData.title,
           summary: updatedData.summary,
@@ -1,17 +1,21 @@
 import os
-import requests
-import asyncio
 import asyncio
 import google.auth
 from google import genai
 from typing import Optional
 from google.adk.agents import LlmAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.models import Gemini
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
+import backend_client
+from common import tracing
+from common.gateway import ModelGateway
+from session_store import SqliteSessionService
+from history import HistorySummarizer, SUMMARY_KEY
 
-# Shared Backend URL
-SHARED_BACKEND_URL = os.environ.get("SHARED_BACKEND_URL", "http://localhost:8001")
+# Save Link scrapes and summarizes before answering, so it gets a longer timeout
+SAVE_LINK_TIMEOUT = float(os.environ.get("ASSISTANT_SAVE_LINK_TIMEOUT_SECONDS", "60"))
 VIBE_ONE_URL = os.environ.get("VIBE_ONE_URL", "http://localhost:5175")
 
 # Get Credentials and Project ID for Vertex AI
@@ -22,7 +26,20 @@ except Exception as e:
     project_id = None
 
 
-def create_task(title: str, due_date: str = None, tags: list = []) -> dict:
+def backend_headers(user_id: str) -> dict:
+    # The Shared Backend authenticates the forwarded session token; X-User-Id
+    # names the caller to the in-process transport, which trusts this service
+    headers = {"X-User-Id": user_id, "Content-Type": "application/json"}
+    try:
+        from context import transform_auth_token
+        auth_token = transform_auth_token.get()
+    except LookupError:
+        auth_token = None
+    if auth_token:
+        headers["Authorization"] = f"Bearer {auth_token}"
+    return headers
+
+async def create_task(title: str, due_date: str = None, tags: list = []) -> dict:
     """Creates a task in the Vibe Checkmate system.
     
     Args:
@@ -43,10 +60,8 @@ def create_task(title: str, due_date: str = None, tags: list = []) -> dict:
             "tags": tags,
             "completed": False
         }
-        headers = {"X-User-Id": current_user_id, "Content-Type": "application/json"}
-        resp = requests.post(f"{SHARED_BACKEND_URL}/api/tasks", json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+        headers = backend_headers(current_user_id)
+        data = await backend_client.post("/api/tasks", payload, headers, operation="create_task")
         task_link = f"{VIBE_ONE_URL}/checkmate"
         return {
             "status": "success", 
@@ -58,7 +73,7 @@ def create_task(title: str, due_date: str = None, tags: list = []) -> dict:
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def save_link(url: str, summary: str = None, tags: list = []) -> dict:
+async def save_link(url: str, summary: str = None, tags: list = []) -> dict:
     """Saves a URL to the Vibe Stash system.
     
     Args:
@@ -74,10 +89,10 @@ def save_link(url: str, summary: str = None, tags: list = []) -> dict:
 
     try:
         payload = {"url": url}
-        headers = {"X-User-Id": current_user_id, "Content-Type": "application/json"}
-        resp = requests.post(f"{SHARED_BACKEND_URL}/api/links", json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+        headers = backend_headers(current_user_id)
+        data = await backend_client.post(
+            "/api/links", payload, headers, operation="save_link", timeout=SAVE_LINK_TIMEOUT
+        )
         stash_link = f"{VIBE_ONE_URL}/stash"
         return {
             "status": "success", 
@@ -86,6 +101,8 @@ def save_link(url: str, summary: str = None, tags: list = []) -> dict:
             "view_url": stash_link,
             "instruction": f"Tell the user: Link saved! View it in Stash App"
         }
+    except backend_client.BackendTimeout:
+        return {"status": "error", "message": "The Stash service took too long to respond. Please try again."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -101,14 +118,26 @@ if project_id:
     os.environ["GOOGLE_CLOUD_PROJECT"] = project_id
     os.environ["GOOGLE_CLOUD_LOCATION"] = "global"
     os.environ["GOOGLE_GENAI_USE_VERTEXAI"] = "TRUE"
-    print(f"DEBUG: Configured Vertex AI for project={project_id}, location=global")
 
-# Define Agent
-vibe_agent = LlmAgent(
-    model='gemini-2.5-flash',
-    name='vibe_assistant',
-    description="Helps users manage their tasks and links in Vibe One.",
-    instruction="""
+# ADK owns the agent's GenAI client; the gateway adds the shared limits, retries
+# and metrics, and its own client serves side calls such as history summaries
+genai_client = None
+try:
+    genai_client = genai.Client()
+except Exception as e:
+    print(f"Warning: GenAI client init failed: {e}")
+gateway = ModelGateway(genai_client)
+
+class GatewayGemini(Gemini):
+    """Gemini model whose requests run through the process-wide gateway."""
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        async for response in gateway.stream(
+            lambda: Gemini.generate_content_async(self, llm_request, stream), operation="agent"
+        ):
+            yield response
+
+BASE_INSTRUCTION = """
     You are Vibe Assistant, a helpful AI integrated into the Vibe One platform.
     
     Capabilities:
@@ -118,54 +147,125 @@ vibe_agent = LlmAgent(
     Rules:
     - If a user sends a URL, assume they want to save it unless they ask to summarize it immediately.
     - Be concise and friendly.
-    """,
+    """
+
+def build_instruction(context) -> str:
+    # Older turns are summarized into session state instead of being resent
+    summary = context.state.get(SUMMARY_KEY)
+    if not summary:
+        return BASE_INSTRUCTION
+    return f"{BASE_INSTRUCTION}\n    Memory of earlier conversation with this user:\n    {summary}\n"
+
+# Define Agent
+vibe_agent = LlmAgent(
+    model=GatewayGemini(model='gemini-2.5-flash'),
+    name='vibe_assistant',
+    description="Helps users manage their tasks and links in Vibe One.",
+    instruction=build_instruction,
     tools=[create_task, save_link]
 )
 
 
 # Initialize Services
-session_service = InMemorySessionService()
+# Sessions persist in SQLite (shared by all workers) with a bounded in-memory hot set
+session_service = SqliteSessionService()
 runner = Runner(
     agent=vibe_agent,
     app_name="vibe_assistant_app",
     session_service=session_service
 )
+summarizer = HistorySummarizer(session_service, gateway)
 
-async def process_chat(user_id: str, message_text: str) -> str:
-    """Process a chat message using the ADK Runner."""
+async def ensure_session(user_id: str) -> str:
+    """Returns the user's session ID, creating the session on first use."""
     # We use user_id as session_id for simplicity to maintain per-user history,
     # or we could generate a clear session ID if we wanted separate chats.
-    # For a persistent assistant, user_id as session_id allows memory across reloads (in-memory only though).
+    # For a persistent assistant, user_id as session_id allows memory across reloads.
     session_id = f"session_{user_id}"
     
     # Ensure session exists
-    print(f"DEBUG: Checking session for user_id={user_id}, session_id={session_id}")
     try:
         sess = await session_service.get_session(app_name="vibe_assistant_app", user_id=user_id, session_id=session_id)
         if sess is None:
-             print("DEBUG: Session is None (not found), creating new session...")
              await session_service.create_session(app_name="vibe_assistant_app", user_id=user_id, session_id=session_id)
-        else:
-             print(f"DEBUG: Session found: {sess}")
     except Exception as e:
-        print(f"DEBUG: Session lookup failed ({e}). Creating new session...")
-        try:
-            await session_service.create_session(app_name="vibe_assistant_app", user_id=user_id, session_id=session_id)
-            print("DEBUG: Session created via exception handler.")
-        except Exception as create_error:
-            print(f"DEBUG: Session creation failed: {create_error}")
-            return f"Error: Could not create session: {create_error}"
+        print(f"Warning: Session lookup failed ({e}), creating a new session")
+        await session_service.create_session(app_name="vibe_assistant_app", user_id=user_id, session_id=session_id)
+    return session_id
+
+async def process_chat(user_id: str, message_text: str) -> str:
+    """Process a chat message using the ADK Runner."""
+    try:
+        session_id = await ensure_session(user_id)
+    except Exception as create_error:
+        print(f"Warning: Session creation failed: {create_error}")
+        return f"Error: Could not create session: {create_error}"
 
     user_content = types.Content(role='user', parts=[types.Part(text=message_text)])
     
     final_text = "I'm having trouble connecting."
+    prompt_tokens = output_tokens = 0
     
     try:
-        async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=user_content):
-            if event.is_final_response() and event.content and event.content.parts:
-                final_text = event.content.parts[0].text
+        with tracing.span("agent.turn", stage="agent"):
+            async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=user_content):
+                if event.usage_metadata:
+                    # Summed over every model call in the turn (tool calls add a round trip)
+                    prompt_tokens += event.usage_metadata.prompt_token_count or 0
+                    output_tokens += event.usage_metadata.candidates_token_count or 0
+                if event.is_final_response() and event.content and event.content.parts:
+                    final_text = event.content.parts[0].text
     except Exception as run_error:
-        print(f"DEBUG: Runner execution failed: {run_error}")
+        print(f"Warning: Runner execution failed: {run_error}")
         return f"Error executing chat: {run_error}"
-            
+
+    await finish_turn(user_id, session_id, prompt_tokens, output_tokens)
     return final_text
+
+async def stream_chat(user_id: str, message_text: str):
+    """Runs a turn with model streaming on and yields progress as it happens:
+    {"type": "text", "text": delta} for partial model output,
+    {"type": "tool_start"/"tool_end", ...} around each tool call, and a
+    closing {"type": "done", "text": final_text}."""
+    session_id = await ensure_session(user_id)
+    user_content = types.Content(role='user', parts=[types.Part(text=message_text)])
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE)
+
+    final_text = ""
+    streamed_text = False
+    prompt_tokens = output_tokens = 0
+    async for event in runner.run_async(
+        user_id=user_id, session_id=session_id, new_message=user_content, run_config=run_config
+    ):
+        if event.usage_metadata and not event.partial:
+            prompt_tokens += event.usage_metadata.prompt_token_count or 0
+            output_tokens += event.usage_metadata.candidates_token_count or 0
+        for call in event.get_function_calls():
+            yield {"type": "tool_start", "id": call.id, "name": call.name, "args": call.args or {}}
+        for result in event.get_function_responses():
+            response = result.response or {}
+            yield {"type": "tool_end", "id": result.id, "name": result.name, "status": response.get("status", "success")}
+
+        text = "".join(part.text for part in (event.content.parts if event.content else None) or [] if part.text)
+        if event.partial and text:
+            streamed_text = True
+            yield {"type": "text", "text": text}
+        elif event.is_final_response() and text:
+            # The non-partial final event repeats the streamed text in full
+            final_text = text
+            if not streamed_text:
+                yield {"type": "text", "text": text}
+
+    await finish_turn(user_id, session_id, prompt_tokens, output_tokens)
+    yield {"type": "done", "text": final_text}
+
+async def finish_turn(user_id: str, session_id: str, prompt_tokens: int, output_tokens: int):
+    """Records the turn's token usage and folds old history into the summary
+    in the background once it gets long."""
+    try:
+        session = await session_service.get_session(app_name="vibe_assistant_app", user_id=user_id, session_id=session_id)
+        if session is not None:
+            await session_service.record_turn(session, prompt_tokens, output_tokens)
+        summarizer.schedule("vibe_assistant_app", user_id, session_id)
+    except Exception as e:
+        print(f"Warning: Could not record turn usage: {e}")
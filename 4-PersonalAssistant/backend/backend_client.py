@@ -0,0 +1,271 @@
+"""Client the Assistant's tools use to call the Shared Backend.
+
+Three transports, picked by ASSISTANT_BACKEND_TRANSPORT:
+
+* ``inprocess``: the Shared Backend app is loaded from STASH_BACKEND_DIR
+  into this process and tools call its task/link service functions
+  directly - no HTTP, no JSON. This process then also serves that app on
+  SHARED_BACKEND_PORT for the frontends, so there is one copy of its
+  caches and indexes.
+* ``uds``: HTTP over the Unix socket the Shared Backend listens on
+  (its STASH_UDS_PATH), skipping the loopback TCP stack.
+* ``http``: HTTP to SHARED_BACKEND_URL.
+
+``auto`` (the default) uses the socket when SHARED_BACKEND_SOCKET exists
+and HTTP otherwise. The HTTP transports share one pooled keep-alive
+``httpx.AsyncClient``. In-flight calls are capped, every call has a
+timeout, and per-operation latency is recorded. Each call runs in a
+"tool" tracing span whose ``traceparent`` is sent along, so the Shared
+Backend's spans join the Assistant's trace.
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import httpx
+
+from common import tracing
+
+SHARED_BACKEND_URL = os.environ.get("SHARED_BACKEND_URL", "http://localhost:8001")
+SHARED_BACKEND_SOCKET = os.environ.get("SHARED_BACKEND_SOCKET", "/tmp/vibe_shared_backend.sock")
+SHARED_BACKEND_PORT = int(os.environ.get("SHARED_BACKEND_PORT", "8001"))
+STASH_BACKEND_DIR = os.environ.get(
+    "STASH_BACKEND_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "2-Stash", "backend"),
+)
+TRANSPORT = os.environ.get("ASSISTANT_BACKEND_TRANSPORT", "auto").lower()
+MAX_INFLIGHT = int(os.environ.get("ASSISTANT_BACKEND_MAX_INFLIGHT", "32"))
+DEFAULT_TIMEOUT = float(os.environ.get("ASSISTANT_BACKEND_TIMEOUT_SECONDS", "10"))
+
+
+class BackendError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Shared Backend error {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class BackendTimeout(Exception):
+    pass
+
+
+class HttpTransport:
+    def __init__(self, uds: Optional[str] = None):
+        self.name = "uds" if uds else "http"
+        limits = httpx.Limits(
+            max_connections=MAX_INFLIGHT,
+            max_keepalive_connections=MAX_INFLIGHT,
+            keepalive_expiry=60.0,
+        )
+        self.client = httpx.AsyncClient(
+            # Over a socket the host part is only used for the Host header
+            base_url="http://shared-backend" if uds else SHARED_BACKEND_URL,
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=3.0),
+            transport=httpx.AsyncHTTPTransport(uds=uds, limits=limits),
+        )
+
+    async def post(self, path: str, payload: dict, headers: dict, timeout: Optional[float]) -> dict:
+        try:
+            response = await self.client.post(
+                path, json=payload, headers=headers,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            )
+        except httpx.TimeoutException as e:
+            raise BackendTimeout(str(e)) from e
+        if response.is_error:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise BackendError(response.status_code, str(detail))
+        return response.json()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def shadowed_modules(directory: str) -> list:
+    """Modules of ``directory`` that an import by name would find elsewhere."""
+    shadowed = []
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension != ".py" or not name.isidentifier() or name == "main":
+            continue
+        spec = importlib.util.find_spec(name)
+        if spec is not None and os.path.dirname(os.path.realpath(spec.origin or "")) != os.path.realpath(directory):
+            shadowed.append(name)
+    return shadowed
+
+
+def load_shared_backend():
+    """Imports the Shared Backend's main module as ``stash_backend``."""
+    module = sys.modules.get("stash_backend")
+    if module is not None:
+        return module
+    directory = os.path.abspath(STASH_BACKEND_DIR)
+    # Keep its data files where the standalone service keeps them
+    os.environ.setdefault("STASH_DB_PATH", os.path.join(directory, "stash.db"))
+    os.environ.setdefault("STASH_CACHE_PATH", os.path.join(directory, "stash_cache.db"))
+    os.environ.setdefault("STASH_VECTOR_DIR", os.path.join(directory, "stash_vectors"))
+    # Its modules import each other by plain name (storage, scraper, ...).
+    # Code both services use comes from common/, so no name should resolve
+    # anywhere else; if one does, refuse to load rather than have the app
+    # silently run with a different module.
+    shadowed = shadowed_modules(directory)
+    if shadowed:
+        raise RuntimeError(f"Shared Backend modules shadowed by other modules: {', '.join(shadowed)}")
+    if directory not in sys.path:
+        sys.path.append(directory)
+    spec = importlib.util.spec_from_file_location("stash_backend", os.path.join(directory, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["stash_backend"] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules["stash_backend"]
+        raise
+    return module
+
+
+class InProcessTransport:
+    name = "inprocess"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.routes = {"/api/tasks": self._create_task, "/api/links": self._save_link}
+
+    async def _create_task(self, user_id: str, payload: dict) -> dict:
+        # The service call does blocking store I/O
+        task = await asyncio.to_thread(self.backend.add_task, user_id, self.backend.Task(**payload))
+        return task.dict()
+
+    async def _save_link(self, user_id: str, payload: dict) -> dict:
+        link = await self.backend.save_link(user_id, payload["url"])
+        return link.dict()
+
+    async def post(self, path: str, payload: dict, headers: dict, timeout: Optional[float]) -> dict:
+        from fastapi import HTTPException
+
+        route = self.routes.get(path)
+        if route is None:
+            raise BackendError(404, f"No in-process route for {path}")
+        # The caller was already authenticated by this service
+        user_id = headers.get("X-User-Id")
+        if not user_id:
+            raise BackendError(400, "User ID required")
+        # Like an HTTP request, the call runs to completion even if we stop waiting
+        call = asyncio.ensure_future(route(user_id, payload))
+        try:
+            return await asyncio.wait_for(asyncio.shield(call), timeout if timeout is not None else DEFAULT_TIMEOUT)
+        except asyncio.TimeoutError as e:
+            raise BackendTimeout(f"{path} took longer than {timeout or DEFAULT_TIMEOUT}s") from e
+        except HTTPException as e:
+            raise BackendError(e.status_code, str(e.detail)) from e
+
+    async def close(self):
+        pass
+
+
+_transport = None
+_slots: Optional[asyncio.Semaphore] = None
+_shared_listener = None
+_stats: Dict[str, dict] = {}
+
+
+def get_transport():
+    """Returns the process-wide transport, creating it on first use."""
+    global _transport, _slots
+    if _transport is None:
+        if TRANSPORT == "inprocess":
+            _transport = InProcessTransport(load_shared_backend())
+        elif TRANSPORT == "uds" or (TRANSPORT == "auto" and os.path.exists(SHARED_BACKEND_SOCKET)):
+            _transport = HttpTransport(uds=SHARED_BACKEND_SOCKET)
+        else:
+            _transport = HttpTransport()
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_INFLIGHT)
+    return _transport
+
+
+async def start():
+    """In ``inprocess`` mode, serves the loaded Shared Backend app on
+    SHARED_BACKEND_PORT (running its startup hooks)."""
+    global _shared_listener
+    if TRANSPORT != "inprocess" or _shared_listener is not None:
+        return
+    from common.listeners import start_listener
+
+    transport = get_transport()
+    _shared_listener = await start_listener(transport.backend.app, host="0.0.0.0", port=SHARED_BACKEND_PORT)
+
+
+async def close_client():
+    global _transport, _shared_listener
+    if _shared_listener is not None:
+        from common.listeners import stop_listener
+
+        await stop_listener(_shared_listener)
+        _shared_listener = None
+    if _transport is not None:
+        await _transport.close()
+        _transport = None
+
+
+def _record(operation: str, seconds: float, ok: bool):
+    stats = _stats.get(operation)
+    if stats is None:
+        stats = _stats[operation] = {"calls": 0, "errors": 0, "latencies": deque(maxlen=500)}
+    stats["calls"] += 1
+    if not ok:
+        stats["errors"] += 1
+    stats["latencies"].append(seconds)
+
+
+async def post(path: str, payload: dict, headers: dict, operation: str, timeout: Optional[float] = None) -> dict:
+    """Sends a create request to the Shared Backend and returns the stored
+    object as a dict.
+
+    Raises ``BackendTimeout`` when it takes longer than ``timeout``,
+    ``BackendError`` on error responses, and ``httpx.HTTPError`` on
+    connection failures.
+    """
+    transport = get_transport()
+    with tracing.span(f"tool.{operation}", stage="tool", transport=transport.name):
+        headers = tracing.inject(dict(headers))
+        async with _slots:
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = await transport.post(path, payload, headers, timeout)
+                ok = True
+                return result
+            finally:
+                _record(operation, time.perf_counter() - started, ok)
+
+
+def _percentile_ms(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000, 1)
+
+
+def snapshot() -> dict:
+    result = {}
+    for operation, stats in _stats.items():
+        ordered = sorted(stats["latencies"])
+        result[operation] = {
+            "calls": stats["calls"],
+            "errors": stats["errors"],
+            "p50_ms": _percentile_ms(ordered, 50),
+            "p95_ms": _percentile_ms(ordered, 95),
+            "max_ms": _percentile_ms(ordered, 100),
+        }
+    return {
+        "transport": _transport.name if _transport is not None else TRANSPORT,
+        "max_inflight": MAX_INFLIGHT,
+        "operations": result,
+    }
@@ -1,3 +1,5 @@
 from contextvars import ContextVar
 
 transform_user_id = ContextVar("transform_user_id", default="guest")
+# Session token of the current chat request, forwarded to the Shared Backend by tools
+transform_auth_token = ContextVar("transform_auth_token", default=None)
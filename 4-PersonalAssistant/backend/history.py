@@ -0,0 +1,114 @@
+"""Rolling summarization of Assistant conversation history.
+
+Every turn used to resend the user's whole history. Once a session's
+history passes ASSISTANT_SUMMARY_TRIGGER_TOKENS, the older turns are folded
+(together with any previous summary) into a short memory block kept in
+session state, and only the most recent ~ASSISTANT_SUMMARY_KEEP_TOKENS of
+turns stay as events. The agent's instruction carries the memory block.
+
+Summaries are produced in a background task after the turn has been
+answered, so they never add latency to a reply.
+"""
+import asyncio
+import json
+import os
+from typing import List
+
+from google.adk.events import Event
+from google.genai import types
+
+from session_store import estimate_tokens, trim_index
+
+SUMMARY_KEY = "history_summary"
+TRIGGER_TOKENS = int(os.environ.get("ASSISTANT_SUMMARY_TRIGGER_TOKENS", "3000"))
+KEEP_RECENT_TOKENS = int(os.environ.get("ASSISTANT_SUMMARY_KEEP_TOKENS", "1000"))
+SUMMARY_MODEL = "gemini-2.5-flash"
+TOOL_RESULT_CHARS = 300
+
+
+def transcript(events: List[Event]) -> str:
+    lines = []
+    for event in events:
+        if not event.content or not event.content.parts:
+            continue
+        speaker = "User" if event.author == "user" else "Assistant"
+        for part in event.content.parts:
+            if part.text:
+                lines.append(f"{speaker}: {part.text.strip()}")
+            if part.function_call:
+                args = json.dumps(part.function_call.args or {}, default=str)
+                lines.append(f"Assistant called {part.function_call.name}({args})")
+            if part.function_response:
+                result = json.dumps(part.function_response.response or {}, default=str)[:TOOL_RESULT_CHARS]
+                lines.append(f"Tool {part.function_response.name} returned {result}")
+    return "\n".join(lines)
+
+
+def build_summary_prompt(previous: str, conversation: str) -> str:
+    return f"""
+    You maintain the long-term memory of a personal assistant.
+    Merge the existing memory and the new conversation into one updated memory.
+    Keep facts about the user, their preferences, tasks and links that were
+    created (with titles and URLs), and anything still open. Drop small talk.
+    Write at most 200 words of plain text.
+
+    Existing memory:
+    {previous or "(none)"}
+
+    New conversation:
+    {conversation}
+    """
+
+
+class HistorySummarizer:
+    def __init__(self, session_service, gateway, trigger_tokens: int = TRIGGER_TOKENS,
+                 keep_tokens: int = KEEP_RECENT_TOKENS):
+        self.session_service = session_service
+        self.gateway = gateway
+        self.trigger_tokens = trigger_tokens
+        self.keep_tokens = keep_tokens
+        self._running = {}
+        self.stats = {"summaries": 0, "failures": 0, "events_folded": 0, "tokens_folded": 0}
+
+    def schedule(self, app_name: str, user_id: str, session_id: str):
+        """Summarizes in the background if the session is over the threshold."""
+        key = (app_name, user_id, session_id)
+        if key in self._running:
+            return
+        task = asyncio.create_task(self.summarize(*key))
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+
+    async def summarize(self, app_name: str, user_id: str, session_id: str):
+        try:
+            session = await self.session_service.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id
+            )
+            if session is None or sum(estimate_tokens(e) for e in session.events) <= self.trigger_tokens:
+                return
+            cut = trim_index(session.events, self.keep_tokens)
+            if not cut:
+                return
+            folded = session.events[:cut]
+            keep_from = session.events[cut].id
+
+            response = await self.gateway.generate(
+                build_summary_prompt(session.state.get(SUMMARY_KEY, ""), transcript(folded)),
+                model=SUMMARY_MODEL,
+                config=types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=0)),
+                operation="history_summary",
+            )
+            summary = (response.text or "").strip()
+            if not summary:
+                return
+            if await self.session_service.replace_history(session, keep_from, {SUMMARY_KEY: summary}):
+                self.stats["summaries"] += 1
+                self.stats["events_folded"] += len(folded)
+                self.stats["tokens_folded"] += sum(estimate_tokens(e) for e in folded)
+        except Exception as e:
+            self.stats["failures"] += 1
+            print(f"Warning: History summarization failed: {e}")
+
+    async def close(self):
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
@@ -12,8 +13,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+# A span per request; tool calls pass the trace on to the Shared Backend.
+# Spans go to traces.jsonl by default and latency histograms to /metrics
+from common.tracing import TracingMiddleware, metrics_response
+app.add_middleware(TracingMiddleware, service="assistant-backend")
+
 class Message(BaseModel):
     role: str
     content: str
@@ -21,17 +28,79 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[Message]
 
-from agent import vibe_agent
-from context import transform_user_id
+from agent import vibe_agent, gateway, session_service, summarizer
+from common.streaming import ndjson_event, sse_event
+import backend_client
+from context import transform_user_id, transform_auth_token
+from common.sessions import bearer_token, decode_token
+import asyncio
+import os
 import uvicorn
 
+# Chat requests authenticate with the Shared Backend's session token. Set to
+# true to also trust a bare X-User-Id header (local development only).
+ALLOW_USER_ID_HEADER = os.environ.get("ALLOW_USER_ID_HEADER", "false").lower() == "true"
+
+def resolve_user_id(authorization: Optional[str], x_user_id: Optional[str]) -> Optional[str]:
+    session_token = bearer_token(authorization)
+    if session_token:
+        claims = decode_token(session_token)
+        if claims is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired session")
+        return claims["sub"]
+    return x_user_id if ALLOW_USER_ID_HEADER else None
+
+_maintenance_task = None
+
+@app.on_event("startup")
+async def start_session_maintenance():
+    global _maintenance_task
+    _maintenance_task = asyncio.create_task(session_service.run_maintenance())
+
+@app.on_event("shutdown")
+async def stop_session_maintenance():
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+    await summarizer.close()
+
+@app.get("/api/sessions/stats")
+def session_stats():
+    return {**session_service.snapshot(), "summaries": summarizer.stats}
+
+@app.on_event("startup")
+async def start_backend_client():
+    # In-process mode also serves the Shared Backend from this process
+    await backend_client.start()
+
+@app.on_event("shutdown")
+async def close_backend_client():
+    await backend_client.close_client()
+
+@app.get("/api/tools/stats")
+def tool_stats():
+    return backend_client.snapshot()
+
+@app.get("/api/model/stats")
+def model_stats():
+    return gateway.snapshot()
+
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
 @app.post("/api/chat")
-async def chat(request: ChatRequest, x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+async def chat(
+    request: ChatRequest,
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+    authorization: Optional[str] = Header(None)
+):
+    x_user_id = resolve_user_id(authorization, x_user_id)
     if not x_user_id:
         raise HTTPException(status_code=400, detail="User ID required")
     
     # Set context for tools
     token = transform_user_id.set(x_user_id)
+    auth_token = transform_auth_token.set(bearer_token(authorization))
     
     try:
         # Reconstruct message history for ADK?
@@ -66,6 +135,48 @@ async def chat(request: ChatRequest, x_user_id: Optional[str] = Header(None, ali
         return {"role": "model", "content": f"Error: {e}"}
     finally:
         transform_user_id.reset(token)
+        transform_auth_token.reset(auth_token)
+
+@app.post("/api/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+    authorization: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    """Streams a chat turn: partial model text and tool start/finish events
+    as the runner produces them, then a "done" event with the final text.
+
+    NDJSON (one {"type": ...} object per line) by default; Server-Sent
+    Events named after each type when the client sends Accept: text/event-stream.
+    """
+    x_user_id = resolve_user_id(authorization, x_user_id)
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+    last_msg = next((m for m in reversed(request.messages) if m.role == "user"), None)
+    session_token = bearer_token(authorization)
+
+    use_sse = bool(accept and "text/event-stream" in accept)
+    encode = sse_event if use_sse else ndjson_event
+
+    async def events():
+        if not last_msg:
+            yield encode({"type": "done", "text": "I didn't hear anything."}, event="done")
+            return
+        # Set here rather than in the endpoint: the body is streamed after the
+        # endpoint returns, in the response's own context
+        transform_user_id.set(x_user_id)
+        transform_auth_token.set(session_token)
+        try:
+            from agent import stream_chat
+            async for item in stream_chat(x_user_id, last_msg.content):
+                yield encode(item, event=item["type"])
+        except Exception as e:
+            print(f"Chat Stream Error: {e}")
+            yield encode({"type": "error", "message": str(e)}, event="error")
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -0,0 +1,440 @@
+"""SQLite-backed ADK session service for the Assistant.
+
+Sessions and their events live in an embedded SQLite database (WAL mode),
+so history survives restarts and several uvicorn workers can share it.
+Each worker keeps a bounded LRU "hot set" of sessions in memory; a cached
+session is only reused while its ``last_update_time`` still matches the
+database, so a turn handled by another worker is picked up on the next read.
+
+History is kept under a token budget: when a session grows past it, the
+oldest whole turns are dropped (normally ``history.HistorySummarizer`` has
+already folded them into a summary well before that). Sessions idle for a
+while leave the hot set, and sessions untouched for the retention period
+are deleted. Prompt tokens are recorded per turn in ``turn_usage``.
+
+Writes to the ``sessions`` row merge only their own state changes into the
+stored state, so a summary written in the background and the events of a
+running turn never overwrite each other.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+DB_PATH = os.environ.get("ASSISTANT_DB_PATH", "assistant_sessions.db")
+MAX_HOT_SESSIONS = int(os.environ.get("ASSISTANT_HOT_SESSIONS", "256"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("ASSISTANT_HISTORY_TOKENS", "8000"))
+IDLE_SECONDS = float(os.environ.get("ASSISTANT_SESSION_IDLE_SECONDS", "900"))
+RETENTION_DAYS = float(os.environ.get("ASSISTANT_SESSION_RETENTION_DAYS", "30"))
+MAINTENANCE_INTERVAL = 60.0
+
+# (app_name, user_id, session_id)
+Key = Tuple[str, str, str]
+
+
+def estimate_tokens(event: Event) -> int:
+    """Rough token count (~4 characters per token) of an event's content."""
+    content = event.content
+    if not content or not content.parts:
+        return 0
+    chars = 0
+    for part in content.parts:
+        if part.text:
+            chars += len(part.text)
+        if part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        if part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+    return chars // 4 + 1
+
+
+def persisted_state(state: Dict[str, Any]) -> str:
+    # temp: keys only live for the current invocation
+    return json.dumps({k: v for k, v in state.items() if not k.startswith("temp:")}, default=str)
+
+
+def is_turn_start(event: Event) -> bool:
+    content = event.content
+    return event.author == "user" and bool(content and content.parts and any(p.text for p in content.parts))
+
+
+def trim_index(events: List[Event], budget: int) -> int:
+    """Index of the first event to keep so the history fits ``budget``.
+
+    Only cuts at the start of a user turn, so a tool call is never separated
+    from its response; the latest turn is always kept whole.
+    """
+    remaining = sum(estimate_tokens(event) for event in events)
+    if remaining <= budget:
+        return 0
+    last_start = 0
+    for i, event in enumerate(events):
+        if i and is_turn_start(event):
+            last_start = i
+            if remaining <= budget:
+                return i
+        remaining -= estimate_tokens(event)
+    return last_start
+
+
+class SqliteSessionService(BaseSessionService):
+    def __init__(self, path: str = DB_PATH, max_hot: int = MAX_HOT_SESSIONS,
+                 token_budget: int = HISTORY_TOKEN_BUDGET, idle_seconds: float = IDLE_SECONDS,
+                 retention_days: float = RETENTION_DAYS):
+        super().__init__()
+        self.path = path
+        self.max_hot = max_hot
+        self.token_budget = token_budget
+        self.idle_seconds = idle_seconds
+        self.retention_seconds = retention_days * 86400
+        # key -> [session, last_access]; only touched from the event loop
+        self._hot: "OrderedDict[Key, list]" = OrderedDict()
+        # key -> lock serializing event appends and history rewrites
+        self._locks: "weakref.WeakValueDictionary[Key, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._local = threading.local()
+        self.stats = {"hot_hits": 0, "loads": 0, "trimmed_events": 0, "idle_evictions": 0, "expired": 0}
+        # (prompt_tokens, history_tokens) of the most recent turns in this worker
+        self._recent_turns = deque(maxlen=500)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                app_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                last_update_time REAL NOT NULL,
+                PRIMARY KEY (app_name, user_id, id)
+            );
+            CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (last_update_time);
+            CREATE TABLE IF NOT EXISTS events (
+                app_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_session ON events (app_name, user_id, session_id, seq);
+            CREATE TABLE IF NOT EXISTS turn_usage (
+                app_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                history_tokens INTEGER NOT NULL
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Blocking database helpers, run in the threadpool
+
+    def _version(self, key: Key) -> Optional[float]:
+        row = self._conn().execute(
+            "SELECT last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+        ).fetchone()
+        return row[0] if row else None
+
+    def _load(self, key: Key) -> Optional[Session]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            "SELECT data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq", key
+        ).fetchall()
+        return Session(
+            app_name=key[0], user_id=key[1], id=key[2],
+            state=json.loads(row[0]),
+            events=[Event.model_validate_json(data) for (data,) in rows],
+            last_update_time=row[1],
+        )
+
+    def _save_session(self, session: Session):
+        conn = self._conn()
+        key = (session.app_name, session.user_id, session.id)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (app_name, user_id, id, state, last_update_time) VALUES (?, ?, ?, ?, ?)",
+                (*key, persisted_state(session.state), session.last_update_time),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _merge_state(self, key: Key, state_updates: Dict[str, Any], updated: float) -> Optional[Dict[str, Any]]:
+        """Merges ``state_updates`` into the stored state; runs inside the
+        caller's write transaction. Returns the new state, or None if the
+        session is gone."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT state FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        state = json.loads(persisted_state({**json.loads(row[0]), **state_updates}))
+        conn.execute(
+            "UPDATE sessions SET state = ?, last_update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+            (json.dumps(state, default=str), updated, *key),
+        )
+        return state
+
+    def _write_event(self, session: Session, event: Event):
+        conn = self._conn()
+        key = (session.app_name, session.user_id, session.id)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO events (app_name, user_id, session_id, event_id, data) VALUES (?, ?, ?, ?, ?)",
+                (*key, event.id, event.model_dump_json(exclude_none=True)),
+            )
+            state_delta = event.actions.state_delta if event.actions else {}
+            self._merge_state(key, state_delta or {}, session.last_update_time)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _delete_events_before(self, key: Key, event_id: str):
+        self._conn().execute(
+            """DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq < (
+                   SELECT MIN(seq) FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND event_id = ?
+               )""",
+            (*key, *key, event_id),
+        )
+
+    def _compact_rows(self, key: Key, event_id: str, state_updates: Dict[str, Any],
+                      updated: float) -> Optional[Dict[str, Any]]:
+        """Returns the new state, or None if the session or the event is gone."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            found = conn.execute(
+                "SELECT 1 FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND event_id = ?",
+                (*key, event_id),
+            ).fetchone()
+            state = self._merge_state(key, state_updates, updated) if found else None
+            if state is None:
+                conn.execute("ROLLBACK")
+                return None
+            self._delete_events_before(key, event_id)
+            conn.execute("COMMIT")
+            return state
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _insert_turn(self, key: Key, prompt_tokens: int, output_tokens: int, history_tokens: int):
+        self._conn().execute(
+            "INSERT INTO turn_usage VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (*key, time.time(), prompt_tokens, output_tokens, history_tokens),
+        )
+
+    def _delete(self, key: Key):
+        conn = self._conn()
+        conn.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+        conn.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key)
+
+    def _expire(self, cutoff: float) -> int:
+        conn = self._conn()
+        stale = conn.execute("SELECT app_name, user_id, id FROM sessions WHERE last_update_time < ?", (cutoff,)).fetchall()
+        for key in stale:
+            self._delete(key)
+        return len(stale)
+
+    # Hot set
+
+    def _lock(self, key: Key) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def _remember(self, key: Key, session: Session):
+        self._hot[key] = [session, time.monotonic()]
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.max_hot:
+            self._hot.popitem(last=False)
+
+    async def _compact(self, key: Key, session: Session) -> Session:
+        """Drops the oldest turns once the history is over the token budget.
+
+        ``session`` may be in use by a running turn, so it is left untouched;
+        a trimmed copy is returned instead."""
+        if not trim_index(session.events, self.token_budget):
+            return session
+        async with self._lock(key):
+            # Measure again: a turn may have appended while we waited
+            cut = trim_index(session.events, self.token_budget)
+            if not cut:
+                return session
+            await run_in_threadpool(self._delete_events_before, key, session.events[cut].id)
+            self.stats["trimmed_events"] += cut
+            return session.model_copy(update={"events": session.events[cut:]})
+
+    async def replace_history(self, session: Session, keep_from_event_id: str, state_updates: Dict[str, Any]) -> bool:
+        """Drops the events before ``keep_from_event_id`` and merges
+        ``state_updates`` into the stored state in one write. Returns False if
+        that event is gone.
+
+        ``session`` may be in use by a running turn, so it is left untouched;
+        the hot set gets a compacted copy instead."""
+        key = (session.app_name, session.user_id, session.id)
+        async with self._lock(key):
+            updated = time.time()
+            state = await run_in_threadpool(self._compact_rows, key, keep_from_event_id, state_updates, updated)
+            if state is None:
+                return False
+            entry = self._hot.get(key)
+            if entry is not None:
+                current = entry[0]
+                position = next((i for i, event in enumerate(current.events) if event.id == keep_from_event_id), None)
+                if position is None:
+                    self._hot.pop(key, None)
+                else:
+                    entry[0] = current.model_copy(
+                        update={"events": current.events[position:], "state": state, "last_update_time": updated}
+                    )
+        return True
+
+    async def record_turn(self, session: Session, prompt_tokens: int, output_tokens: int):
+        history_tokens = sum(estimate_tokens(event) for event in session.events)
+        self._recent_turns.append((prompt_tokens, history_tokens))
+        key = (session.app_name, session.user_id, session.id)
+        await run_in_threadpool(self._insert_turn, key, prompt_tokens, output_tokens, history_tokens)
+
+    # BaseSessionService
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=(session_id or "").strip() or str(uuid.uuid4()),
+            state=state or {},
+            events=[],
+            last_update_time=time.time(),
+        )
+        await run_in_threadpool(self._save_session, session)
+        self._remember((app_name, user_id, session.id), session)
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        version = await run_in_threadpool(self._version, key)
+        if version is None:
+            self._hot.pop(key, None)
+            return None
+
+        entry = self._hot.get(key)
+        if entry is not None and entry[0].last_update_time == version:
+            session = entry[0]
+            self.stats["hot_hits"] += 1
+        else:
+            # Not cached, or another worker has written since
+            session = await run_in_threadpool(self._load, key)
+            if session is None:
+                return None
+            self.stats["loads"] += 1
+        session = await self._compact(key, session)
+        self._remember(key, session)
+
+        if config is None:
+            return session
+        events = session.events
+        if config.after_timestamp:
+            events = [event for event in events if event.timestamp >= config.after_timestamp]
+        if config.num_recent_events:
+            events = events[-config.num_recent_events:]
+        return session.model_copy(update={"events": events})
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        def query():
+            sql = "SELECT user_id, id, state, last_update_time FROM sessions WHERE app_name = ?"
+            params = [app_name]
+            if user_id is not None:
+                sql += " AND user_id = ?"
+                params.append(user_id)
+            return self._conn().execute(sql + " ORDER BY last_update_time", params).fetchall()
+        rows = await run_in_threadpool(query)
+        return ListSessionsResponse(sessions=[
+            Session(app_name=app_name, user_id=owner, id=session_id, state=json.loads(state),
+                    events=[], last_update_time=updated)
+            for owner, session_id, state, updated in rows
+        ])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        self._hot.pop(key, None)
+        await run_in_threadpool(self._delete, key)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        key = (session.app_name, session.user_id, session.id)
+        async with self._lock(key):
+            event = await super().append_event(session, event)
+            session.last_update_time = event.timestamp
+            await run_in_threadpool(self._write_event, session, event)
+        entry = self._hot.get(key)
+        if entry is not None and entry[0] is not session:
+            # The caller held a filtered copy; reload the full session next time
+            self._hot.pop(key, None)
+        return event
+
+    # Maintenance
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        idle = [key for key, (_, last_access) in self._hot.items() if now - last_access > self.idle_seconds]
+        for key in idle:
+            self._hot.pop(key, None)
+        self.stats["idle_evictions"] += len(idle)
+        if self.retention_seconds:
+            self.stats["expired"] += await run_in_threadpool(self._expire, time.time() - self.retention_seconds)
+
+    async def run_maintenance(self, interval: float = MAINTENANCE_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                print(f"Warning: Session maintenance failed: {e}")
+
+    def snapshot(self) -> dict:
+        turns = len(self._recent_turns)
+        return {
+            **self.stats,
+            "hot_sessions": len(self._hot),
+            "token_budget": self.token_budget,
+            "recent_turns": turns,
+            "avg_prompt_tokens": round(sum(t[0] for t in self._recent_turns) / turns, 1) if turns else 0.0,
+            "avg_history_tokens": round(sum(t[1] for t in self._recent_turns) / turns, 1) if turns else 0.0,
+        }
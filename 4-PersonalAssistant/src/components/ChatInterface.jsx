@@ -8,7 +8,7 @@ import { useAuth } from '../context/AuthContext';
 const ASSISTANT_API_URL = import.meta.env.VITE_ASSISTANT_API_URL || 'http://localhost:8002';
 
 export default function ChatInterface() {
-  const { user, logout } = useAuth();
+  const { user, logout, authHeaders } = useAuth();
   const [messages, setMessages] = useState([
     { role: 'model', content: `Hi ${user?.email?.split('@')[0]} !I'm Vibe Assistant. I can help you manage tasks and save links. What's on your mind ? ` }
   ]);
@@ -35,15 +35,17 @@ export default function ChatInterface() {
     try {
       const response = await fetch(`${ASSISTANT_API_URL}/api/chat`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': user.uid // Use authenticated user ID
-        },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           messages: [...messages, userMessage].map(m => ({ role: m.role, content: m.content }))
         })
       });
 
+      if (response.status === 401) {
+        // Session expired or revoked: sign in again
+        logout();
+        return;
+      }
       if (!response.ok) throw new Error('Failed to get response');
 
       const data = await response.json();
@@ -0,0 +1,223 @@
+"""Fake Gemini / Vertex AI server for offline benchmarks.
+
+Point the backends' GenAI clients at it with GOOGLE_VERTEX_BASE_URL (the
+Shared Backend and Checkmate use Vertex mode) or GOOGLE_GEMINI_BASE_URL
+plus any GOOGLE_API_KEY (the Assistant). It answers:
+
+* generateContent: it recognizes the backends' prompts (link analysis,
+  batch analysis, task extraction, history summary) and returns JSON in
+  the shape each expects. Agent requests that carry tools get a
+  create_task/save_link function call first and a text reply after the
+  tool result.
+* streamGenerateContent (Gemini API paths): the same answer as SSE chunks.
+* embeddings (Vertex ``predict`` and Gemini ``batchEmbedContents``):
+  deterministic vectors of the requested size.
+
+Every response waits ``--latency-ms`` (+/- ``--jitter-ms``) plus
+``--ms-per-token`` per output token. ``--error-rate`` of requests fail with
+429 RESOURCE_EXHAUSTED, to exercise retries.
+
+In Vertex mode with a custom base URL the SDK posts everything to "/", so
+there the request body decides the kind. Streams also get a plain JSON
+answer, which the SDK reads as a single chunk.
+
+    python benchmarks/fake_genai.py --port 9100 --latency-ms 300 --output-tokens 120
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CONFIG = {
+    "latency_ms": 300.0,
+    "jitter_ms": 50.0,
+    "ms_per_token": 2.0,
+    "output_tokens": 120,
+    "error_rate": 0.0,
+    "stream_chunks": 4,
+}
+WORDS = (
+    "vibe stash link task focus review plan ship build cloud agent model prompt cache latency "
+    "summary release design backend frontend metric trace search index batch stream token"
+).split()
+URL_PATTERN = re.compile(r"https?://\S+")
+
+app = FastAPI()
+stats = Counter()
+
+
+def words(count: int, seed: str) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, count)))
+
+
+def prompt_text(body: dict) -> str:
+    texts = []
+    for content in body.get("contents") or []:
+        for part in content.get("parts") or []:
+            if part.get("text"):
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def link_analysis(seed: str) -> dict:
+    tokens = CONFIG["output_tokens"]
+    return {
+        "title": words(6, seed + "title").title(),
+        "summary": words(max(10, tokens - 12), seed),
+        "tags": words(4, seed + "tags").split(),
+    }
+
+
+def agent_parts(body: dict) -> list:
+    """Tool call for a fresh user message, text once a tool has answered."""
+    last = (body.get("contents") or [{}])[-1]
+    parts = last.get("parts") or []
+    if any("functionResponse" in part for part in parts):
+        return [{"text": "Done! " + words(CONFIG["output_tokens"] // 4, json.dumps(parts)[:200])}]
+    text = " ".join(part.get("text", "") for part in parts)
+    url = URL_PATTERN.search(text)
+    if url:
+        return [{"functionCall": {"name": "save_link", "args": {"url": url.group(0).rstrip(".,)")}}}]
+    if re.search(r"\b(task|remind|todo)\b", text, re.IGNORECASE):
+        return [{"functionCall": {"name": "create_task", "args": {"title": text.strip()[:120], "tags": ["bench"]}}}]
+    return [{"text": words(CONFIG["output_tokens"], text)}]
+
+
+def answer(body: dict) -> tuple:
+    """Returns (kind, parts) for a generateContent request."""
+    prompt = prompt_text(body)
+    if body.get("tools"):
+        return "agent", agent_parts(body)
+    if "[BEGIN DOCUMENT" in prompt:
+        count = len(re.findall(r"\[BEGIN DOCUMENT \d+\]", prompt))
+        items = [{"index": i, **link_analysis(f"{prompt[:64]}{i}")} for i in range(count)]
+        return "batch_analysis", [{"text": json.dumps(items)}]
+    if "[BEGIN CONTENT]" in prompt:
+        return "link_analysis", [{"text": json.dumps(link_analysis(prompt[:256]))}]
+    if "task extraction assistant" in prompt:
+        match = re.search(r'Text: "(.*)"', prompt, re.DOTALL)
+        source = match.group(1) if match else prompt
+        sentences = [s.strip() for s in re.split(r"[.;\n]| and ", source) if s.strip()][:5] or [source[:80]]
+        tasks = [{"title": s[:120], "due_date": None, "tags": ["bench"]} for s in sentences]
+        return "parse_tasks", [{"text": json.dumps(tasks)}]
+    if "long-term memory" in prompt:
+        return "history_summary", [{"text": words(min(200, CONFIG["output_tokens"]), prompt[-256:])}]
+    return "generate", [{"text": words(CONFIG["output_tokens"], prompt[:256])}]
+
+
+def response_body(parts: list, prompt_tokens: int) -> dict:
+    output_tokens = sum(count_tokens(part.get("text") or json.dumps(part)) for part in parts)
+    return {
+        "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+        "modelVersion": "fake-gemini",
+    }
+
+
+def vector(text: str, dim: int) -> list:
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.gauss(0.0, 1.0) for _ in range(dim)]
+
+
+async def delay(output_tokens: int):
+    jitter = random.uniform(-CONFIG["jitter_ms"], CONFIG["jitter_ms"])
+    await asyncio.sleep(max(0.0, CONFIG["latency_ms"] + jitter + CONFIG["ms_per_token"] * output_tokens) / 1000)
+
+
+def rate_limited():
+    return JSONResponse(status_code=429, content={"error": {
+        "code": 429, "message": "Resource exhausted (fake)", "status": "RESOURCE_EXHAUSTED",
+    }})
+
+
+@app.get("/stats")
+def get_stats():
+    return {"config": CONFIG, "requests": dict(stats)}
+
+
+@app.post("/{path:path}")
+async def handle(path: str, request: Request):
+    body = await request.json()
+    if random.random() < CONFIG["error_rate"]:
+        stats["rate_limited"] += 1
+        return rate_limited()
+
+    if "instances" in body or "requests" in body:
+        if "instances" in body:
+            texts = [instance.get("content", "") for instance in body["instances"]]
+            dim = (body.get("parameters") or {}).get("outputDimensionality") or 768
+        else:
+            texts = [prompt_text({"contents": [item.get("content") or {}]}) for item in body["requests"]]
+            first = body["requests"][0] if body["requests"] else {}
+            dim = first.get("outputDimensionality") or 768
+        stats["embed"] += 1
+        stats["embedded_texts"] += len(texts)
+        await delay(0)
+        if "instances" in body:
+            return {"predictions": [
+                {"embeddings": {"values": vector(t, dim), "statistics": {"token_count": count_tokens(t)}}}
+                for t in texts
+            ]}
+        return {"embeddings": [{"values": vector(t, dim)} for t in texts]}
+
+    kind, parts = answer(body)
+    stats[kind] += 1
+    prompt_tokens = count_tokens(prompt_text(body))
+
+    if "streamGenerateContent" not in path:
+        full = response_body(parts, prompt_tokens)
+        await delay(full["usageMetadata"]["candidatesTokenCount"])
+        return full
+
+    async def chunks():
+        text_parts = [part for part in parts if "text" in part]
+        if not text_parts:
+            full = response_body(parts, prompt_tokens)
+            await delay(full["usageMetadata"]["candidatesTokenCount"])
+            yield f"data: {json.dumps(full)}\n\n"
+            return
+        text = text_parts[0]["text"]
+        size = max(1, len(text) // CONFIG["stream_chunks"] + 1)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        await delay(0)
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(CONFIG["ms_per_token"] * count_tokens(piece) / 1000)
+            chunk = response_body([{"text": piece}], prompt_tokens)
+            if i < len(pieces) - 1:
+                chunk["candidates"][0].pop("finishReason")
+            yield f"data: {json.dumps(chunk)}\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=CONFIG["jitter_ms"])
+    parser.add_argument("--ms-per-token", type=float, default=CONFIG["ms_per_token"])
+    parser.add_argument("--output-tokens", type=int, default=CONFIG["output_tokens"])
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"])
+    args = parser.parse_args()
+    CONFIG.update(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, ms_per_token=args.ms_per_token,
+        output_tokens=args.output_tokens, error_rate=args.error_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,68 @@
+"""Login throughput benchmark for the Shared Backend.
+
+Signs up a benchmark account (ignored if it already exists), then hammers
+POST /api/auth/login with N concurrent clients for a fixed duration and
+prints logins per second and latency percentiles.
+
+    python benchmarks/login_bench.py --url http://localhost:8001 --concurrency 32 --duration 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def worker(client, url, credentials, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            resp = await client.post(f"{url}/api/auth/login", json=credentials)
+            if resp.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors.append(resp.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def main(args):
+    credentials = {"email": args.email, "password": args.password}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+        await client.post(f"{args.url}/api/auth/signup", json=credentials)
+
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            worker(client, args.url, credentials, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    print(f"logins:      {len(latencies)} ok, {len(errors)} failed in {elapsed:.1f}s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} logins/s")
+    if latencies:
+        print(f"latency avg: {statistics.mean(latencies) * 1000:.1f} ms")
+        for pct in (50, 95, 99):
+            print(f"latency p{pct}: {percentile(latencies, pct) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--email", default="bench@vibe.local")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
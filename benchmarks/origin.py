@@ -0,0 +1,85 @@
+"""Local web origin serving sample article pages for offline benchmarks.
+
+``/pages/{n}`` returns a deterministic HTML article (title, meta tags,
+navigation and footer boilerplate, ``--paragraphs`` paragraphs of body
+text) after ``--latency-ms``. Each ``n`` is a distinct page, so the
+Shared Backend's page and analysis caches behave as they would on real
+URLs. Pages carry an ETag and answer a matching If-None-Match with 304,
+like most real origins, for link refresh checks.
+
+    python benchmarks/origin.py --port 9200 --latency-ms 50
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+import uvicorn
+from fastapi import FastAPI, Header
+from fastapi.responses import HTMLResponse, Response
+
+CONFIG = {"latency_ms": 50.0, "paragraphs": 12}
+WORDS = (
+    "the a of to and in for on with developer product team release latency cache model query "
+    "index user feature design review deploy cloud service request response stream data page"
+).split()
+
+app = FastAPI()
+
+
+def sentence(rng: random.Random) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+    return text[0].upper() + text[1:] + "."
+
+
+def render_page(n: int) -> str:
+    rng = random.Random(n)
+    title = " ".join(rng.choice(WORDS) for _ in range(5)).title()
+    paragraphs = "\n".join(
+        f"<p>{' '.join(sentence(rng) for _ in range(rng.randint(3, 6)))}</p>"
+        for _ in range(CONFIG["paragraphs"])
+    )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>{title} | Bench Origin</title>
+  <meta name="description" content="{sentence(rng)}">
+  <meta property="og:title" content="{title}">
+  <meta property="og:type" content="article">
+  <script>window.analytics = {{page: {n}}};</script>
+  <style>body {{ font-family: sans-serif; }}</style>
+</head>
+<body>
+  <header><nav><a href="/">Home</a> <a href="/pages/{n + 1}">Next</a> <a href="/about">About</a></nav></header>
+  <main>
+    <article>
+      <h1>{title}</h1>
+      {paragraphs}
+    </article>
+  </main>
+  <aside>Related: <a href="/pages/{n + 2}">more</a></aside>
+  <footer>&copy; Bench Origin. All rights reserved.</footer>
+</body>
+</html>"""
+
+
+@app.get("/pages/{n}", response_class=HTMLResponse)
+async def page(n: int, if_none_match: str = Header(None)):
+    await asyncio.sleep(CONFIG["latency_ms"] / 1000)
+    html = render_page(n)
+    etag = '"' + hashlib.sha1(html.encode("utf-8")).hexdigest()[:16] + '"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return HTMLResponse(html, headers={"ETag": etag})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"])
+    parser.add_argument("--paragraphs", type=int, default=CONFIG["paragraphs"])
+    args = parser.parse_args()
+    CONFIG.update(latency_ms=args.latency_ms, paragraphs=args.paragraphs)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,431 @@
+"""Offline load test for the three backends.
+
+Boots the Shared Backend, Checkmate and the Assistant Backend as
+subprocesses against local stand-ins, then drives each workload. The
+stand-ins are:
+
+* ``fake_genai.py`` in place of Gemini / Vertex AI;
+* the embedded SQLite store (STORAGE_BACKEND=sqlite) in place of
+  Firestore, in a fresh temporary directory;
+* ``origin.py``, which serves the sample pages links point at.
+
+Each workload runs ``--concurrency`` clients for ``--duration`` seconds
+and reports requests per second plus p50/p95/p99 latency per operation.
+The report is saved as JSON under ``benchmarks/results/``. With
+``--compare`` the run is checked against an earlier report: any operation
+whose p95 or throughput got worse by more than ``--regression-threshold``
+is listed, and the exit status is 1.
+
+    python benchmarks/run_bench.py --duration 20 --concurrency 16
+    python benchmarks/run_bench.py --workloads tasks,links --compare benchmarks/results/baseline.json
+
+The backends run with this Python interpreter, so it needs every
+backend's requirements installed.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+WORKLOADS = ("tasks", "links", "parse", "chat", "mixed")
+TASK_TEXTS = [
+    "Email the design review notes to the team and book a room for Friday",
+    "Remind me to renew the domain next week; pay the cloud invoice",
+    "Draft the release blog post and ask marketing for feedback by Monday",
+    "Fix the flaky login test and update the on-call runbook",
+    "Call the dentist tomorrow at 10am and pick up groceries",
+]
+CHAT_TEXTS = [
+    "Remind me to send the quarterly report on Thursday",
+    "Add a task to review the caching pull request",
+    "Save this link {url}",
+    "What can you help me with?",
+]
+SEARCH_TERMS = ["cloud", "latency", "release", "model", "cache", "design"]
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ==========================================
+# PROCESSES
+# ==========================================
+
+class Services:
+    """Starts the stand-ins and the backends; stops them all on exit."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="vibe-bench-")
+        self.processes = []
+        self.ports = {name: free_port() for name in ("genai", "origin", "shared", "checkmate", "assistant")}
+        self.urls = {name: f"http://127.0.0.1:{port}" for name, port in self.ports.items()}
+
+    def spawn(self, name: str, command: list, cwd: str, env: dict):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        process = subprocess.Popen(command, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append((name, process, log))
+
+    def uvicorn(self, name: str, directory: str, env: dict):
+        self.spawn(
+            name,
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.ports[name]), "--log-level", "warning"],
+            os.path.join(ROOT, directory),
+            env,
+        )
+
+    def start(self):
+        args = self.args
+        self.spawn("genai", [
+            sys.executable, os.path.join(BENCH_DIR, "fake_genai.py"), "--port", str(self.ports["genai"]),
+            "--latency-ms", str(args.model_latency_ms), "--ms-per-token", str(args.model_ms_per_token),
+            "--output-tokens", str(args.output_tokens), "--error-rate", str(args.model_error_rate),
+        ], BENCH_DIR, {})
+        self.spawn("origin", [
+            sys.executable, os.path.join(BENCH_DIR, "origin.py"), "--port", str(self.ports["origin"]),
+            "--latency-ms", str(args.origin_latency_ms),
+        ], BENCH_DIR, {})
+
+        common = {
+            "GOOGLE_VERTEX_BASE_URL": self.urls["genai"] + "/",
+            "GOOGLE_GEMINI_BASE_URL": self.urls["genai"],
+            "GOOGLE_API_KEY": "fake-bench-key",
+            # Keep google.auth from finding real credentials or a metadata server
+            "GOOGLE_APPLICATION_CREDENTIALS": os.path.join(self.workdir, "no-credentials.json"),
+            "NO_GCE_CHECK": "True",
+            "SESSION_SECRET": "bench-secret",
+            # Simulated users identify themselves with X-User-Id instead of logging in
+            "ALLOW_USER_ID_HEADER": "true",
+            "TRACE_EXPORT": "off",
+            # The backends import their shared modules from common/
+            "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        }
+        self.uvicorn("shared", "2-Stash/backend", {
+            **common,
+            "STORAGE_BACKEND": "sqlite",
+            "STASH_DB_PATH": os.path.join(self.workdir, "stash.db"),
+            "STASH_CACHE_PATH": os.path.join(self.workdir, "stash_cache.db"),
+            "STASH_VECTOR_DIR": os.path.join(self.workdir, "stash_vectors"),
+            "STASH_UDS_PATH": os.path.join(self.workdir, "shared.sock"),
+        })
+        self.uvicorn("checkmate", "1-Checkmate/backend", common)
+        self.uvicorn("assistant", "4-PersonalAssistant/backend", {
+            **common,
+            "SHARED_BACKEND_URL": self.urls["shared"],
+            "SHARED_BACKEND_SOCKET": os.path.join(self.workdir, "shared.sock"),
+            "ASSISTANT_BACKEND_TRANSPORT": args.assistant_transport,
+            "ASSISTANT_DB_PATH": os.path.join(self.workdir, "assistant_sessions.db"),
+        })
+
+    async def wait_ready(self, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            for name, url in self.urls.items():
+                probe = url + ("/stats" if name == "genai" else "/pages/0" if name == "origin" else "/metrics")
+                while True:
+                    for process_name, process, _ in self.processes:
+                        if process.poll() is not None:
+                            raise RuntimeError(f"{process_name} exited; see {self.workdir}/{process_name}.log")
+                    try:
+                        if (await client.get(probe)).status_code < 500:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{name} did not start; see {self.workdir}/{name}.log")
+                    await asyncio.sleep(0.2)
+
+    def stop(self):
+        for _, process, _ in self.processes:
+            process.terminate()
+        for _, process, log in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+
+
+# ==========================================
+# WORKLOADS
+# ==========================================
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+
+    async def call(self, operation: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code < 400
+            if not ok:
+                self.error_samples.setdefault(operation, f"HTTP {response.status_code}: {response.text[:200]}")
+        except httpx.HTTPError as e:
+            response, ok = None, False
+            self.error_samples.setdefault(operation, f"{type(e).__name__}: {e}")
+        if ok:
+            self.latencies[operation].append(time.perf_counter() - started)
+        else:
+            self.errors[operation] += 1
+        return response if ok else None
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            ordered = sorted(self.latencies[operation])
+            operations[operation] = {
+                "count": len(ordered),
+                "errors": self.errors[operation],
+                "rps": round(len(ordered) / elapsed, 2),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else 0.0,
+                "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+            }
+            if operation in self.error_samples:
+                operations[operation]["error_sample"] = self.error_samples[operation]
+        total = sum(op["count"] for op in operations.values())
+        return {
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(op["errors"] for op in operations.values()),
+            "rps": round(total / elapsed, 2),
+            "operations": operations,
+        }
+
+
+class Workload:
+    def __init__(self, services: Services, args, recorder: Recorder):
+        self.urls = services.urls
+        self.args = args
+        self.recorder = recorder
+        self.rng = random.Random(args.seed)
+        self.task_ids = defaultdict(list)
+
+    def user(self) -> str:
+        return f"bench-user-{self.rng.randrange(self.args.users)}"
+
+    def page_url(self) -> str:
+        return f"{self.urls['origin']}/pages/{self.rng.randrange(self.args.pages)}"
+
+    async def tasks(self, client):
+        user = self.user()
+        headers = {"X-User-Id": user}
+        base = self.urls["shared"] + "/api/tasks"
+        roll = self.rng.random()
+        if roll < 0.4 or not self.task_ids[user]:
+            response = await self.recorder.call("tasks.create", client.post(
+                base, json={"title": self.rng.choice(TASK_TEXTS), "tags": ["bench"]}, headers=headers
+            ))
+            if response is not None:
+                self.task_ids[user].append(response.json()["id"])
+        elif roll < 0.8:
+            await self.recorder.call("tasks.list", client.get(base, headers=headers))
+        elif roll < 0.9:
+            task_id = self.rng.choice(self.task_ids[user])
+            await self.recorder.call("tasks.update", client.put(
+                f"{base}/{task_id}", json={"completed": True}, headers=headers
+            ))
+        else:
+            task_id = self.task_ids[user].pop(self.rng.randrange(len(self.task_ids[user])))
+            await self.recorder.call("tasks.delete", client.delete(f"{base}/{task_id}", headers=headers))
+
+    async def links(self, client):
+        headers = {"X-User-Id": self.user()}
+        base = self.urls["shared"] + "/api/links"
+        if self.rng.random() < 0.5:
+            await self.recorder.call("links.create", client.post(base, json={"url": self.page_url()}, headers=headers))
+        elif self.rng.random() < 0.5:
+            await self.recorder.call("links.list", client.get(base, headers=headers))
+        else:
+            await self.recorder.call("search", client.get(
+                self.urls["shared"] + "/api/search", params={"q": self.rng.choice(SEARCH_TERMS)}, headers=headers
+            ))
+
+    async def parse(self, client):
+        # Distinct texts, so the extraction caches see realistic misses
+        text = f"{self.rng.choice(TASK_TEXTS)} (ref {self.rng.randrange(10 * self.args.pages)})"
+        if self.rng.random() < 0.5:
+            await self.recorder.call("parse.shared", client.post(
+                self.urls["shared"] + "/api/parse-tasks", json={"text": text}, headers={"X-User-Id": self.user()}
+            ))
+        else:
+            await self.recorder.call("parse.checkmate", client.post(
+                self.urls["checkmate"] + "/api/parse-tasks", json={"text": text}
+            ))
+
+    async def chat(self, client):
+        text = self.rng.choice(CHAT_TEXTS).format(url=self.page_url())
+        await self.recorder.call("chat", client.post(
+            self.urls["assistant"] + "/api/chat",
+            json={"messages": [{"role": "user", "content": text}]},
+            headers={"X-User-Id": self.user()},
+        ))
+
+    async def mixed(self, client):
+        # Roughly what the apps send: mostly task CRUD, some links, parsing and chat
+        roll = self.rng.random()
+        if roll < 0.5:
+            await self.tasks(client)
+        elif roll < 0.75:
+            await self.links(client)
+        elif roll < 0.9:
+            await self.parse(client)
+        else:
+            await self.chat(client)
+
+
+async def run_workload(name: str, services: Services, args) -> dict:
+    recorder = Recorder()
+    workload = Workload(services, args, recorder)
+    step = getattr(workload, name)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+        async def worker(deadline: float):
+            while time.perf_counter() < deadline:
+                await step(client)
+
+        if args.warmup > 0:
+            await asyncio.gather(*(worker(time.perf_counter() + args.warmup) for _ in range(args.concurrency)))
+            recorder.__init__()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(started + args.duration) for _ in range(args.concurrency)))
+        return recorder.report(time.perf_counter() - started)
+
+
+# ==========================================
+# REPORT
+# ==========================================
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for workload, result in current["workloads"].items():
+        previous = baseline.get("workloads", {}).get(workload)
+        if not previous:
+            continue
+        for operation, stats in result["operations"].items():
+            before = previous["operations"].get(operation)
+            if not before or not before["count"] or not stats["count"]:
+                continue
+            if before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append(f"{workload}/{operation}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+            if stats["rps"] < before["rps"] * (1 - threshold):
+                regressions.append(f"{workload}/{operation}: rps {before['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def print_result(workload: str, result: dict):
+    print(f"\n{workload}: {result['requests']} requests, {result['errors']} errors, {result['rps']} req/s")
+    print(f"  {'operation':<18}{'count':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}  errors")
+    for operation, stats in result["operations"].items():
+        print(f"  {operation:<18}{stats['count']:>8}{stats['rps']:>9}{stats['p50_ms']:>9}"
+              f"{stats['p95_ms']:>9}{stats['p99_ms']:>9}  {stats['errors']}")
+        if "error_sample" in stats:
+            print(f"    e.g. {stats['error_sample']}")
+
+
+async def main(args) -> int:
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        raise SystemExit(f"Unknown workloads: {', '.join(sorted(unknown))} (choose from {', '.join(WORKLOADS)})")
+
+    services = Services(args)
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "workloads": {},
+    }
+    try:
+        services.start()
+        await services.wait_ready()
+        for name in workloads:
+            print(f"Running {name} for {args.duration}s with {args.concurrency} clients...")
+            report["workloads"][name] = await run_workload(name, services, args)
+            print_result(name, report["workloads"][name])
+        async with httpx.AsyncClient() as client:
+            report["fake_genai"] = (await client.get(services.urls["genai"] + "/stats")).json()["requests"]
+    finally:
+        services.stop()
+        print(f"\nService logs: {services.workdir}")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['git_commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.regression_threshold)
+        if regressions:
+            print(f"\nRegressions vs {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions vs {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help=f"comma-separated, from: {', '.join(WORKLOADS)}")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1000, help="distinct origin pages links point at")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--model-latency-ms", type=float, default=300.0)
+    parser.add_argument("--model-ms-per-token", type=float, default=2.0)
+    parser.add_argument("--output-tokens", type=int, default=120)
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--origin-latency-ms", type=float, default=50.0)
+    parser.add_argument("--assistant-transport", default="auto", choices=("auto", "uds", "http"))
+    parser.add_argument("--output", help="report path (default: benchmarks/results/bench-<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier report to check for regressions")
+    parser.add_argument("--regression-threshold", type=float, default=0.2)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,6 @@
+"""Modules shared by the three backends (Checkmate, the Shared Backend and
+the Assistant Backend).
+
+The repository root must be on the import path: start_all.sh and the
+benchmark harness export PYTHONPATH for that.
+"""
@@ -0,0 +1,144 @@
+"""Response cache for Gemini task extraction.
+
+Two layers, both bounded in size and expired by TTL:
+
+* exact - keyed by the normalized input text and the prompt version.
+* near-duplicate (opt-in) - a 64-bit SimHash over word shingles, indexed
+  in four 16-bit bands so any fingerprint within 3 bits shares a band with
+  the query. A near match must also contain exactly the same numbers as
+  the query, so "call John at 5" never reuses the tasks for "at 6".
+
+Cached values are the raw extracted items; callers assign fresh IDs.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+NEAR_DUP_ENABLED = os.environ.get("TASK_CACHE_NEAR_DUP", "false").lower() == "true"
+NEAR_DUP_MAX_DISTANCE = int(os.environ.get("TASK_CACHE_NEAR_DUP_DISTANCE", "3"))
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_NUMBER = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    words = _WORD.findall(text.lower())
+    if len(words) < shingle:
+        features = words or [text]
+    else:
+        features = [" ".join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)]
+    weights = [0] * 64
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _bands(fingerprint: int):
+    return [(i, (fingerprint >> (16 * i)) & 0xFFFF) for i in range(4)]
+
+
+class ExtractionCache:
+    def __init__(self, prompt_version: str, ttl: float = 24 * 3600, max_items: int = 5000,
+                 near_dup: bool = NEAR_DUP_ENABLED, max_distance: int = NEAR_DUP_MAX_DISTANCE):
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.max_items = max_items
+        self.near_dup = near_dup
+        self.max_distance = min(max_distance, 3)  # the 4-band index only guarantees recall up to 3 bits
+        # key -> (expires_at, items, fingerprint, numbers)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bands = {}
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+
+    def _key(self, normalized: str) -> str:
+        return hashlib.sha256(f"{self.prompt_version}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[List[dict]]:
+        normalized = normalize_text(text)
+        key = self._key(normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["exact_hits"] += 1
+                    return entry[1]
+                self._drop(key)
+
+            if self.near_dup:
+                items = self._near_lookup(normalized, now)
+                if items is not None:
+                    self.stats["near_hits"] += 1
+                    return items
+
+            self.stats["misses"] += 1
+            return None
+
+    def _near_lookup(self, normalized: str, now: float) -> Optional[List[dict]]:
+        fingerprint = simhash(normalized)
+        numbers = _NUMBER.findall(normalized)
+        candidates = set()
+        for band in _bands(fingerprint):
+            candidates |= self._bands.get(band, set())
+        best = None
+        for key in candidates:
+            expires_at, items, other, other_numbers = self._entries[key]
+            if expires_at <= now or other_numbers != numbers:
+                continue
+            distance = bin(fingerprint ^ other).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, key, items)
+        if best is None:
+            return None
+        self._entries.move_to_end(best[1])
+        return best[2]
+
+    def set(self, text: str, items: List[dict]):
+        normalized = normalize_text(text)
+        key = self._key(normalized)
+        fingerprint = simhash(normalized) if self.near_dup else 0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, items, fingerprint, _NUMBER.findall(normalized))
+            if self.near_dup:
+                for band in _bands(fingerprint):
+                    self._bands.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_items:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None or not self.near_dup:
+            return
+        for band in _bands(entry[2]):
+            keys = self._bands.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["near_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "items": len(self._entries),
+                "near_dup_enabled": self.near_dup,
+            }
@@ -0,0 +1,352 @@
+"""Process-wide gateway for Gemini calls.
+
+Every model call in the service goes through one ``ModelGateway``, which
+provides:
+
+* a concurrency semaphore and a token-bucket rate limiter shared by all
+  callers in the process (GENAI_MAX_CONCURRENCY, GENAI_RPM);
+* retries with full-jitter exponential backoff for 429/5xx and
+  RESOURCE_EXHAUSTED/UNAVAILABLE errors, honoring the server's retry
+  delay hint when one is given (a call that runs into the gateway's own
+  GENAI_TIMEOUT_SECONDS is not retried, so one request cannot hold a slot
+  for several full timeouts);
+* optional request hedging: when a call runs past the recent p95 latency a
+  second identical request is raised and whichever answers first wins
+  (calls the hedge won are left out of the latency samples, so the p95
+  reflects primary requests only);
+* per-operation latency and token metrics, and a "model" tracing span
+  per call.
+
+It uses the async client (``client.aio``) so no call blocks the event loop.
+"""
+import asyncio
+import inspect
+import json
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from common import tracing
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+EMBEDDING_MODEL = os.environ.get("GENAI_EMBEDDING_MODEL", "text-embedding-005")
+
+MAX_CONCURRENCY = int(os.environ.get("GENAI_MAX_CONCURRENCY", "16"))
+REQUESTS_PER_MINUTE = float(os.environ.get("GENAI_RPM", "300"))
+MAX_RETRIES = int(os.environ.get("GENAI_MAX_RETRIES", "4"))
+CALL_TIMEOUT = float(os.environ.get("GENAI_TIMEOUT_SECONDS", "90"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+# Never hedge sooner than this, whatever the observed p95 is
+HEDGE_MIN_DELAY = float(os.environ.get("GENAI_HEDGE_MIN_SECONDS", "2"))
+
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_STATUSES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"}
+_RETRY_DELAY = re.compile(r'"?retryDelay"?\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+class ModelTimeout(asyncio.TimeoutError):
+    """The gateway's own per-call timeout (CALL_TIMEOUT) expired; not retried."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1.0, per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ModelTimeout):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if getattr(error, "code", None) in RETRYABLE_CODES:
+        return True
+    if getattr(error, "status", None) in RETRYABLE_STATUSES:
+        return True
+    return any(status in str(error) for status in ("RESOURCE_EXHAUSTED", "UNAVAILABLE"))
+
+
+def retry_hint(error: Exception) -> Optional[float]:
+    """Server-suggested delay: RetryInfo.retryDelay in the error details, or Retry-After."""
+    details = getattr(error, "details", None)
+    if details:
+        match = _RETRY_DELAY.search(details if isinstance(details, str) else json.dumps(details, default=str))
+        if match:
+            return float(match.group(1))
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return None
+
+
+def backoff_delay(error: Exception, attempt: int) -> float:
+    hint = retry_hint(error)
+    if hint is not None:
+        # Small jitter so callers told the same delay don't retry in lockstep
+        return hint + random.uniform(0, 1)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies = deque(maxlen=500)
+        self.first_chunk_latencies = deque(maxlen=500)
+
+    def record(self, seconds: Optional[float], usage=None):
+        self.calls += 1
+        if seconds is not None:
+            self.latencies.append(seconds)
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_token_count", None) or 0
+            self.output_tokens += getattr(usage, "candidates_token_count", None) or 0
+
+    def percentile(self, pct: float, values=None) -> float:
+        ordered = sorted(self.latencies if values is None else values)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < 20:
+            return max(HEDGE_MIN_DELAY, 10.0)
+        return max(HEDGE_MIN_DELAY, self.percentile(95))
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "first_chunk_p50_ms": round(self.percentile(50, self.first_chunk_latencies) * 1000, 1),
+        }
+
+
+class ModelGateway:
+    def __init__(self, client=None, max_concurrency: int = MAX_CONCURRENCY,
+                 requests_per_minute: float = REQUESTS_PER_MINUTE, max_retries: int = MAX_RETRIES,
+                 timeout: float = CALL_TIMEOUT):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_minute)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stats: Dict[str, OperationStats] = {}
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def stats_for(self, operation: str) -> OperationStats:
+        if operation not in self._stats:
+            self._stats[operation] = OperationStats()
+        return self._stats[operation]
+
+    @asynccontextmanager
+    async def slot(self, limited: bool = True):
+        """Holds a rate-limit token and a concurrency slot for one model request."""
+        if limited:
+            await self.bucket.acquire()
+        async with self.semaphore:
+            yield
+
+    async def _call(self, start: Callable[[], Awaitable], limited: bool = True):
+        async with self.slot(limited):
+            try:
+                return await asyncio.wait_for(start(), timeout=self.timeout)
+            except asyncio.TimeoutError as e:
+                raise ModelTimeout(f"model call exceeded {self.timeout:.0f}s") from e
+
+    async def _hedged_call(self, start: Callable[[], Awaitable], stats: OperationStats):
+        """Returns ``(response, primary_won)``.
+
+        When the hedge wins, the primary's real latency is unknown (it is
+        cancelled), and the winner's would drag down the p95 that
+        ``hedge_delay`` is based on, so the caller skips the sample.
+        """
+        primary = asyncio.ensure_future(self._call(start))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=stats.hedge_delay())
+            # Only hedge when the rate limiter has a spare token right now
+            if not done and self.bucket.try_acquire():
+                stats.hedges += 1
+                tasks.add(asyncio.ensure_future(self._call(start, limited=False)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            stats.hedge_wins += 1
+                        return task.result(), task is primary
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not primary.done():
+                primary.cancel()
+
+    async def _run(self, start: Callable[[], Awaitable], operation: str, hedge: bool = False):
+        """Calls ``start()`` under the limits, retrying retryable failures."""
+        if self.client is None:
+            raise RuntimeError("GenAI client not initialized")
+        stats = self.stats_for(operation)
+        attempt = 0
+        with tracing.span(f"model.{operation}", stage="model") as call_span:
+            while True:
+                started = time.perf_counter()
+                try:
+                    if hedge:
+                        response, primary_won = await self._hedged_call(start, stats)
+                    else:
+                        response, primary_won = await self._call(start), True
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        stats.errors += 1
+                        raise
+                    attempt += 1
+                    stats.retries += 1
+                    call_span.set("retries", attempt)
+                    delay = backoff_delay(e, attempt)
+                    print(f"Warning: {operation} model call failed ({e}), retry {attempt} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                elapsed = time.perf_counter() - started if primary_won else None
+                stats.record(elapsed, getattr(response, "usage_metadata", None))
+                return response
+
+    async def generate(self, contents, *, model: str = DEFAULT_MODEL, config=None,
+                       operation: str = "generate", hedge: bool = False):
+        """``client.aio.models.generate_content`` with limits, retries, hedging and metrics."""
+        return await self._run(
+            lambda: self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+            operation, hedge=hedge,
+        )
+
+    async def embed(self, texts: List[str], *, model: str = EMBEDDING_MODEL, config=None,
+                    operation: str = "embed") -> List[List[float]]:
+        """Embeds ``texts`` in one ``embed_content`` call; returns one vector per text."""
+        response = await self._run(
+            lambda: self.client.aio.models.embed_content(model=model, contents=texts, config=config),
+            operation,
+        )
+        return [embedding.values for embedding in response.embeddings]
+
+    async def stream(self, start: Callable, *, operation: str = "stream",
+                     usage: Callable = lambda chunk: getattr(chunk, "usage_metadata", None)) -> AsyncIterator:
+        """Runs a streaming call under the gateway's limits.
+
+        ``start()`` returns an async iterator (or an awaitable of one). A
+        failure before the first chunk is retried like ``generate``; once
+        chunks have been handed to the caller the error is raised as-is.
+        """
+        stats = self.stats_for(operation)
+        # Not made current: the caller's code runs between our yields
+        stream_span = tracing.start_span(f"model.{operation}", stage="model", streaming=True)
+        chunks = self._stream(start, usage, stats, stream_span)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            stream_span.end(e)
+            raise
+        finally:
+            # Release the slot now if the caller stopped reading early
+            await chunks.aclose()
+            stream_span.end()
+
+    async def _stream(self, start: Callable, usage: Callable, stats: OperationStats, stream_span) -> AsyncIterator:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            yielded = False
+            last_usage = None
+            async with self.slot():
+                try:
+                    iterator = start()
+                    if inspect.isawaitable(iterator):
+                        iterator = await iterator
+                    async for chunk in iterator:
+                        if not yielded:
+                            stats.first_chunk_latencies.append(time.perf_counter() - started)
+                            stream_span.set("first_chunk_ms", round((time.perf_counter() - started) * 1000, 1))
+                            yielded = True
+                        last_usage = usage(chunk) or last_usage
+                        yield chunk
+                    error = None
+                except Exception as e:
+                    if yielded or attempt >= self.max_retries or not is_retryable(e):
+                        stats.errors += 1
+                        raise
+                    error = e
+            if error is None:
+                stats.record(time.perf_counter() - started, last_usage)
+                return
+            attempt += 1
+            stats.retries += 1
+            stream_span.set("retries", attempt)
+            await asyncio.sleep(backoff_delay(error, attempt))
+
+    def generate_stream(self, contents, *, model: str = DEFAULT_MODEL, config=None,
+                        operation: str = "generate_stream") -> AsyncIterator:
+        if self.client is None:
+            raise RuntimeError("GenAI client not initialized")
+        return self.stream(
+            lambda: self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config),
+            operation=operation,
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.bucket.rate * 60,
+            "operations": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
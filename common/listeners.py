@@ -0,0 +1,45 @@
+"""Extra uvicorn listeners that run inside an already-running server.
+
+The process's main uvicorn server owns signal handling and the worker
+lifecycle; an embedded listener only accepts connections for an app (on a
+Unix socket or another port) on the same event loop, so everything it
+serves shares the process's in-memory state.
+"""
+import asyncio
+import contextlib
+
+import uvicorn
+
+
+class EmbeddedServer(uvicorn.Server):
+    @contextlib.contextmanager
+    def capture_signals(self):
+        # The host server handles SIGINT/SIGTERM and stops us on shutdown
+        yield
+
+
+async def start_listener(app, **config) -> EmbeddedServer:
+    """Starts serving ``app`` with the given ``uvicorn.Config`` options and
+    returns once it accepts connections. Raises RuntimeError if it can't
+    bind."""
+    config.setdefault("log_level", "warning")
+    server = EmbeddedServer(uvicorn.Config(app, **config))
+
+    async def serve():
+        try:
+            await server.serve()
+        except SystemExit:
+            # uvicorn exits the process on startup failures; keep the host alive
+            pass
+
+    server.task = asyncio.create_task(serve())
+    while not server.started:
+        if server.task.done():
+            raise RuntimeError(f"Listener failed to start: {config}")
+        await asyncio.sleep(0.01)
+    return server
+
+
+async def stop_listener(server: EmbeddedServer):
+    server.should_exit = True
+    await server.task
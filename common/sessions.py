@@ -0,0 +1,134 @@
+"""Signed session tokens, verified locally.
+
+Tokens are HS256 JWTs signed with SESSION_SECRET, so checking one is a few
+microseconds of HMAC with no database round-trip. Revocation is handled
+with a per-user ``tokens_valid_after`` timestamp (set by logout) that is
+read at most once per USER_META_TTL seconds per user and kept in a small
+TTL cache. Tokens revoked on this worker take effect immediately.
+
+The Shared Backend issues and fully verifies tokens; the Assistant shares
+SESSION_SECRET and checks signature and expiry with ``decode_token``, leaving
+revocation to the Shared Backend when tools forward the token.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "")
+if not SESSION_SECRET:
+    print("Warning: SESSION_SECRET not set, using a random key. Sessions will not survive restarts or verify in other workers and services.")
+    SESSION_SECRET = secrets.token_urlsafe(32)
+
+SESSION_TTL = int(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+USER_META_TTL = float(os.environ.get("SESSION_USER_META_TTL", "60"))
+
+_HEADER = base64.urlsafe_b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode()).rstrip(b"=")
+
+
+class TTLCache:
+    """Small thread-safe LRU whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, ttl: float, max_items: int = 10000):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return entry[1]
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._items[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+# jti -> True, kept until the token would have expired anyway
+revoked_tokens = TTLCache(ttl=SESSION_TTL)
+# uid -> {"tokens_valid_after": float}
+user_meta = TTLCache(ttl=USER_META_TTL)
+
+
+def _b64(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(signing_input: bytes) -> bytes:
+    return _b64(hmac.new(SESSION_SECRET.encode(), signing_input, hashlib.sha256).digest())
+
+
+def issue_token(uid: str, email: str) -> str:
+    now = time.time()
+    payload = {"sub": uid, "email": email, "iat": now, "exp": int(now) + SESSION_TTL, "jti": uuid.uuid4().hex}
+    signing_input = _HEADER + b"." + _b64(json.dumps(payload, separators=(",", ":")).encode())
+    return (signing_input + b"." + _sign(signing_input)).decode()
+
+
+def decode_token(token: str) -> Optional[dict]:
+    """Returns the claims of a correctly signed, unexpired token, else None."""
+    try:
+        header, payload, signature = token.split(".")
+    except ValueError:
+        return None
+    expected = _sign(f"{header}.{payload}".encode())
+    if not hmac.compare_digest(expected, signature.encode()):
+        return None
+    try:
+        claims = json.loads(_unb64(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+async def verify_token(token: str, load_user_meta: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+    """Full check: signature, expiry, local revocations and the user's
+    ``tokens_valid_after`` (loaded through ``load_user_meta`` on a cache miss)."""
+    claims = decode_token(token)
+    if claims is None or revoked_tokens.get(claims.get("jti", "")):
+        return None
+    meta = user_meta.get(claims["sub"])
+    if meta is None:
+        meta = await load_user_meta(claims["sub"]) or {}
+        user_meta.set(claims["sub"], meta)
+    if claims.get("iat", 0) < meta.get("tokens_valid_after", 0):
+        return None
+    return claims
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return None
+
+
+def revoke(claims: dict, valid_after: float):
+    revoked_tokens.set(claims["jti"], True, ttl=max(0, claims["exp"] - time.time()))
+    user_meta.set(claims["sub"], {"tokens_valid_after": valid_after})
@@ -0,0 +1,59 @@
+"""Incremental parsing and event framing for the streaming endpoints.
+
+Gemini streams the task list as a JSON array in arbitrary text chunks.
+``JsonArrayStream`` returns each top-level object the moment its closing
+brace arrives, so the first task can be sent before the array is complete.
+``ndjson_event``/``sse_event`` frame one event (a task, or a chat progress
+item in the Assistant) as an NDJSON line or a Server-Sent Event.
+"""
+import json
+from typing import List
+
+
+class JsonArrayStream:
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> List[dict]:
+        """Consumes a chunk and returns the objects it completed."""
+        completed = []
+        for ch in text:
+            if self._depth == 0:
+                # Outside an element: skip "[", ",", whitespace and markdown fences
+                if ch == "{":
+                    self._buffer = ["{"]
+                    self._depth = 1
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        completed.append(json.loads("".join(self._buffer)))
+                    except json.JSONDecodeError:
+                        print("Warning: Skipping malformed streamed task")
+                    self._buffer = []
+        return completed
+
+
+def ndjson_event(data: dict, event: str = "task") -> str:
+    return json.dumps(data) + "\n"
+
+
+def sse_event(data: dict, event: str = "task") -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import json
+import time
+import uuid
+
+from common import sessions
+
+
+def verify(token, meta=None):
+    async def load_user_meta(uid):
+        return meta
+    return asyncio.run(sessions.verify_token(token, load_user_meta))
+
+
+def new_uid():
+    return f"user-{uuid.uuid4().hex}"
+
+
+def test_valid_token():
+    uid = new_uid()
+    token = sessions.issue_token(uid, "a@example.com")
+    claims = verify(token)
+    assert claims["sub"] == uid
+    assert claims["email"] == "a@example.com"
+    assert sessions.bearer_token(f"Bearer {token}") == token
+
+
+def test_expired_token(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_TTL", -1)
+    token = sessions.issue_token(new_uid(), "a@example.com")
+    assert sessions.decode_token(token) is None
+    assert verify(token) is None
+
+
+def test_forged_payload():
+    header, payload, signature = sessions.issue_token(new_uid(), "a@example.com").split(".")
+    claims = json.loads(sessions._unb64(payload))
+    claims["sub"] = "someone-else"
+    forged = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=").decode()
+    assert verify(f"{header}.{forged}.{signature}") is None
+
+
+def test_token_signed_with_another_secret(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_SECRET", "attacker-secret")
+    token = sessions.issue_token(new_uid(), "a@example.com")
+    monkeypatch.undo()
+    assert verify(token) is None
+
+
+def test_unsigned_and_malformed_tokens():
+    header, payload, _ = sessions.issue_token(new_uid(), "a@example.com").split(".")
+    none_header = base64.urlsafe_b64encode(b'{"alg":"none","typ":"JWT"}').rstrip(b"=").decode()
+    assert verify(f"{none_header}.{payload}.") is None
+    assert verify(f"{header}.{payload}") is None
+    assert verify("not-a-token") is None
+    assert verify("") is None
+
+
+def test_revoked_token():
+    uid = new_uid()
+    token = sessions.issue_token(uid, "a@example.com")
+    other = sessions.issue_token(uid, "a@example.com")
+    claims = verify(token)
+    sessions.revoke(claims, time.time())
+    assert verify(token) is None
+    # Logout ends every session issued before it
+    assert verify(other) is None
+    time.sleep(0.01)
+    assert verify(sessions.issue_token(uid, "a@example.com"))["sub"] == uid
+
+
+def test_revoked_on_another_worker():
+    uid = new_uid()
+    token = sessions.issue_token(uid, "a@example.com")
+    assert verify(token, {"tokens_valid_after": time.time() + 1}) is None
+
+
+def test_deleted_user():
+    token = sessions.issue_token(new_uid(), "a@example.com")
+    assert verify(token, {"tokens_valid_after": float("inf")}) is None
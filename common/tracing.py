@@ -0,0 +1,384 @@
+"""Request tracing and latency metrics, with no external dependencies.
+
+* ``TracingMiddleware`` opens a root span per HTTP request. If the caller
+  sent a W3C ``traceparent`` header the request joins the caller's trace.
+  The trace ID is returned in ``X-Trace-Id``.
+* ``span(name, stage)`` times a block of code as a child of the current
+  span. ``inject`` adds ``traceparent`` to outgoing headers so the next
+  service joins the trace.
+* Requests are observed into the ``http_request_duration_seconds``
+  histogram and spans into ``stage_duration_seconds``. Both are rendered
+  in Prometheus text format by ``metrics_response()`` for ``/metrics``.
+* Finished spans are exported in batches by a background thread
+  (TRACE_EXPORT). ``file`` (the default) appends one OTLP-style JSON
+  object per span to TRACE_EXPORT_PATH. ``otlp`` POSTs OTLP/HTTP JSON to
+  TRACE_OTLP_ENDPOINT, e.g. a local collector. ``off`` exports nothing.
+  Only the TRACE_SAMPLE_RATE share of traces is exported; metrics
+  always see every span.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+EXPORT = os.environ.get("TRACE_EXPORT", "file").lower()
+EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "traces.jsonl")
+EXPORT_MAX_BYTES = int(os.environ.get("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+# Service of spans started outside any request (background jobs, flushes);
+# defaults to the service of the first TracingMiddleware
+_default_service = os.environ.get("TRACE_SERVICE_NAME")
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL = 1.0
+EXPORT_QUEUE_SIZE = 10000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# ==========================================
+# METRICS
+# ==========================================
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(items):
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.",
+    ("service", "method", "route", "status"),
+)
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Latency of instrumented stages (scrape, model, store, tool, ...).",
+    ("service", "stage", "name", "outcome"),
+)
+
+
+def render_metrics() -> str:
+    lines = REQUEST_LATENCY.render() + STAGE_LATENCY.render()
+    lines.append("# HELP trace_spans_dropped_total Spans not exported because the export queue was full.")
+    lines.append("# TYPE trace_spans_dropped_total counter")
+    lines.append(f"trace_spans_dropped_total {exporter.dropped}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_response():
+    from starlette.responses import Response
+
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ==========================================
+# SPANS
+# ==========================================
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "stage", "service", "sampled",
+                 "attributes", "start_ns", "end_ns", "error", "_started")
+
+    def __init__(self, name: str, stage: Optional[str], trace_id: str, parent_id: Optional[str],
+                 service: str, sampled: bool, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.stage = stage
+        self.service = service
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.stage:
+            STAGE_LATENCY.observe(
+                (self.service, self.stage, self.name, "error" if self.error else "ok"),
+                time.perf_counter() - self._started,
+            )
+        if self.sampled:
+            exporter.submit(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, stage: Optional[str] = None, parent: Optional[Span] = None,
+               service: Optional[str] = None, **attributes) -> Span:
+    """Creates a span (child of ``parent``, default the current span)
+    without making it current; the caller must ``end()`` it."""
+    if parent is None:
+        parent = _current.get()
+    if parent is None:
+        return Span(name, stage, os.urandom(16).hex(), None, service or _default_service or "unknown",
+                    random.random() < SAMPLE_RATE, attributes)
+    return Span(name, stage, parent.trace_id, parent.span_id, service or parent.service,
+                parent.sampled, attributes)
+
+
+@contextmanager
+def span(name: str, stage: Optional[str] = None, parent: Optional[Span] = None, **attributes):
+    """Times the block as a span that is current inside it."""
+    current = start_span(name, stage, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Returns (trace_id, parent_span_id, sampled) from a W3C traceparent."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def inject(headers: dict) -> dict:
+    """Adds the current span's ``traceparent`` to outgoing request headers."""
+    current = _current.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+    return headers
+
+
+class TracingMiddleware:
+    """ASGI middleware: one root span and one latency observation per request."""
+
+    def __init__(self, app, service: str):
+        global _default_service
+        self.app = app
+        self.service = service
+        if _default_service is None:
+            _default_service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        incoming = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+            request_span = Span(method, None, trace_id, parent_id, self.service, sampled, {})
+        else:
+            request_span = start_span(method, parent=None, service=self.service)
+        request_span.set("http.method", method)
+        request_span.set("http.target", scope["path"])
+        token = _current.set(request_span)
+        status = 500
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", request_span.trace_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            # The route template (not the raw path) keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_span.name = f"{method} {route}"
+            request_span.set("http.route", route)
+            request_span.set("http.status_code", status)
+            if status >= 500:
+                request_span.error = f"HTTP {status}"
+            _current.reset(token)
+            request_span.end()
+            REQUEST_LATENCY.observe(
+                (self.service, method, route, str(status)),
+                (request_span.end_ns - request_span.start_ns) / 1e9,
+            )
+
+
+# ==========================================
+# EXPORT
+# ==========================================
+
+def span_record(finished: Span) -> dict:
+    record = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "parentSpanId": finished.parent_id or "",
+        "name": finished.name,
+        "service": finished.service,
+        "startTimeUnixNano": finished.start_ns,
+        "endTimeUnixNano": finished.end_ns,
+        "durationMs": round((finished.end_ns - finished.start_ns) / 1e6, 3),
+        "status": {"code": "ERROR", "message": finished.error} if finished.error else {"code": "OK"},
+        "attributes": dict(finished.attributes),
+    }
+    if finished.stage:
+        record["attributes"]["stage"] = finished.stage
+    return record
+
+
+def otlp_payload(records: List[dict]) -> dict:
+    by_service: Dict[str, list] = {}
+    for record in records:
+        by_service.setdefault(record["service"], []).append({
+            "traceId": record["traceId"],
+            "spanId": record["spanId"],
+            "parentSpanId": record["parentSpanId"],
+            "name": record["name"],
+            "startTimeUnixNano": str(record["startTimeUnixNano"]),
+            "endTimeUnixNano": str(record["endTimeUnixNano"]),
+            "status": {"code": 2, "message": record["status"]["message"]} if record["status"]["code"] == "ERROR" else {"code": 1},
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}} for key, value in record["attributes"].items()
+            ],
+        })
+    return {"resourceSpans": [
+        {
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+            "scopeSpans": [{"scope": {"name": "vibe.tracing"}, "spans": spans}],
+        }
+        for service, spans in by_service.items()
+    ]}
+
+
+class SpanExporter:
+    """Batches finished spans on a daemon thread so request paths never
+    wait on disk or network I/O. Spans are dropped (and counted) when the
+    queue is full."""
+
+    def __init__(self, mode: str = EXPORT, path: str = EXPORT_PATH, endpoint: str = OTLP_ENDPOINT):
+        self.mode = mode
+        self.path = path
+        self.endpoint = endpoint
+        self.dropped = 0
+        self.exported = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, finished: Span):
+        if self.mode not in ("file", "otlp"):
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.export([span_record(finished) for finished in batch])
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"Warning: Span export failed: {e}")
+
+    def export(self, records: List[dict]):
+        if self.mode == "otlp":
+            request = urllib.request.Request(
+                self.endpoint, data=json.dumps(otlp_payload(records)).encode("utf-8"),
+                headers={"Content-Type": "application/json"}, method="POST",
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+            return
+        if os.path.exists(self.path) and os.path.getsize(self.path) > EXPORT_MAX_BYTES:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+exporter = SpanExporter()
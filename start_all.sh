@@ -18,6 +18,8 @@ setup_backend() {
     local service_name=$1
     local dir=$2
     local port=$3
+    local extra_requirements=$4
+    local server=${5:-uvicorn}
     
     echo "--------------------------------------------------"
     echo "Setting up $service_name ($dir)..."
@@ -43,10 +45,18 @@ setup_backend() {
         echo "Installing requirements..."
         pip install -r requirements.txt > /dev/null 2>&1
     fi
+    if [ -n "$extra_requirements" ]; then
+        pip install -r "$extra_requirements" > /dev/null 2>&1
+    fi
 
     # Start service
     echo "Starting $service_name on port $port..."
-    nohup uvicorn main:app --host 0.0.0.0 --port "$port" > "../../${service_name// /_}.log" 2>&1 &
+    if [ "$server" = "gunicorn" ]; then
+        # One uvicorn worker per core (WEB_CONCURRENCY to override), see gunicorn.conf.py
+        PORT="$port" nohup gunicorn main:app -c gunicorn.conf.py > "../../${service_name// /_}.log" 2>&1 &
+    else
+        nohup uvicorn main:app --host 0.0.0.0 --port "$port" > "../../${service_name// /_}.log" 2>&1 &
+    fi
     echo "$service_name PID: $!"
     
     cd - > /dev/null || exit
@@ -117,9 +127,36 @@ for port in 8001 8002 5173 5174 5175 5176; do
     kill_port "$port"
 done
 
+# Modules the backends share (gateway, tracing, ...) live in common/ at the
+# repository root
+export PYTHONPATH="$PWD${PYTHONPATH:+:$PYTHONPATH}"
+
+# Shared secret for session tokens: the Shared Backend signs them and the
+# Assistant Backend verifies them locally.
+if [ -z "$SESSION_SECRET" ]; then
+    export SESSION_SECRET=$(python3 -c 'import secrets; print(secrets.token_urlsafe(32))')
+fi
+
+# How the Assistant's tools reach the Shared Backend:
+#   auto (default) - over the Shared Backend's Unix socket, HTTP if it's missing
+#   inprocess      - the Assistant Backend loads the Shared Backend and calls
+#                    its task/link functions directly; it also serves it on 8001
+export ASSISTANT_BACKEND_TRANSPORT=${ASSISTANT_BACKEND_TRANSPORT:-auto}
+export SHARED_BACKEND_SOCKET=${SHARED_BACKEND_SOCKET:-/tmp/vibe_shared_backend.sock}
+
+# How the Shared Backend is served:
+#   uvicorn (default) - a single process
+#   gunicorn          - production mode, uvicorn workers sized to the CPU count
+SHARED_BACKEND_SERVER=${SHARED_BACKEND_SERVER:-uvicorn}
+
 # Setup Backends
-setup_backend "Shared Backend" "2-Stash/backend" 8001
-setup_backend "Assistant Backend" "4-PersonalAssistant/backend" 8002
+if [ "$ASSISTANT_BACKEND_TRANSPORT" = "inprocess" ]; then
+    export STASH_BACKEND_DIR="$PWD/2-Stash/backend"
+    setup_backend "Assistant Backend" "4-PersonalAssistant/backend" 8002 "$STASH_BACKEND_DIR/requirements.txt"
+else
+    STASH_UDS_PATH="$SHARED_BACKEND_SOCKET" setup_backend "Shared Backend" "2-Stash/backend" 8001 "" "$SHARED_BACKEND_SERVER"
+    setup_backend "Assistant Backend" "4-PersonalAssistant/backend" 8002
+fi
 
 # Setup Frontends
 setup_frontend "Checkmate Frontend" "1-Checkmate" 5173